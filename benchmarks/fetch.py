@@ -0,0 +1,77 @@
+"""
+Load-test the fetch path against the local FMP stand-in server: throughput of
+company_financials.get_financial_data at several worker counts under simulated network latency,
+and behaviour when the server rate limits the client.
+
+Usage: python -m benchmarks.fetch [tickers] [latency in seconds]
+"""
+from fundamental import api_client
+from fundamental import company_financials as financials
+from fundamental.fmp_server import FMPServer
+
+import contextlib
+import io
+import sys
+import time
+
+
+def fetch_financials(server, tickers, max_workers, requests_per_minute):
+    """
+    Retrieve the three financial statements of every ticker and return the elapsed time.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        data = financials.get_financial_data(tickers, 'financials', 'annual', 'demo',
+                                             max_workers, requests_per_minute)
+        elapsed = time.perf_counter() - start
+
+    assert data['symbol'].nunique() == len(tickers)
+
+    return elapsed
+
+
+if __name__ == '__main__':
+
+    n_tickers = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+
+    unlimited = 10 ** 9
+
+    with FMPServer(n_tickers, latency=latency) as server:
+        api_client.BASE_URL = server.base_url
+        tickers = server._endpoint_data('annual')[0]['stock/list']
+
+        print('{} tickers x 3 statements, {:.0f} ms latency'.format(n_tickers, latency * 1000))
+
+        for max_workers in [1, 4, 8, 16, 32]:
+            requests = server.requests
+            elapsed = fetch_financials(server, tickers, max_workers, unlimited)
+            print('  {:>2} workers: {:7.2f}s  {:8.1f} requests/s'.format(
+                max_workers, elapsed, (server.requests - requests) / elapsed))
+
+    # The server allows half the client's configured rate, so the client has to back off
+    api_client.RETRY_BACKOFF = 0.1
+    server_limit = 600
+
+    with FMPServer(n_tickers // 4, latency=latency, requests_per_minute=server_limit) as server:
+        api_client.BASE_URL = server.base_url
+        tickers = server._endpoint_data('annual')[0]['stock/list']
+
+        elapsed = fetch_financials(server, tickers, 16, server_limit * 2)
+        print('Rate limited to {} requests/min: {} requests in {:.2f}s, {} answered with 429'
+              .format(server_limit, server.requests, elapsed, server.rate_limited))
+
+    # The bucket is shared by every later fetch, once the server stops rejecting requests it
+    # has to recover the configured rate instead of staying throttled
+    bucket = api_client.shared_bucket('demo', server_limit * 2)
+    slowed_rate = bucket.rate
+
+    with FMPServer(n_tickers // 4, latency=latency) as server:
+        api_client.BASE_URL = server.base_url
+        tickers = server._endpoint_data('annual')[0]['stock/list']
+
+        elapsed = fetch_financials(server, tickers, 16, server_limit * 2)
+        print('Recovered from {:.0f} to {:.0f} requests/min in {:.2f}s'
+              .format(slowed_rate * 60, bucket.rate * 60, elapsed))
+
+    assert bucket.rate == bucket.max_rate
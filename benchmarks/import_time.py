@@ -0,0 +1,62 @@
+"""
+Check that a cold import of fundamental.main stays within its startup time budget. Each sample
+runs in a fresh interpreter, so nothing is shared with previous imports except the OS file cache.
+Exits with status 1 when the budget is exceeded, or when a module that should load lazily (the
+plotnine / matplotlib plotting stack) is imported at startup.
+
+Usage: python -m benchmarks.import_time [module] [budget in seconds]
+"""
+import subprocess
+import sys
+
+# Cold import of fundamental.main measured ~0.4s with the plotting stack deferred, while
+# company_fundamentals alone took ~0.5s when it imported plotnine at load time
+IMPORT_BUDGET = 0.8
+
+LAZY_MODULES = ['plotnine', 'matplotlib']
+
+PROBE = '''
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+loaded = [x for x in {lazy_modules!r} if x in sys.modules]
+print(elapsed, ','.join(loaded))
+'''
+
+
+def measure_import(module, repeat=5):
+    """
+    Return the best cold import time of a module and the lazy modules it loaded.
+    """
+    timings = []
+    loaded = []
+
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', PROBE.format(module=module,
+                                                                    lazy_modules=LAZY_MODULES)],
+                                check=True, capture_output=True, text=True).stdout.split()
+        timings.append(float(output[0]))
+        loaded = output[1].split(',') if len(output) > 1 else []
+
+    return min(timings), loaded
+
+
+if __name__ == '__main__':
+
+    module = sys.argv[1] if len(sys.argv) > 1 else 'fundamental.main'
+    budget = float(sys.argv[2]) if len(sys.argv) > 2 else IMPORT_BUDGET
+
+    import_time, loaded = measure_import(module)
+
+    print('import {}: {:6.3f}s  (budget {:6.3f}s)'.format(module, import_time, budget))
+
+    if loaded:
+        print('FAIL: ' + ', '.join(loaded) + ' imported at startup')
+        sys.exit(1)
+
+    if import_time > budget:
+        print('FAIL: import time over budget')
+        sys.exit(1)
+
+    print('OK')
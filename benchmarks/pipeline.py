@@ -0,0 +1,183 @@
+"""
+Time the screening and valuation pipeline on synthetic data at several scales, and record wall
+time and peak traced memory of each stage in a JSON baseline. With --compare, the run is
+checked against a stored baseline instead and exits with status 1 when a stage regressed.
+
+Usage: python -m benchmarks.pipeline [--scales 1000,10000,50000] [--file-format csv]
+       [--data-dir benchmarks/data/] [--baseline benchmarks/baseline.json] [--compare]
+"""
+from fundamental import company_financials as financials
+from fundamental import company_fundamentals as fundamentals
+from fundamental import synthetic_data
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import warnings
+import numpy as np
+import pandas as pd
+
+REPORT_YEAR = 2019
+EVAL_PERIOD = 10
+YEAR_PATTERN = str(EVAL_PERIOD) + 'Y'
+
+SCREENING_CRITERIA = {'debtToEquity': [0, 0.5],
+                      'currentRatio': [1.5, 10.0],
+                      'roe': [0.10, 0.50],
+                      '10Y roe median': [0.08, 0.25],
+                      'interestCoverage': [15, 5000]}
+
+# A stage regressed when its time or peak memory grew by more than this fraction, and by more
+# than the run to run noise of very short stages
+TOLERANCE = 0.25
+NOISE_FLOOR = {'seconds': 0.05, 'peak_mb': 1.0}
+
+
+def measure(func, *args, repeat=5):
+    """
+    Return the result of func(*args), its best wall time and its peak traced memory.
+    """
+    timings = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return result, min(timings), peak
+
+
+def dcf_chain(df, projection_window=10):
+    """
+    Value every ticker in the DataFrame the way main.calculate_intrinsic_value does.
+    """
+    tickers = df['symbol'].unique()
+    valuation_data = fundamentals.prepare_valuation_inputs(df, REPORT_YEAR, EVAL_PERIOD, *tickers)
+    valuation_data = fundamentals.calculate_discount_rate(valuation_data)
+    valuation_data = fundamentals.calculate_discounted_free_cash_flow(
+        valuation_data, projection_window, **dict.fromkeys(tickers, 0.05))
+    valuation_data = fundamentals.calculate_terminal_value(valuation_data)
+    valuation_data = fundamentals.calculate_intrinsic_value(valuation_data)
+
+    return fundamentals.calculate_margin_of_safety(valuation_data)
+
+
+def run_scale(n_tickers, data_dir, file_format, repeat):
+    """
+    Benchmark every pipeline stage on N synthetic tickers, generating the data files on the
+    first run at this scale.
+    """
+    directory = os.path.join(data_dir, str(n_tickers) + '-' + file_format) + os.sep
+
+    if not os.path.isdir(directory):
+        synthetic_data.write_dataset(directory, n_tickers, EVAL_PERIOD, REPORT_YEAR, file_format)
+
+    endpoint_data = synthetic_data.generate_endpoint_data(n_tickers, EVAL_PERIOD + 1, REPORT_YEAR)
+    raw_financials = synthetic_data.request_data(endpoint_data, 'financials')
+    del endpoint_data
+
+    results = {}
+
+    def stage(name, func, *args):
+        result, seconds, peak = measure(func, *args, repeat=repeat)
+        results[name] = {'seconds': round(seconds, 4), 'peak_mb': round(peak / 1e6, 2)}
+        print('  {:<24}{:9.3f}s  peak {:9.1f} MB'.format(name, seconds, peak / 1e6),
+              file=sys.__stdout__)
+        return result
+
+    clean_financials = stage('clean_financial_data', financials.clean_financial_data,
+                             raw_financials)
+    stage('select_analysis_years', financials.select_analysis_years, clean_financials,
+          REPORT_YEAR, EVAL_PERIOD)
+    del raw_financials, clean_financials
+
+    financial_data = stage('combine_data', fundamentals.combine_data, directory, YEAR_PATTERN,
+                           file_format)
+    financial_data = financials.select_analysis_years(financial_data, REPORT_YEAR, EVAL_PERIOD)
+
+    stats = stage('calculate_stats', fundamentals.calculate_stats, financial_data, 'median',
+                  REPORT_YEAR, EVAL_PERIOD, 'roe', 'currentRatio')
+
+    ttm_data = financial_data[financial_data['year'] == REPORT_YEAR]
+    ttm_data = ttm_data.merge(stats, on=['symbol', 'year'], how='inner')
+    stage('screen_stocks', lambda df: fundamentals.screen_stocks(df, **SCREENING_CRITERIA),
+          ttm_data)
+
+    stage('dcf_chain', dcf_chain, financial_data)
+
+    return results
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """
+    Return the stages whose time or peak memory grew by more than the tolerance.
+    """
+    regressions = []
+
+    for scale, stages in results.items():
+        for name, measured in stages.items():
+            expected = baseline.get('results', {}).get(scale, {}).get(name)
+            if expected is None:
+                continue
+            for metric in ['seconds', 'peak_mb']:
+                growth = measured[metric] - expected[metric]
+                if growth > max(expected[metric] * tolerance, NOISE_FLOOR[metric]):
+                    regressions.append('{} tickers {}: {} {} -> {}'.format(
+                        scale, name, metric, expected[metric], measured[metric]))
+
+    return regressions
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline on synthetic data')
+    parser.add_argument('--scales', default='1000,10000,50000')
+    parser.add_argument('--file-format', default='csv', choices=['csv', 'parquet', 'feather'])
+    parser.add_argument('--data-dir', default=os.path.join('benchmarks', 'data'))
+    parser.add_argument('--baseline', default=os.path.join('benchmarks', 'baseline.json'))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--compare', action='store_true')
+    options = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+
+    results = {}
+
+    for n_tickers in [int(x) for x in options.scales.split(',')]:
+        print(str(n_tickers) + ' tickers, ' + options.file_format)
+        # The pipeline reports progress on stdout, keep the benchmark output readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            results[str(n_tickers)] = run_scale(n_tickers, options.data_dir, options.file_format,
+                                                options.repeat)
+
+    if options.compare:
+        with open(options.baseline) as file:
+            regressions = compare(results, json.load(file))
+
+        for regression in regressions:
+            print('REGRESSION: ' + regression)
+
+        sys.exit(1 if regressions else 0)
+
+    baseline = {'file_format': options.file_format,
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'pandas': pd.__version__,
+                'machine': platform.machine(),
+                'results': results}
+
+    with open(options.baseline, 'w') as file:
+        json.dump(baseline, file, indent=2)
+
+    print('Wrote baseline to ' + options.baseline)
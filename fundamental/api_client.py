@@ -0,0 +1,322 @@
+from concurrent.futures import ThreadPoolExecutor
+from fundamental import ingest
+from fundamental import instrumentation
+from fundamental.instrumentation import instrument
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
+
+import http.client
+import os
+import random
+import threading
+import time
+
+# Point the client at another server (ex: the local stand-in in fmp_server) with FMP_BASE_URL
+BASE_URL = os.environ.get('FMP_BASE_URL', 'https://financialmodelingprep.com/api/v3/')
+
+# FinancialModelingPrep starter plan allowance, adjust to match your subscription
+REQUESTS_PER_MINUTE = 300
+MAX_WORKERS = 8
+
+# Rate limited (429) requests are retried after the server's Retry-After delay, or after an
+# exponential backoff starting at RETRY_BACKOFF seconds when the server doesn't send one
+MAX_RETRIES = 5
+RETRY_BACKOFF = 1.0
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket used to keep request throughput within the API plan's rate limit.
+
+    :param requests_per_minute: Sustained number of requests allowed per minute
+    :param burst: Maximum number of requests that may be issued back to back (defaults to one
+           second's worth of requests)
+    """
+
+    def __init__(self, requests_per_minute, burst=None):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = burst if burst is not None else max(1.0, self.rate)
+        # Rate and burst the bucket recovers to after the server stops rejecting requests
+        self.max_rate = self.rate
+        self.max_capacity = self.capacity
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.slowed = 0.0
+        self.lock = threading.Lock()
+
+    def _take(self):
+        # Consume a token and return 0, or return how long until one is available
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """
+        Block until a token is available, then consume it.
+
+        :return: None
+        """
+        wait = self._take()
+
+        while wait:
+            time.sleep(wait)
+            wait = self._take()
+
+        return None
+
+    def try_acquire(self):
+        """
+        Consume a token if one is available, without blocking.
+
+        :return: True if a token was consumed
+        :rtype: bool
+        """
+        return self._take() == 0
+
+    def slow_down(self, factor=0.5):
+        """
+        Reduce the sustained rate after the server reports its limit was exceeded. Workers that
+        were rejected together only slow the bucket down once.
+
+        :param factor: Multiplier applied to the current rate
+        :return: None
+        """
+        with self.lock:
+            now = time.monotonic()
+            if now - self.slowed < 1.0:
+                return None
+
+            self.slowed = now
+            self.rate = max(1 / 60.0, self.rate * factor)
+            self.capacity = max(1.0, min(self.capacity, self.rate))
+            self.tokens = min(self.tokens, self.capacity)
+
+        return None
+
+    def recover(self, step=0.02):
+        """
+        Raise the sustained rate back toward the configured one after a request succeeded, so a
+        burst of rejections doesn't throttle every later request made through a shared bucket.
+
+        :param step: Fraction of the configured rate added back per successful request
+        :return: None
+        """
+        with self.lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * step)
+                self.capacity = min(self.max_capacity, max(1.0, self.rate))
+
+        return None
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def shared_bucket(api_key, requests_per_minute):
+    """
+    Token bucket shared by every fetch made with the same API key and rate limit, so fetches
+    running at the same time (ex: parallel pipeline steps) stay within the plan's limit together.
+
+    :param api_key: FinancialModelingPrep API key
+    :param requests_per_minute: Sustained number of requests allowed per minute
+    :return: Token bucket
+    :rtype: TokenBucket
+    """
+    with _buckets_lock:
+        key = (api_key, requests_per_minute)
+        if key not in _buckets:
+            _buckets[key] = TokenBucket(requests_per_minute)
+
+        return _buckets[key]
+
+
+class ConnectionPool:
+    """
+    Keep-alive HTTP(S) connections, one per worker thread and host, reused across requests.
+    """
+
+    def __init__(self, timeout=30):
+        self.timeout = timeout
+        self.local = threading.local()
+        self.opened = []
+        self.lock = threading.Lock()
+
+    def _connection(self, scheme, netloc):
+        connections = self.local.__dict__.setdefault('connections', {})
+        key = (scheme, netloc)
+
+        if key not in connections:
+            if scheme == 'https':
+                connections[key] = http.client.HTTPSConnection(netloc, timeout=self.timeout)
+            else:
+                connections[key] = http.client.HTTPConnection(netloc, timeout=self.timeout)
+
+            with self.lock:
+                self.opened.append(connections[key])
+
+        return connections[key]
+
+    def _discard(self, scheme, netloc):
+        connection = self.local.connections.pop((scheme, netloc), None)
+        if connection is not None:
+            connection.close()
+
+    def get(self, url):
+        """
+        Issue a GET request over a pooled connection and return the raw response body.
+
+        :param url: Fully qualified URL to request
+        :return: Response body
+        :rtype: bytes
+        """
+        parts = urlsplit(url)
+        path = parts.path + ('?' + parts.query if parts.query else '')
+
+        # A kept-alive connection may have been closed by the server, retry once on a fresh one
+        for attempt in range(2):
+            connection = self._connection(parts.scheme, parts.netloc)
+            try:
+                connection.request('GET', path, headers={'Connection': 'keep-alive'})
+                response = connection.getresponse()
+                body = response.read()
+            except (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                    ConnectionError):
+                self._discard(parts.scheme, parts.netloc)
+                if attempt == 1:
+                    raise
+                continue
+
+            if response.status != 200:
+                raise HTTPError(url, response.status, response.reason, response.headers, None)
+
+            return body
+
+    def close(self):
+        """
+        Close every connection opened by the pool.
+
+        :return: None
+        """
+        with self.lock:
+            for connection in self.opened:
+                connection.close()
+            self.opened = []
+
+
+def build_url(endpoint, api_key, ticker=None, period=None, base_url=None):
+    """
+    Build a FinancialModelingPrep API url.
+
+    :param endpoint: API endpoint, ex: 'income-statement', 'company/profile', 'stock/list'
+    :param api_key: FinancialModelingPrep API key
+    :param ticker: Stock ticker the request applies to, if any
+    :param period: String 'annual' or 'quarter', if applicable
+    :param base_url: Optional API root overriding BASE_URL, ex: 'http://127.0.0.1:8000/api/v3/'
+    :return: Request url
+    :rtype: str
+    """
+    url = (base_url or BASE_URL) + endpoint
+
+    if ticker is not None:
+        url += '/' + ticker
+
+    url += '?'
+
+    if period is not None:
+        url += 'period=' + period + '&'
+
+    return url + 'apikey=' + api_key
+
+
+def retry_delay(error, attempt):
+    """
+    Determine how long to wait before retrying a rate limited request.
+
+    :param error: HTTPError raised for the rate limited request
+    :param attempt: Number of retries already made for the request
+    :return: Delay in seconds
+    :rtype: float
+    """
+    retry_after = error.headers.get('Retry-After') if error.headers is not None else None
+
+    try:
+        delay = max(0.0, float(retry_after))
+    except (TypeError, ValueError):
+        delay = RETRY_BACKOFF * 2 ** attempt
+
+    # Spread out workers that were rejected together so they don't retry in lockstep
+    return delay + random.uniform(0, RETRY_BACKOFF)
+
+
+@instrument()
+def fetch_json(requests, api_key, max_workers=MAX_WORKERS,
+               requests_per_minute=REQUESTS_PER_MINUTE, cache=None, base_url=None):
+    """
+    Retrieve and decode many API responses concurrently, within the provided rate limit.
+
+    :param requests: List of (endpoint, ticker, period) tuples, ticker and period may be None
+    :param api_key: FinancialModelingPrep API key
+    :param max_workers: Maximum number of requests in flight at any time
+    :param requests_per_minute: Maximum number of requests issued per minute
+    :param cache: Optional ResponseCache, requests with a valid cached response skip the network
+    :param base_url: Optional API root overriding BASE_URL
+    :return: Decoded JSON responses, in the same order as the requests provided
+    :rtype: List
+    """
+    raw_responses = {}
+
+    if cache is not None:
+        for request in set(requests):
+            data = cache.get(*request)
+            if data is not None:
+                raw_responses[request] = data
+
+    pending = list(dict.fromkeys(r for r in requests if r not in raw_responses))
+
+    if pending:
+        pool = ConnectionPool()
+        bucket = shared_bucket(api_key, requests_per_minute)
+        # Worker threads count towards the stages running on this thread
+        stages = instrumentation.active_stages()
+
+        def fetch(request):
+            endpoint, ticker, period = request
+            url = build_url(endpoint, api_key, ticker, period, base_url)
+
+            for attempt in range(MAX_RETRIES + 1):
+                bucket.acquire()
+                instrumentation.count('http_requests', stages=stages)
+                try:
+                    data = pool.get(url)
+                    bucket.recover()
+                    break
+                except HTTPError as error:
+                    if error.code != 429 or attempt == MAX_RETRIES:
+                        raise
+                    instrumentation.count('http_retries', stages=stages)
+                    bucket.slow_down()
+                    time.sleep(retry_delay(error, attempt))
+
+            instrumentation.count('http_bytes', len(data), stages)
+
+            # FMP reports problems such as an invalid API key in a 200 response, don't keep those
+            if cache is not None and b'"Error Message"' not in data[:64]:
+                cache.put(endpoint, ticker, period, data)
+
+            return data
+
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                raw_responses.update(zip(pending, executor.map(fetch, pending)))
+        finally:
+            pool.close()
+
+    return [ingest.loads(raw_responses[request]) for request in requests]
@@ -1,9 +1,14 @@
-from urllib.request import urlopen
+from fundamental import api_client
+from fundamental import ingest
+from fundamental.instrumentation import instrument, unique_symbols
 
-import json
+import logging
 import pandas as pd
 
+logger = logging.getLogger(__name__)
 
+
+@instrument()
 def select_sector(df, *args):
     """
     Remove companies not in the sector provided.
@@ -13,17 +18,17 @@ def select_sector(df, *args):
     :return: Subset of DataFrame provided, containing companies in the specified sector
     :rtype: pandas.DataFrame
     """
-    print('Evaluating sector membership among ' + str(df['symbol'].nunique()) + ' companies...')
+    logger.info('Evaluating sector membership among %s companies...', unique_symbols(df))
 
     sector_filter = list(args)
     df = df[df['profile.sector'].isin(sector_filter)]
 
-    print('Found ' + str(df['symbol'].nunique()) + ' companies in the ' + str(sector_filter)
-          + ' sector! \n')
+    logger.info('Found %s companies in the %s sector! \n', unique_symbols(df), sector_filter)
 
     return df
 
 
+@instrument()
 def select_industries(df, *args):
     """
     Remove companies not in the industries provided.
@@ -33,18 +38,21 @@ def select_industries(df, *args):
     :return: Subset of DataFrame provided, containing companies in the specified industry
     :rtype: pandas.DataFrame
     """
-    print('Evaluating industry membership among ' + str(df['symbol'].nunique()) + ' companies...')
+    logger.info('Evaluating industry membership among %s companies...', unique_symbols(df))
 
     industry_filter = list(args)
     df = df[df['profile.industry'].isin(industry_filter)]
 
-    print('Found ' + str(df['symbol'].nunique()) + ' companies in the ' + str(industry_filter)
-          + ' industries! \n')
+    logger.info('Found %s companies in the %s industries! \n', unique_symbols(df),
+                industry_filter)
 
     return df
 
 
-def get_financial_data(df, request, period, api_key):
+@instrument()
+def get_financial_data(df, request, period, api_key, max_workers=api_client.MAX_WORKERS,
+                       requests_per_minute=api_client.REQUESTS_PER_MINUTE, cache=None,
+                       base_url=None):
     """
     Retrieve financial data for all stock tickers in the provided DataFrame.
 
@@ -52,11 +60,14 @@ def get_financial_data(df, request, period, api_key):
     :param request: String representing aspect of API to query
     :param period: String 'annual' or 'quarter'
     :param api_key: FinancialModelingPrep API key
+    :param max_workers: Maximum number of API requests in flight at any time
+    :param requests_per_minute: Maximum number of API requests issued per minute
+    :param cache: Optional ResponseCache that API responses should be served from / stored in
+    :param base_url: Optional API root overriding api_client.BASE_URL
     :return: DataFrame containing chosen financial data for all years available
     :rtype: pandas.DataFrame
     """
-    print('Pulling ' + period + ' ' + request + ' for ' + str(df['symbol'].nunique())
-          + ' companies...')
+    logger.info('Pulling %s %s for %s companies...', period, request, unique_symbols(df))
 
     request_map = {"financials": "financials",
                    "financial-ratios": "ratios",
@@ -68,56 +79,99 @@ def get_financial_data(df, request, period, api_key):
 
     financial_statements = ['income-statement', 'balance-sheet-statement', 'cash-flow-statement']
 
-    financial_data = pd.DataFrame()
+    tickers = list(df['symbol'])
+    unique_tickers = list(dict.fromkeys(tickers))
 
     if request == 'financials':
 
-        for ticker in df['symbol']:
+        api_requests = [(statement, ticker, period) for ticker in unique_tickers
+                        for statement in financial_statements]
+        responses = api_client.fetch_json(api_requests, api_key, max_workers, requests_per_minute,
+                                          cache, base_url)
+        responses = dict(zip(api_requests, responses))
 
-            statement_data = pd.DataFrame(df['symbol'])
+        financial_data = None
 
-            for statement in financial_statements:
-                response = urlopen("https://financialmodelingprep.com/api/v3/" + statement + "/"
-                                   + ticker + "?period=" + period + "&apikey=" + api_key)
+        # Statements describe the same report when they share a symbol and date
+        for statement in financial_statements:
+            statement_data = ingest.build_frame((responses[(statement, ticker, period)]
+                                                 for ticker in unique_tickers), statement)
 
-                data = response.read().decode("utf-8")
-                data_json = json.loads(data)
+            if 'symbol' not in statement_data or 'date' not in statement_data:
+                continue
 
-                flattened_data = pd.json_normalize(data_json)
+            if financial_data is None:
+                financial_data = statement_data
+            else:
+                financial_data = financial_data.merge(statement_data, on=['symbol', 'date'],
+                                                      how='outer', suffixes=('', '_x'))
 
-                try:
-                    statement_data = statement_data.merge(flattened_data, on='symbol',
-                                                          how='inner', suffixes=('', '_x'))
+                duplicate_cols = [x for x in financial_data if x.endswith('_x')]
+                financial_data.drop(duplicate_cols, axis=1, inplace=True)
 
-                except KeyError:
-                    continue
+        if financial_data is None:
+            financial_data = pd.DataFrame(columns=['symbol', 'date'])
 
-                duplicate_cols = [x for x in statement_data if x.endswith('_x')]
-                statement_data.drop(duplicate_cols, axis=1, inplace=True)
+        logger.info('Found %s financial statement data for %s companies! \n', period,
+                    unique_symbols(financial_data))
 
-            financial_data = pd.concat([financial_data, statement_data], ignore_index=True)
+    else:
 
-        print('Found ' + period + ' financial statement data for '
-              + str(financial_data['symbol'].nunique()) + ' companies! \n')
+        api_requests = [(value_key, ticker, period) for ticker in unique_tickers]
+        responses = api_client.fetch_json(api_requests, api_key, max_workers, requests_per_minute,
+                                          cache, base_url)
+        responses = dict(zip(unique_tickers, responses))
 
-    else:
+        financial_data = ingest.build_frame((responses[ticker] for ticker in tickers), value_key)
 
-        for ticker in df['symbol']:
-            response = urlopen("https://financialmodelingprep.com/api/v3/" + value_key + "/"
-                               + ticker + "?period=" + period + "&apikey=" + api_key)
+        logger.info('Found %s %s data for %s companies! \n', period, request,
+                    unique_symbols(financial_data))
 
-            data = response.read().decode("utf-8")
-            data_json = json.loads(data)
+    return financial_data
 
-            flattened_data = pd.json_normalize(data_json)
-            financial_data = pd.concat([financial_data, flattened_data], ignore_index=True)
 
-        print('Found ' + period + ' ' + request + ' data for '
-              + str(financial_data['symbol'].nunique()) + ' companies! \n')
+@instrument()
+def get_shard_data(companies, stored, period, report_year, eval_period, api_key,
+                   requests_per_minute=api_client.REQUESTS_PER_MINUTE, cache=None, base_url=None):
+    """
+    Retrieve, clean, and subset each requested dataset for one shard of companies. Runs in a
+    worker process of main.get_company_financials.
 
-    return financial_data
+    :param companies: Dictionary mapping requests (ex: 'financials') to DataFrames containing
+           the shard's stock tickers (symbol)
+    :param stored: Dictionary mapping requests to previously stored financial data on the shard's
+           companies, new rows are merged into it before subsetting
+    :param period: String 'annual' or 'quarter'
+    :param report_year: Year of most recent financial report
+    :param eval_period: Number of years prior to most recent report to be analyzed
+    :param api_key: FinancialModelingPrep API key
+    :param requests_per_minute: Maximum number of API requests issued per minute by this shard
+    :param cache: Optional ResponseCache that API responses should be served from / stored in
+    :param base_url: Optional API root overriding api_client.BASE_URL, shards running in spawned
+           processes don't see changes the parent process made to it
+    :return: Dictionary mapping requests to subset financial data
+    :rtype: dict
+    """
+    shard_data = {}
+
+    for request, df in companies.items():
+        raw_data = get_financial_data(df, request, period, api_key,
+                                      requests_per_minute=requests_per_minute, cache=cache,
+                                      base_url=base_url)
+        clean_data = clean_financial_data(raw_data)
+
+        if stored.get(request) is not None:
+            clean_data = merge_financial_data(stored[request], clean_data)
+
+        if period == 'quarter':
+            shard_data[request] = select_analysis_quarters(clean_data, report_year, eval_period)
+        else:
+            shard_data[request] = select_analysis_years(clean_data, report_year, eval_period)
 
+    return shard_data
 
+
+@instrument()
 def clean_financial_data(df):
     """
     Remove rows with corrupted date values, create new year column.
@@ -126,18 +180,20 @@ def clean_financial_data(df):
     :return: Subset of provided DataFrame, with the addition of a new 'year' column
     :rtype: pandas.DataFrame
     """
-    print('Cleaning financial data for ' + str(df['symbol'].nunique()) + ' companies...')
+    logger.info('Cleaning financial data for %s companies...', unique_symbols(df))
 
-    df = df.loc[df['date'].astype(str).apply(lambda x: len(x) == 10)].copy()
+    # Keep only YYYY-MM-DD dates, missing and truncated or reformatted dates are dropped
+    df = df.loc[df['date'].astype(str).str.fullmatch(r'\d{4}-\d{2}-\d{2}', na=False)].copy()
 
     df.insert(2, 'year', df['date'].str[:4])
     df['year'] = df.year.astype(int)
 
-    print('Returning clean financial data for ' + str(df['symbol'].nunique()) + ' companies! \n')
+    logger.info('Returning clean financial data for %s companies! \n', unique_symbols(df))
 
     return df
 
 
+@instrument()
 def select_analysis_years(df, report_year, eval_period):
     """
     Remove companies without financial reports in the evaluation period specified.
@@ -149,38 +205,151 @@ def select_analysis_years(df, report_year, eval_period):
     :rtype: pandas.DataFrame
     """
 
-    print('Subsetting data from ' + str(report_year - eval_period) + ' to ' + str(report_year)
-          + ' for ' + str(df['symbol'].nunique()) + ' companies...')
+    logger.info('Subsetting data from %s to %s for %s companies...', report_year - eval_period,
+                report_year, unique_symbols(df))
 
-    df.sort_values(by=['symbol', 'year'], inplace=True, ascending=True)
-    df.drop_duplicates(['symbol', 'year'], keep='last', inplace=True)
+    df = select_complete_periods(df, ['year'], report_year, eval_period, eval_period + 1)
 
-    start_year = report_year - eval_period
+    logger.info('Subset data from %s to %s for %s companies! \n', report_year - eval_period,
+                report_year, unique_symbols(df))
+
+    return df
 
-    historical_years = set()
-    tickers_to_drop = []
 
-    for i in range(start_year, report_year + 1):
-        historical_years.add(i)
+@instrument()
+def select_analysis_quarters(df, report_year, eval_period, *args):
+    """
+    Remove companies without quarterly financial reports for each of the quarters specified in
+    the evaluation period, and subset data to those quarters.
+
+    :param df: DataFrame containing quarterly financial data on N companies
+    :param report_year: Year of most recent financial report
+    :param eval_period: Number of years prior to most recent report to be analyzed
+    :param args: Quarters to retain for analysis, ex: 'Q1', 'Q4' (defaults to all four)
+    :return: Subset of the DataFrame provided, with the addition of a new 'quarter' column
+    :rtype: pandas.DataFrame
+    """
 
-    symbol_history = df.groupby('symbol')['year'].apply(set)
+    quarters = [int(str(x).upper().lstrip('Q')) for x in args] or [1, 2, 3, 4]
 
-    for symbol, year_set in enumerate(symbol_history):
-        common_years = historical_years.intersection(year_set)
-        if len(common_years) != len(historical_years):
-            tickers_to_drop.append(symbol_history.index[symbol])
-        else:
-            continue
+    logger.info('Subsetting %s data from %s to %s for %s companies...',
+                ['Q' + str(x) for x in quarters], report_year - eval_period, report_year,
+                unique_symbols(df))
+
+    if 'quarter' not in df.columns:
+        df = df.copy()
+        df.insert(df.columns.get_loc('year') + 1, 'quarter', infer_quarters(df))
+
+    df = df[df['quarter'].isin(quarters)]
 
-    df = df[~df['symbol'].isin(tickers_to_drop)]
-    df = df[df['year'].isin(historical_years)]
+    df = select_complete_periods(df, ['year', 'quarter'], report_year, eval_period,
+                                 (eval_period + 1) * len(quarters))
 
-    print('Subset data from ' + str(report_year - eval_period) + ' to ' + str(report_year)
-          + ' for ' + str(df['symbol'].nunique()) + ' companies! \n')
+    logger.info('Subset quarterly data from %s to %s for %s companies! \n',
+                report_year - eval_period, report_year, unique_symbols(df))
 
     return df
 
 
-# TODO: Add logic to select specific quarters for analysis
-def select_analysis_quarters(df, report_year, eval_period, *args):
-    pass
+def infer_quarters(df):
+    """
+    Determine the fiscal quarter of each report, from the 'period' column when it holds 'Q1' to
+    'Q4' values, otherwise from the calendar quarter of the report date.
+
+    :param df: DataFrame containing quarterly financial data with a 'date' column
+    :return: Quarter numbers (1 to 4)
+    :rtype: pandas.Series
+    """
+
+    month = pd.to_numeric(df['date'].astype(str).str[5:7], errors='coerce')
+    quarters = (month - 1) // 3 + 1
+
+    if 'period' in df.columns:
+        reported = pd.to_numeric(df['period'].astype(str).str.extract(r'^Q([1-4])$')[0],
+                                 errors='coerce')
+        quarters = reported.fillna(quarters)
+
+    return quarters.astype('Int64')
+
+
+def select_complete_periods(df, period_cols, report_year, eval_period, expected_periods):
+    """
+    Keep the rows of companies that report every expected period within the evaluation window.
+    Coverage is counted with one grouped pass rather than per-company set comparisons.
+
+    :param df: DataFrame containing financial data on N companies
+    :param period_cols: Columns identifying a reporting period, ex: ['year'] or ['year', 'quarter']
+    :param report_year: Year of most recent financial report
+    :param eval_period: Number of years prior to most recent report to be analyzed
+    :param expected_periods: Number of distinct periods each company must report in the window
+    :return: Subset of the DataFrame provided, one row per company and period in the window
+    :rtype: pandas.DataFrame
+    """
+
+    keys = ['symbol'] + period_cols
+
+    # Stable sort so the last row reported for a period wins
+    df = df.sort_values(by=keys, ascending=True, kind='mergesort')
+    df = df.drop_duplicates(keys, keep='last')
+
+    df = df[df['year'].between(report_year - eval_period, report_year)]
+
+    period_counts = df.groupby('symbol')['symbol'].transform('size')
+
+    return df[period_counts.to_numpy() == expected_periods]
+
+
+@instrument()
+def select_refresh_tickers(stored, df, report_year, eval_period):
+    """
+    Identify companies whose stored financial data is missing years in the evaluation period,
+    including companies with no stored data at all.
+
+    :param stored: DataFrame containing previously retrieved financial data on N companies
+    :param df: DataFrame containing stock tickers (symbol) that should be evaluated
+    :param report_year: Year of most recent financial report
+    :param eval_period: Number of years prior to most recent report to be analyzed
+    :return: Subset of df, containing companies that need to be retrieved again
+    :rtype: pandas.DataFrame
+    """
+    logger.info('Checking stored financial data for %s companies...', unique_symbols(df))
+
+    start_year = report_year - eval_period
+
+    stored_years = stored.loc[stored['year'].between(start_year, report_year), ['symbol', 'year']]
+    year_counts = stored_years.drop_duplicates().groupby('symbol')['year'].count()
+
+    complete_tickers = year_counts[year_counts == eval_period + 1].index
+
+    df = df[~df['symbol'].isin(complete_tickers)]
+
+    logger.info('Found %s companies with missing or incomplete data! \n', unique_symbols(df))
+
+    return df
+
+
+@instrument()
+def merge_financial_data(stored, df):
+    """
+    Merge newly retrieved financial data into previously stored data, new rows replace stored
+    rows for the same symbol and year (and quarter, for quarterly data).
+
+    :param stored: DataFrame containing previously retrieved financial data on N companies
+    :param df: DataFrame containing newly retrieved, clean financial data
+    :return: DataFrame containing one row per symbol and period
+    :rtype: pandas.DataFrame
+    """
+    keys = ['symbol', 'year']
+
+    if 'quarter' in stored.columns:
+        df = df.copy()
+        df.insert(df.columns.get_loc('year') + 1, 'quarter', infer_quarters(df))
+        keys.append('quarter')
+
+    merged = pd.concat([stored, df], ignore_index=True)
+
+    # Stable sort keeps new rows after stored rows for the same symbol and period
+    merged.sort_values(by=keys, inplace=True, ascending=True, kind='mergesort')
+    merged.drop_duplicates(keys, keep='last', inplace=True)
+
+    return merged
@@ -1,60 +1,187 @@
-from plotnine import ggplot, aes, geom_line, geom_point, scale_x_continuous, scale_y_continuous,\
-    labs, theme, theme_538, annotate, element_text
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from fundamental import storage
+from fundamental.instrumentation import instrument
 
 import numpy as np
 import pandas as pd
-import statistics
+import hashlib
+import logging
 import textwrap
+import warnings
 import os
 
+logger = logging.getLogger(__name__)
 
-def combine_data(directory, year_pattern):
+
+@instrument()
+def combine_data(directory, year_pattern, file_format='csv', columns=None):
     """
     Load all files in the provided directory as pandas DataFrames and join data into one large
     DataFrame for future analysis.
 
     :param directory: Local directory where financial data resides
     :param year_pattern: String indicating which files to pull. Example: '10Y', '5Y', '3Y', etc.
+    :param file_format: Storage format of the files to pull - 'csv', 'parquet' or 'feather'
+    :param columns: Optional list of columns to load, 'symbol', 'date' and 'year' are always loaded
     :return: Master DataFrame containing all data from the listed directory
     :rtype: pandas.DataFrame
     """
 
-    master = pd.DataFrame()
+    if columns is not None:
+        columns = ['symbol', 'date', 'year'] + list(columns)
+
+    extension = storage.FILE_FORMATS[file_format]
+
+    financial_files = []
+    profile_file = None
 
     for file in os.listdir(directory):
 
-        if file.endswith(year_pattern, -7, -4):
+        name, file_extension = os.path.splitext(file)
+
+        if file_extension != extension:
+            continue
+
+        if name.endswith('-' + year_pattern):
+            financial_files.append(directory + str(file))
+
+        elif name == 'company-profiles':
+            profile_file = directory + str(file)
+
+    master = pd.DataFrame()
+
+    for file in financial_files:
 
-            financial_data = pd.read_csv(directory + str(file))
+        financial_data = storage.read_data(file, columns)
 
-            if master.empty:
-                master = financial_data
-            else:
-                master = pd.merge(master, financial_data, on=['symbol', 'date'], how='inner',
-                                  suffixes=('', '_x'))
+        if master.empty:
+            master = financial_data
+        else:
+            master = pd.merge(master, financial_data, on=['symbol', 'date'], how='inner',
+                              suffixes=('', '_x'))
 
-        elif file == 'company-profiles.csv':
+            duplicate_cols = [x for x in master if x.endswith('_x')]
+            master.drop(duplicate_cols, axis=1, inplace=True)
 
-            company_profiles = pd.read_csv(directory + str(file))
+    # Profiles are joined after every financial file, joined in between their leftover '_x'
+    # columns could collide with the next file's suffixes, which pandas rejects with MergeError
+    if profile_file is not None and not master.empty:
 
-            try:
-                master = pd.merge(master, company_profiles, on='symbol', how='left',
-                                  suffixes=('', '_x'))
-            except KeyError:
-                continue
+        company_profiles = storage.read_data(profile_file, columns)
 
-    duplicate_cols = [x for x in master if x.endswith('_x')]
-    master.drop(duplicate_cols, axis=1, inplace=True)
+        master = pd.merge(master, company_profiles, on='symbol', how='left', suffixes=('', '_x'))
+
+        duplicate_cols = [x for x in master if x.endswith('_x')]
+        master.drop(duplicate_cols, axis=1, inplace=True)
 
     return master
 
 
+@instrument()
+def compact_data(df, columns=None, float_tolerance=0.0, categorical_threshold=0.5):
+    """
+    Reduce the memory footprint of a DataFrame: project it to the columns provided, store
+    low-cardinality text as categoricals and downcast numeric columns where the loss of
+    precision is within the tolerance provided.
+
+    :param df: DataFrame returned by combine_data
+    :param columns: Optional list of columns to keep, 'symbol', 'date' and 'year' are always kept
+    :param float_tolerance: Maximum relative error accepted when converting float64 columns to
+           float32, 0 only converts columns that float32 represents exactly
+    :param categorical_threshold: Text columns with fewer unique values than this share of rows
+           are stored as categoricals
+    :return: Compact copy of the DataFrame provided
+    :rtype: pandas.DataFrame
+    """
+
+    memory_before = df.memory_usage(deep=True).sum()
+
+    if columns is not None:
+        keep = {'symbol', 'date', 'year'}.union(columns)
+        df = df[[x for x in df.columns if x in keep]]
+
+    compact = {}
+
+    for column in df.columns:
+        values = df[column]
+
+        if pd.api.types.is_bool_dtype(values):
+            compact[column] = values
+
+        elif pd.api.types.is_integer_dtype(values):
+            compact[column] = pd.to_numeric(values, downcast='integer')
+
+        elif pd.api.types.is_float_dtype(values):
+            compact[column] = _downcast_float(values, float_tolerance)
+
+        elif values.nunique() < categorical_threshold * len(values):
+            compact[column] = values.astype('category')
+
+        else:
+            compact[column] = values
+
+    df = pd.DataFrame(compact, index=df.index)
+
+    memory_after = df.memory_usage(deep=True).sum()
+
+    logger.info('Compacted %s columns from %s MB to %s MB! \n', df.shape[1],
+                round(memory_before / 1e6, 1), round(memory_after / 1e6, 1))
+
+    return df
+
+
+def _downcast_float(values, float_tolerance):
+    original = values.to_numpy(dtype=np.float64)
+    downcast = original.astype(np.float32)
+
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        error = np.abs(downcast.astype(np.float64) - original) / np.abs(original)
+
+    # Exact matches (including zeros and NaN) always pass, anything else must be within tolerance
+    exact = (downcast == original) | (np.isnan(original) & np.isnan(downcast))
+    within = exact | (error <= float_tolerance)
+
+    if within.all():
+        return pd.Series(downcast, index=values.index, name=values.name)
+
+    return values
+
+
+STAT_LABELS = {'mean': 'mean',
+               'median': 'median',
+               'percent change': '% change',
+               'std': 'std',
+               'cagr': 'CAGR',
+               'min': 'min',
+               'max': 'max',
+               'slope': 'slope'}
+
+
+def _unsupported_stat(stat):
+    return ValueError('Unsupported statistic: ' + str(stat) + ', expected one of: '
+                      + ', '.join(STAT_LABELS))
+
+
+def _stat_lists(stat_map):
+    # One list of statistics per column, checked before any data is pivoted
+    stat_map = {column: [stats] if isinstance(stats, str) else list(stats)
+                for column, stats in stat_map.items()}
+
+    for stats in stat_map.values():
+        for stat in stats:
+            if stat not in STAT_LABELS:
+                raise _unsupported_stat(stat)
+
+    return stat_map
+
+
 def calculate_stats(df, stat, report_year, eval_period, *args):
     """
     Calculate N year statistics for provided columns.
 
     :param df: DataFrame containing the columns specified in *args
-    :param stat: Statistic to calculate: mean, median, or percent change
+    :param stat: Statistic to calculate: mean, median, or percent change (see STAT_LABELS)
     :param report_year: Ending year of calculation
     :param eval_period: Number of years to include in the calculation
     :param args: Columns that require calculations
@@ -62,32 +189,205 @@ def calculate_stats(df, stat, report_year, eval_period, *args):
     :rtype: pandas.DataFrame
     """
 
-    df.sort_values(by=['symbol', 'year'], inplace=True, ascending=False)
+    return calculate_multiple_stats(df, report_year, eval_period, {arg: stat for arg in args})
+
+
+@instrument()
+def calculate_multiple_stats(df, report_year, eval_period, stat_map):
+    """
+    Calculate several N year statistics for several columns in one grouped pass.
+
+    :param df: DataFrame containing 'symbol', 'year' and the columns specified in stat_map
+    :param report_year: Ending year of calculation
+    :param eval_period: Number of years to include in the calculation
+    :param stat_map: Dictionary containing column names as keys and a statistic, or a list of
+           statistics, as values. Ex: {'roe': ['mean', 'median'], 'eps': 'cagr'}. Available
+           statistics: mean, median, percent change, std, cagr, min, max, slope
+    :return: New DataFrame indexed by 'symbol', containing 'year' and 'NY column stat' columns for
+             every company with data on each column in the window
+    :rtype: pandas.DataFrame
+    """
 
-    company_stats = pd.DataFrame()
+    stat_map = _stat_lists(stat_map)
+    columns = list(stat_map)
 
-    for arg in list(args):
+    start_year = report_year - eval_period
+    window = df.loc[df['year'].between(start_year, report_year), ['symbol', 'year'] + columns]
 
-        metric = df[['symbol', 'year', arg]]
-        metric = metric.pivot_table(values=arg, index='symbol', columns='year')
+    # One pivot for every column: symbols x columns x years
+    wide = window.groupby(['symbol', 'year'])[columns].mean().unstack('year')
+    years = np.sort(window['year'].unique())
+    wide = wide.reindex(columns=pd.MultiIndex.from_product([columns, years]))
+    values = wide.to_numpy(dtype=float).reshape(len(wide), len(columns), len(years))
 
-        if stat == 'percent change':
-            column_name = str(eval_period) + 'Y ' + arg + ' % change'
-            company_stats[column_name] = (metric.iloc[:, -1] / metric.iloc[:, 0]) - 1
+    company_stats = pd.DataFrame(index=wide.index)
 
-        elif stat == 'mean':
-            column_name = str(eval_period) + 'Y ' + arg + ' mean'
-            company_stats[column_name] = metric.mean(axis=1)
+    for i, column in enumerate(columns):
+        for stat in stat_map[column]:
+            column_name = str(eval_period) + 'Y ' + column + ' ' + STAT_LABELS[stat]
+            company_stats[column_name] = window_stat(values[:, i, :], years, stat)
 
-        elif stat == 'median':
-            column_name = str(eval_period) + 'Y ' + arg + ' median'
-            company_stats[column_name] = metric.median(axis=1)
+    # Only keep companies with data for every column in the window
+    company_stats = company_stats.loc[~np.isnan(values).all(axis=2).any(axis=1)]
 
     company_stats['year'] = report_year
 
     return company_stats
 
 
+@instrument()
+def calculate_rolling_stats(df, start_year, end_year, eval_period, stat_map):
+    """
+    Calculate the statistics offered by calculate_multiple_stats for every report year from
+    start_year to end_year in one pass. Each year's statistics only use the N years up to and
+    including that year, as they would have been calculated at the time.
+
+    :param df: DataFrame containing 'symbol', 'year' and the columns specified in stat_map
+    :param start_year: First report year to calculate statistics for
+    :param end_year: Last report year to calculate statistics for
+    :param eval_period: Number of years before each report year to include in the calculation
+    :param stat_map: Dictionary containing column names as keys and a statistic, or a list of
+           statistics, as values. Ex: {'roe': ['mean', 'median'], 'eps': 'cagr'}
+    :return: New DataFrame indexed by 'symbol', containing 'NY column stat' and 'year' columns,
+             with one row per company and report year with data on each column in the window
+    :rtype: pandas.DataFrame
+    """
+
+    stat_map = _stat_lists(stat_map)
+    columns = list(stat_map)
+
+    years = np.arange(start_year - eval_period, end_year + 1)
+    report_years = years[eval_period:]
+    window = df.loc[df['year'].between(years[0], years[-1]), ['symbol', 'year'] + columns]
+
+    # One pivot for every column and report year: symbols x columns x years
+    wide = window.groupby(['symbol', 'year'])[columns].mean().unstack('year')
+    wide = wide.reindex(columns=pd.MultiIndex.from_product([columns, years]))
+    values = wide.to_numpy(dtype=float).reshape(len(wide), len(columns), len(years))
+
+    # Trailing windows without copying: symbols x columns x report years x window years
+    windows = np.lib.stride_tricks.sliding_window_view(values, eval_period + 1, axis=2)
+
+    company_stats = {}
+
+    for i, column in enumerate(columns):
+        for stat in stat_map[column]:
+            column_name = str(eval_period) + 'Y ' + column + ' ' + STAT_LABELS[stat]
+            company_stats[column_name] = window_stat(windows[:, i], years[:eval_period + 1],
+                                                     stat).ravel()
+
+    company_stats = pd.DataFrame(company_stats,
+                                 index=pd.Index(np.repeat(wide.index, len(report_years)),
+                                                name='symbol'))
+    company_stats['year'] = np.tile(report_years, len(wide))
+
+    # Only keep company years with data for every column in the window
+    complete = ~np.isnan(windows).all(axis=3).any(axis=1)
+
+    return company_stats.loc[complete.ravel()]
+
+
+# Peer groups of calculate_peer_stats and the label used in the column names they produce
+PEER_GROUPS = {'profile.sector': 'sector',
+               'profile.industry': 'industry'}
+
+
+@instrument()
+def calculate_peer_stats(df, columns, groups=None):
+    """
+    Compare each company with its sector and industry peers in the same year. For every column
+    and peer group, adds the company's percentile rank among its peers, its z-score, and the
+    peers' median, ex: 'roe sector pct', 'roe sector zscore', 'roe sector median'. These columns
+    can be screened like any other, ex: {'roe sector pct': [0.8, 1.0]}.
+
+    :param df: DataFrame containing 'year', the peer group columns and the columns specified
+    :param columns: Columns to compare, including stat columns such as '10Y roe median'
+    :param groups: Optional list of peer group columns, defaults to PEER_GROUPS
+    :return: Original DataFrame with the addition of three columns per column and peer group
+    :rtype: pandas.DataFrame
+    """
+
+    values = df[columns].astype(float)
+    peer_stats = {}
+
+    for group in [x for x in (groups or PEER_GROUPS) if x in df]:
+
+        # One grouping per peer group, shared by every column and statistic
+        grouped = values.groupby([df['year'], df[group]], sort=False, observed=True)
+
+        ranks = grouped.rank(pct=True)
+        means = grouped.transform('mean')
+        stds = grouped.transform('std')
+        medians = grouped.transform('median')
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            zscores = ((values - means) / stds).replace([np.inf, -np.inf], np.nan)
+
+        label = PEER_GROUPS.get(group, group)
+
+        for column in columns:
+            peer_stats[column + ' ' + label + ' pct'] = ranks[column]
+            peer_stats[column + ' ' + label + ' zscore'] = zscores[column]
+            peer_stats[column + ' ' + label + ' median'] = medians[column]
+
+    return pd.concat([df, pd.DataFrame(peer_stats, index=df.index)], axis=1)
+
+
+def window_stat(values, years, stat):
+    """
+    Calculate a statistic along the last axis of an array of yearly values.
+
+    :param values: NumPy array with one year per position along its last axis, NaN when missing
+    :param years: Years that positions along the last axis represent
+    :param stat: Statistic to calculate (see STAT_LABELS). CAGR is NaN unless the first and last
+           values are both positive
+    :return: Array with the last axis reduced
+    :rtype: numpy.ndarray
+    """
+
+    with warnings.catch_warnings(), np.errstate(divide='ignore', invalid='ignore'):
+        # All-NaN windows legitimately produce NaN, silence the warnings they raise
+        warnings.simplefilter('ignore', RuntimeWarning)
+
+        if stat == 'mean':
+            return np.nanmean(values, axis=-1)
+
+        elif stat == 'median':
+            return np.nanmedian(values, axis=-1)
+
+        elif stat == 'percent change':
+            return values[..., -1] / values[..., 0] - 1
+
+        elif stat == 'std':
+            return np.nanstd(values, axis=-1, ddof=1)
+
+        elif stat == 'cagr':
+            span = years[-1] - years[0]
+            # Growth rates are only defined between two positive values, a series that starts
+            # negative and gets more negative has a positive ratio but no meaningful CAGR
+            positive = (values[..., 0] > 0) & (values[..., -1] > 0)
+            ratio = np.where(positive, values[..., -1] / values[..., 0], np.nan)
+            return ratio ** (1 / max(span, 1)) - 1
+
+        elif stat == 'min':
+            return np.nanmin(values, axis=-1)
+
+        elif stat == 'max':
+            return np.nanmax(values, axis=-1)
+
+        elif stat == 'slope':
+            valid = ~np.isnan(values)
+            x = np.where(valid, np.asarray(years, dtype=float), 0.0)
+            y = np.where(valid, values, 0.0)
+            n = valid.sum(axis=-1)
+            sum_x, sum_y = x.sum(axis=-1), y.sum(axis=-1)
+            return (n * (x * y).sum(axis=-1) - sum_x * sum_y) \
+                / (n * (x * x).sum(axis=-1) - sum_x ** 2)
+
+    raise _unsupported_stat(stat)
+
+
+@instrument()
 def screen_stocks(df, **kwargs):
     """
     Subset DataFrame to stocks containing column values within the specified thresholds.
@@ -98,24 +398,131 @@ def screen_stocks(df, **kwargs):
     :rtype: pandas.DataFrame
     """
 
-    for column, thresholds in kwargs.items():
-        df = df[(df[column] > thresholds[0]) & (df[column] < thresholds[1]) | (df[column].isnull())]
+    membership = screen_universe(df, {'screen': kwargs})
 
-    ticker_list = list(df.symbol)
+    ticker_list = list(df['symbol'].to_numpy()[membership['screen'].to_numpy()])
 
     return ticker_list
 
 
-def plot_performance(df, report_year, eval_period):
+def compile_screens(screens):
     """
-    Plot metric-specific performance for a set of stocks over time. Reference:
-    https://www.buffettsbooks.com/how-to-invest-in-stocks/intermediate-course/lesson-20/
+    Compile named screening criteria into the distinct threshold conditions they use and an
+    incidence matrix recording which conditions each screen requires.
+
+    :param screens: Dictionary containing screen names as keys and screening criteria
+           dictionaries ({column: [min, max]}) as values
+    :return: List of distinct (column, min, max) conditions and a screens x conditions boolean
+             NumPy array
+    :rtype: Tuple
+    """
+
+    conditions = {}
+
+    for criteria in screens.values():
+        for column, thresholds in criteria.items():
+            conditions.setdefault((column, thresholds[0], thresholds[1]), len(conditions))
+
+    incidence = np.zeros((len(screens), len(conditions)), dtype=bool)
+
+    for i, criteria in enumerate(screens.values()):
+        for column, thresholds in criteria.items():
+            incidence[i, conditions[(column, thresholds[0], thresholds[1])]] = True
+
+    return list(conditions), incidence
+
+
+@instrument()
+def screen_universe(df, screens):
+    """
+    Evaluate a batch of named screens against one DataFrame. Each distinct condition is evaluated
+    once, however many screens share it. As in screen_stocks, a value passes a condition when it
+    lies strictly between the thresholds or is null.
+
+    :param df: DataFrame containing 'symbol' and the columns used by the screens
+    :param screens: Dictionary containing screen names as keys and screening criteria
+           dictionaries ({column: [min, max]}) as values
+    :return: Boolean DataFrame with one row per row of df (indexed by symbol) and one column per
+             screen, True where the row qualifies for the screen
+    :rtype: pandas.DataFrame
+    """
+
+    conditions, incidence = compile_screens(screens)
+
+    failures = np.zeros((len(df), len(conditions)), dtype=np.float32)
+    column_values = {}
+
+    for i, (column, lower, upper) in enumerate(conditions):
+
+        if column not in column_values:
+            column_values[column] = df[column].to_numpy(dtype=float)
+
+        values = column_values[column]
+
+        with np.errstate(invalid='ignore'):
+            failures[:, i] = ~(((values > lower) & (values < upper)) | np.isnan(values))
+
+    # A row qualifies for a screen when it fails none of the screen's conditions
+    membership = (failures @ incidence.T.astype(np.float32)) == 0
+
+    return pd.DataFrame(membership, index=pd.Index(df['symbol'], name='symbol'),
+                        columns=list(screens))
+
+
+# Commenting out for now, API no longer returning this col in income-statement response
+PERFORMANCE_LABELS = {'Earnings per Share': 'The EPS shows the company\'s profit per share. This '
+                                            'chart should have a positive slope over time. Stable '
+                                            'results here are extremely important for forecasting '
+                                            'future cash flows. Note: if the company\'s book value '
+                                            'has increased over time, the EPS should demonstrate '
+                                            'similar growth.',
+
+                      # 'Dividend per Share': 'This chart shows the dividend history of the '
+                      #                       'company. This should have a flat to positive slope '
+                      #                       'over time. If you see a drastic drop, it may '
+                      #                       'represent a stock split for the company. Note: the '
+                      #                       'dividend is taken from a portion of the EPS, the '
+                      #                       'remainder goes to the book value.',
+
+                      'Book Value per Share': 'The book value represents the liquidation value of '
+                                              'the entire company (per share). It\'s important to '
+                                              'see this number increasing over time. If the '
+                                              'company pays a high dividend, the book value may '
+                                              'grow at a slower rate. If the company pays no '
+                                              'dividend, the book value should grow with the EPS '
+                                              'each year.',
+
+                      'Return on Equity': 'Return on equity is very important because it show the '
+                                          'return that management has received for reinvesting '
+                                          'the profits of the company. If using an intrinsic '
+                                          'value calculator, it\'s very important that this '
+                                          'number is flat or increasing for accurate results. Find '
+                                          'companies with a consistent ROE above 8%.',
+
+                      'Current Ratio': 'The current ratio helps measure the health of the company '
+                                       'in the short term. As a rule of thumb, the current ratio '
+                                       'should be above 1.0. A safe current ratio is typically '
+                                       'above 1.5. Look for stability trends within the current '
+                                       'ratio to see how the company manages their short term '
+                                       'risk.',
+
+                      'Debt to Equity Ratio': 'The debt to equity ratio helps measure the health '
+                                              'of the company in the long term. As a rule of '
+                                              'thumb, the debt to equity ratio should be lower '
+                                              'than 0.5. Look for stability trends within the '
+                                              'debt/equity ratio to see how the company manages '
+                                              'their long term risk.'}
+
+
+def prepare_performance_data(df, report_year, eval_period):
+    """
+    Subset and rename the columns plotted by plot_performance.
 
     :param df: DataFrame containing stock tickers and the columns specified below
     :param report_year: Year of most recent financial report
     :param eval_period: Number of years prior to most recent report to be analyzed
-    :return: A list of ggplot objects
-    :rtype: List
+    :return: DataFrame containing 'symbol', 'year' and one column per plotted metric
+    :rtype: pandas.DataFrame
     """
 
     start_year = report_year - eval_period
@@ -123,80 +530,254 @@ def plot_performance(df, report_year, eval_period):
 
     df = df[['symbol', 'year', 'eps', 'bookValuePerShare', 'roe', 'currentRatio', 'debtToEquity']]
 
-    df['roe'] = df['roe'].apply(lambda x: x * 100.0)
+    df = df.assign(roe=df['roe'] * 100.0)
 
     df = df.rename({'eps': 'Earnings per Share', 'roe': 'Return on Equity',
                     'currentRatio': 'Current Ratio', 'debtToEquity': 'Debt to Equity Ratio',
                     'bookValuePerShare': 'Book Value per Share'}, axis='columns')
 
-    df.sort_values(by=['symbol', 'year'], inplace=True, ascending=True)
-    df.dropna(inplace=True)
-
-    # Commenting out for now, API no longer returning this col in income-statement response
-    label_dict = {'Earnings per Share': 'The EPS shows the company\'s profit per share. This chart '
-                                        'should have a positive slope over time. Stable results '
-                                        'here are extremely important for forecasting future cash '
-                                        'flows. Note: if the company\'s book value has increased '
-                                        'over time, the EPS should demonstrate similar growth.',
-
-                  # 'Dividend per Share': 'This chart shows the dividend history of the company. '
-                  #                       'This should have a flat to positive slope over time. If '
-                  #                       'you see a drastic drop, it may represent a stock split '
-                  #                       'for the company. Note: the dividend is taken from a '
-                  #                       'portion of the EPS, the remainder goes to the book value.',
-
-                  'Book Value per Share': 'The book value represents the liquidation value of the '
-                                          'entire company (per share). It\'s important to see '
-                                          'this number increasing over time. If the company pays a'
-                                          ' high dividend, the book value may grow at a slower '
-                                          'rate. If the company pays no dividend, the book value '
-                                          'should grow with the EPS each year.',
-
-                  'Return on Equity': 'Return on equity is very important because it show the '
-                                      'return that management has received for reinvesting the '
-                                      'profits of the company. If using an intrinsic value '
-                                      'calculator, it\'s very important that this number is flat or'
-                                      ' increasing for accurate results. Find companies with a '
-                                      'consistent ROE above 8%.',
-
-                  'Current Ratio': 'The current ratio helps measure the health of the company in '
-                                   'the short term. As a rule of thumb, the current ratio should be'
-                                   ' above 1.0. A safe current ratio is typically above 1.5. Look '
-                                   'for stability trends within the current ratio to see how the '
-                                   'company manages their short term risk.',
-
-                  'Debt to Equity Ratio': 'The debt to equity ratio helps measure the health of '
-                                          'the company in the long term. As a rule of thumb, the '
-                                          'debt to equity ratio should be lower than 0.5. Look for '
-                                          'stability trends within the debt/equity ratio to see how'
-                                          ' the company manages their long term risk.'}
-
-    wrapper = textwrap.TextWrapper(width=120)
-
-    for key, value in label_dict.items():
-        label_dict[key] = wrapper.fill(text=value)
-
-    plots = []
-
-    cols = df.columns[2:].tolist()
-
-    for metric in cols:
-        p = (ggplot(df, aes('year', metric, color='symbol'))
-             + geom_line(size=1, alpha=0.8) + geom_point(size=3, alpha=0.8)
-             + labs(title=metric, x='Report Year', y='', color='Ticker')
-             + theme_538() + theme(legend_position='left', plot_title=element_text(weight='bold'))
-             + scale_x_continuous(breaks=range(min(df['year']), max(df['year']) + 1, 1))
-             + scale_y_continuous(breaks=range(min(df[metric].astype(int)),
-                                               max(round(df[metric]).astype(int)) + 2, 1))
-             + annotate(geom='label', x=statistics.mean((df['year'])),
-                        y=max(round(df[metric]).astype(int) + 1), label=label_dict[metric],
-                        size=8, label_padding=0.8, fill='#F7F7F7'))
-
-        plots.append(p)
+    df = df.sort_values(by=['symbol', 'year'], ascending=True)
+    df = df.dropna()
+
+    return df
+
+
+def build_performance_plot(df, metric):
+    """
+    Build the stability chart of one metric for the stock tickers in the provided DataFrame.
+
+    :param df: DataFrame returned by prepare_performance_data
+    :param metric: Metric to plot, one of the keys of PERFORMANCE_LABELS
+    :return: A ggplot object
+    :rtype: plotnine.ggplot
+    """
+
+    # plotnine pulls in matplotlib, import it on first use so screening and valuation don't pay
+    # for the plotting stack
+    from plotnine import ggplot, aes, geom_line, geom_point, scale_x_continuous, \
+        scale_y_continuous, labs, theme, theme_538, annotate, element_text
+
+    label = textwrap.TextWrapper(width=120).fill(text=PERFORMANCE_LABELS[metric])
+
+    # Axis ranges come from one pass over each column's values
+    years = df['year'].to_numpy()
+    values = df[metric].to_numpy(dtype=float)
+
+    y_min = int(values.astype(int).min())
+    y_max = int(np.round(values).max())
+
+    p = (ggplot(df, aes('year', metric, color='symbol'))
+         + geom_line(size=1, alpha=0.8) + geom_point(size=3, alpha=0.8)
+         + labs(title=metric, x='Report Year', y='', color='Ticker')
+         + theme_538() + theme(legend_position='left', plot_title=element_text(weight='bold'))
+         + scale_x_continuous(breaks=range(int(years.min()), int(years.max()) + 1, 1))
+         + scale_y_continuous(breaks=range(y_min, y_max + 2, 1))
+         + annotate(geom='label', x=years.mean(), y=y_max + 1, label=label, size=8,
+                    label_padding=0.8, fill='#F7F7F7'))
+
+    return p
+
+
+@instrument()
+def plot_performance(df, report_year, eval_period):
+    """
+    Plot metric-specific performance for a set of stocks over time. Reference:
+    https://www.buffettsbooks.com/how-to-invest-in-stocks/intermediate-course/lesson-20/
+
+    :param df: DataFrame containing stock tickers and the columns specified below
+    :param report_year: Year of most recent financial report
+    :param eval_period: Number of years prior to most recent report to be analyzed
+    :return: A list of ggplot objects
+    :rtype: List
+    """
+
+    df = prepare_performance_data(df, report_year, eval_period)
+
+    plots = [build_performance_plot(df, metric) for metric in df.columns[2:]]
 
     return plots
 
 
+def _plot_path(df, metric, output_dir):
+    # Identical data and labels always render to the same file, so unchanged charts are reused
+    digest = hashlib.sha256(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    digest.update((metric + PERFORMANCE_LABELS[metric]).encode('utf-8'))
+
+    filename = metric.lower().replace(' ', '-') + '-' + digest.hexdigest()[:16] + '.png'
+
+    return os.path.join(output_dir, filename)
+
+
+def _render_plot(df, metric, path):
+    plot = build_performance_plot(df, metric)
+    temp_path = path + '.' + str(os.getpid()) + '.tmp.png'
+    plot.save(temp_path, width=16, height=9, dpi=100, verbose=False)
+    os.replace(temp_path, path)
+
+    return path
+
+
+@instrument()
+def render_performance_plots(df, report_year, eval_period, output_dir, max_workers=None,
+                             by_ticker=False):
+    """
+    Render stability charts to PNG files in a process pool. Files are named after a hash of the
+    plotted data, charts whose data has not changed since a previous run are not redrawn.
+
+    :param df: DataFrame containing stock tickers and the columns plotted by plot_performance
+    :param report_year: Year of most recent financial report
+    :param eval_period: Number of years prior to most recent report to be analyzed
+    :param output_dir: Directory that PNG files should be written to
+    :param max_workers: Number of processes used to render charts, defaults to the CPU count
+    :param by_ticker: If True, render one chart set per ticker in a sub-directory named after it
+    :return: Dictionary mapping (ticker or None, metric) to the PNG file path
+    :rtype: dict
+    """
+
+    df = prepare_performance_data(df, report_year, eval_period)
+
+    if by_ticker:
+        slices = [(ticker, rows) for ticker, rows in df.groupby('symbol', sort=True)]
+    else:
+        slices = [(None, df)]
+
+    paths = {}
+    pending = []
+
+    for ticker, rows in slices:
+        directory = output_dir if ticker is None else os.path.join(output_dir, str(ticker))
+        os.makedirs(directory, exist_ok=True)
+
+        for metric in df.columns[2:]:
+            metric_data = rows[['symbol', 'year', metric]]
+            path = _plot_path(metric_data, metric, directory)
+            paths[(ticker, metric)] = path
+
+            if not os.path.exists(path):
+                pending.append((metric_data, metric, path))
+
+    if len(pending) == 1 or max_workers == 1:
+        for metric_data, metric, path in pending:
+            _render_plot(metric_data, metric, path)
+
+    elif pending:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(_render_plot, *zip(*pending)))
+
+    return paths
+
+
+class TickerPlots(Mapping):
+    """
+    Lazily rendered per-ticker chart sets: a ticker's charts are rendered (or read from the
+    output directory's cache) only when the ticker is first looked up. One ticker's charts are
+    drawn in this process, starting a process pool for them costs more than drawing them.
+
+    :param df: DataFrame containing stock tickers and the columns plotted by plot_performance
+    :param report_year: Year of most recent financial report
+    :param eval_period: Number of years prior to most recent report to be analyzed
+    :param output_dir: Directory that PNG files should be written to
+    """
+
+    def __init__(self, df, report_year, eval_period, output_dir):
+        self.df = df
+        self.report_year = report_year
+        self.eval_period = eval_period
+        self.output_dir = output_dir
+        self.tickers = sorted(df['symbol'].unique())
+        self.rendered = {}
+
+    def __getitem__(self, ticker):
+        if ticker not in self.tickers:
+            raise KeyError(ticker)
+
+        if ticker not in self.rendered:
+            paths = render_performance_plots(self.df[self.df['symbol'] == ticker],
+                                             self.report_year, self.eval_period, self.output_dir,
+                                             max_workers=1, by_ticker=True)
+            self.rendered[ticker] = {metric: path for (_, metric), path in paths.items()}
+
+        return self.rendered[ticker]
+
+    def __iter__(self):
+        return iter(self.tickers)
+
+    def __len__(self):
+        return len(self.tickers)
+
+
+# History used to estimate long term growth: each column and the N year statistic taken of it
+GROWTH_SOURCES = {'freeCashFlow': 'cagr',
+                  'eps': 'cagr',
+                  'freeCashFlowGrowth': 'median',
+                  'epsgrowth': 'median'}
+
+# Yearly growth columns and the values they measure the growth of. A growth source is skipped
+# for a ticker whose underlying values aren't positive at both ends of the window, growth of a
+# negative free cash flow or EPS says nothing about how fast the business grows
+GROWTH_BASES = {'freeCashFlowGrowth': 'freeCashFlow',
+                'epsgrowth': 'eps'}
+
+# Growth estimates are limited to this range, the DCF model assumes growth continues for years
+GROWTH_FLOOR = 0.0
+GROWTH_CAP = 0.15
+
+
+@instrument()
+def estimate_growth_rates(df, report_year, eval_period, sources=None, floor=GROWTH_FLOOR,
+                          cap=GROWTH_CAP):
+    """
+    Estimate the long term growth rate of every stock ticker from its history: the median of
+    its free cash flow and EPS CAGR and its median yearly free cash flow and EPS growth (see
+    GROWTH_SOURCES), limited to the floor and cap. Sources whose values aren't positive at both
+    ends of the window are skipped (see GROWTH_BASES), tickers left without any usable source get
+    NaN rather than a guessed rate.
+
+    :param df: DataFrame containing N-years of historical company data
+    :param report_year: Year of most recent financial report
+    :param eval_period: Number of years prior to most recent report to be analyzed
+    :param sources: Optional dictionary of columns and statistics overriding GROWTH_SOURCES,
+           ex: {'revenueGrowth': 'median'}. Columns missing from df are ignored
+    :param floor: Lowest growth estimate
+    :param cap: Highest growth estimate
+    :return: Dictionary containing stock tickers as keys and long term growth rate estimates as
+             values, in the format calculate_discounted_free_cash_flow expects
+    :rtype: dict
+    """
+
+    sources = {x: stat for x, stat in (sources or GROWTH_SOURCES).items() if x in df}
+
+    estimates = pd.DataFrame(index=pd.Index(df['symbol'].unique(), name='symbol'))
+
+    def column_stat(column, stat):
+        # Calculated one column at a time, so a ticker missing one history still uses the others
+        stats = calculate_multiple_stats(df, report_year, eval_period, {column: stat})
+        return stats.iloc[:, 0].reindex(estimates.index)
+
+    for column, stat in sources.items():
+        estimates[column] = column_stat(column, stat)
+
+        # CAGR is NaN unless the values are positive at both ends of the window, so the base's
+        # CAGR tells which tickers' yearly growth is usable
+        if GROWTH_BASES.get(column) in df:
+            base = GROWTH_BASES[column]
+            base_cagr = estimates[base] if sources.get(base) == 'cagr' and base in estimates \
+                else column_stat(base, 'cagr')
+            estimates[column] = estimates[column].where(np.isfinite(base_cagr))
+
+    values = estimates.to_numpy(dtype=float)
+    values[~np.isfinite(values)] = np.nan
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        growth = np.nanmedian(values, axis=1) if sources else np.full(len(estimates), np.nan)
+
+    growth = np.clip(growth, floor, cap)
+
+    return dict(zip(estimates.index, growth.tolist()))
+
+
+@instrument()
 def prepare_valuation_inputs(df, report_year, eval_period, *args):
     """
     Subset DataFrame to data required for Discounted Cash Flow model.
@@ -210,25 +791,25 @@ def prepare_valuation_inputs(df, report_year, eval_period, *args):
     """
 
     symbol_filter = list(args)
-    df = df[df['symbol'].isin(symbol_filter)]
-
     start_year = report_year - eval_period
-    df = df.loc[df['year'] >= start_year]
+
+    input_columns = ['symbol', 'year', 'freeCashFlow', 'marketCap', 'shortTermDebt',
+                     'longTermDebt', 'profile.beta', 'cashAndCashEquivalents', 'totalLiabilities',
+                     'numberOfShares', 'stockPrice']
+
+    # Only copy the columns the model uses, valuing thousands of tickers stays cheap
+    df = df.loc[df['symbol'].isin(symbol_filter) & (df['year'] >= start_year),
+                input_columns + ['interestExpense', 'totalDebt', 'effectiveTaxRate']]
 
     df['interestRate'] = round((df['interestExpense'] / df['totalDebt']), 2)
 
     df = df.replace([np.inf, -np.inf, np.nan], 0)
 
-    max_tax_rate = df.groupby('symbol')['effectiveTaxRate'].max().reset_index()
-    max_interest_rate = df.groupby('symbol')['interestRate'].max().reset_index()
+    max_rates = df.groupby('symbol')[['effectiveTaxRate', 'interestRate']].max().reset_index()
 
-    df = df[['symbol', 'year', 'freeCashFlow', 'marketCap', 'shortTermDebt', 'longTermDebt',
-             'profile.beta', 'cashAndCashEquivalents', 'totalLiabilities', 'numberOfShares',
-             'stockPrice']]
+    df = df.loc[df['year'] == report_year, input_columns]
 
-    df = df.loc[df['year'] == report_year]
-
-    valuation_data = df.merge(max_tax_rate, on='symbol').merge(max_interest_rate, on='symbol')
+    valuation_data = df.merge(max_rates, on='symbol')
 
     valuation_data.rename(columns={'effectiveTaxRate': 'Max Tax Rate',
                                    'interestRate': 'Max Interest Rate'}, inplace=True)
@@ -238,6 +819,7 @@ def prepare_valuation_inputs(df, report_year, eval_period, *args):
     return valuation_data
 
 
+@instrument()
 def calculate_discount_rate(df, risk_free_rate=0.0069, market_risk_premium=0.06):
     """
     Calculate the Weighted Average Cost of Capital (WACC) for each ticker in the provided DataFrame.
@@ -263,6 +845,7 @@ def calculate_discount_rate(df, risk_free_rate=0.0069, market_risk_premium=0.06)
     return df
 
 
+@instrument()
 def calculate_discounted_free_cash_flow(df, projection_window, **kwargs):
     """
     Calculate the present value of discounted future cash flows for each stock ticker in the
@@ -280,39 +863,111 @@ def calculate_discounted_free_cash_flow(df, projection_window, **kwargs):
     estimated_growth = pd.DataFrame(kwargs.items(), columns=['symbol', 'Long Term Growth Rate'])
     df = df.merge(estimated_growth, on='symbol')
 
-    dfcf = pd.DataFrame(columns=['year', 'symbol', 'Last Projected FCF',
-                                 'Last Projected Discount Factor',
-                                 'Present Value of Discounted FCF'])
+    free_cash_flow = df['freeCashFlow'].to_numpy(dtype=float)
+    growth_rate = df['Long Term Growth Rate'].to_numpy(dtype=float)
+    discount_rate = df['Discount Rate'].to_numpy(dtype=float)
+
+    pv_dfcf, last_fcf, last_df = project_free_cash_flow(free_cash_flow, growth_rate,
+                                                        discount_rate, projection_window)
+
+    df['Present Value of Discounted FCF'] = np.round(pv_dfcf, 2)
+    df['Last Projected FCF'] = np.round(last_fcf, 2)
+    df['Last Projected Discount Factor'] = np.round(last_df, 2)
+
+    return df
+
+
+def project_free_cash_flow(free_cash_flow, growth_rate, discount_rate, projection_window):
+    """
+    Project free cash flow over the projection window and discount it back to today, in closed
+    form. Inputs are NumPy arrays that broadcast against each other, so any grid of tickers and
+    scenarios is valued in one pass.
+
+    :param free_cash_flow: Free cash flow in the report year
+    :param growth_rate: Long term growth rate estimates
+    :param discount_rate: Discount rates (WACC)
+    :param projection_window: Number of years into the future we should generate projections for
+    :return: Present value of discounted FCF, last projected FCF, last projected discount factor
+    :rtype: Tuple
+    """
+
+    growth_factor = 1 + growth_rate
+    discount_factor = 1 / (1 + discount_rate)
+
+    # Sum of free_cash_flow * ratio ** year for year = 1..N is a geometric series. It's
+    # evaluated through log(ratio), so it stays accurate and continuous as the ratio nears 1
+    ratio = growth_factor * discount_factor
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_ratio = np.log1p(growth_rate) - np.log1p(discount_rate)
+        series_sum = np.where(log_ratio == 0, projection_window,
+                              ratio * np.expm1(projection_window * log_ratio) / np.expm1(log_ratio))
+
+    pv_dfcf = free_cash_flow * series_sum
+    last_fcf = free_cash_flow * growth_factor ** projection_window
+    last_df = discount_factor ** projection_window
 
-    for row in df.itertuples(index=False):
+    return pv_dfcf, last_fcf, last_df
+
+
+@instrument()
+def calculate_implied_growth_rate(df, projection_window, gdp_growth_rate=0.029, lower=-0.5,
+                                  upper=0.5, tolerance=1e-6):
+    """
+    Solve for the long term growth rate at which each stock ticker's intrinsic value equals its
+    stock price, using the same projection, terminal value and intrinsic value calculations as
+    the DCF chain. Every ticker is solved at once by bisection over NumPy arrays.
+
+    :param df: DataFrame containing a single row of valuation inputs for each stock ticker,
+           including the 'Discount Rate' column added by calculate_discount_rate
+    :param projection_window: Number of years into the future we should generate projections for
+    :param gdp_growth_rate: See calculate_terminal_value
+    :param lower: Lowest growth rate searched
+    :param upper: Highest growth rate searched
+    :param tolerance: Width of the final interval around each growth rate
+    :return: Original DataFrame with the addition of a new 'Implied Growth Rate' column, NaN where
+             no growth rate between lower and upper matches the stock price
+    :rtype: pandas.DataFrame
+    """
 
-        for year in range(projection_window + 1):
-            projected_free_cash_flow = row[df.columns.get_loc('freeCashFlow')] * \
-                                       (1 + row[df.columns.get_loc('Long Term Growth Rate')]) ** \
-                                       year
+    free_cash_flow = df['freeCashFlow'].to_numpy(dtype=float)
+    discount_rate = df['Discount Rate'].to_numpy(dtype=float)
+    net_cash = (df['cashAndCashEquivalents'] - df['totalLiabilities']).to_numpy(dtype=float)
+    number_of_shares = df['numberOfShares'].to_numpy(dtype=float)
+    stock_price = df['stockPrice'].to_numpy(dtype=float)
 
-            discount_factor = 1 / (1 + row[df.columns.get_loc('Discount Rate')]) ** year
+    def price_gap(growth_rate):
+        # Intrinsic value minus stock price, as in calculate_terminal_value and
+        # calculate_intrinsic_value without rounding to cents
+        pv_dfcf, last_fcf, _ = project_free_cash_flow(free_cash_flow, growth_rate, discount_rate,
+                                                      projection_window)
+        terminal_value = (last_fcf * (1 + gdp_growth_rate)) / discount_rate - gdp_growth_rate
+        return (pv_dfcf + terminal_value + net_cash) / number_of_shares - stock_price
 
-            discounted_free_cash_flow = projected_free_cash_flow * discount_factor
+    low = np.full(len(df), float(lower))
+    high = np.full(len(df), float(upper))
 
-            dfcf = dfcf.append({'year': year, 'symbol': row[df.columns.get_loc('symbol')],
-                                'Last Projected FCF': round(projected_free_cash_flow, 2),
-                                'Last Projected Discount Factor': round(discount_factor, 2),
-                                'Present Value of Discounted FCF': round(discounted_free_cash_flow, 2)},
-                               ignore_index=True)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        low_gap = price_gap(low)
+        # Only tickers whose price lies between the values at either end have a solution
+        solvable = np.sign(low_gap) * np.sign(price_gap(high)) <= 0
 
-    dfcf = dfcf.loc[dfcf['year'] != 0]
+        for _ in range(int(np.ceil(np.log2((upper - lower) / tolerance)))):
+            middle = (low + high) / 2
+            middle_gap = price_gap(middle)
 
-    pv_dfcf = dfcf.groupby('symbol')['Present Value of Discounted FCF'].sum().reset_index()
-    last_fcf = dfcf.loc[dfcf['year'] == max(dfcf['year'])][['symbol', 'Last Projected FCF']]
-    last_df = dfcf.loc[dfcf['year'] == max(dfcf['year'])][['symbol', 'Last Projected Discount '
-                                                                     'Factor']]
+            # Keep the half of each interval where the gap changes sign
+            same_sign = np.sign(middle_gap) == np.sign(low_gap)
+            low = np.where(same_sign, middle, low)
+            low_gap = np.where(same_sign, middle_gap, low_gap)
+            high = np.where(same_sign, high, middle)
 
-    df = df.merge(pv_dfcf, on='symbol').merge(last_fcf, on='symbol').merge(last_df, on='symbol')
+    df['Implied Growth Rate'] = np.where(solvable, (low + high) / 2, np.nan)
 
     return df
 
 
+@instrument()
 def calculate_terminal_value(df, gdp_growth_rate=0.029):
     """
     Calculate the terminal value for each stock ticker in the provided DataFrame.
@@ -329,6 +984,7 @@ def calculate_terminal_value(df, gdp_growth_rate=0.029):
     return df
 
 
+@instrument()
 def calculate_intrinsic_value(df):
     """
     Calculate the intrinsic value of each stock ticker in the provided DataFrame.
@@ -345,6 +1001,7 @@ def calculate_intrinsic_value(df):
     return df
 
 
+@instrument()
 def calculate_margin_of_safety(df, margin_of_safety=0.25):
     """
     Calculate the margin of safety value of each stock ticker in the provided DataFrame.
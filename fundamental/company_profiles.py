@@ -1,29 +1,34 @@
-from urllib.request import urlopen
+from fundamental import api_client
+from fundamental import ingest
+from fundamental import storage
+from fundamental.instrumentation import instrument, unique_symbols
 
-import json
-import pandas as pd
+import logging
 
+logger = logging.getLogger(__name__)
 
-def get_company_data(api_key):
+
+@instrument()
+def get_company_data(api_key, cache=None):
     """
     Retrieve all available company stocks from FinancialModelingPrep API.
 
     :param api_key: FinancialModelingPrep API key
+    :param cache: Optional ResponseCache that API responses should be served from / stored in
     :return: DataFrame containing 'symbol', 'name', 'price', and 'exchange' columns
     :rtype: pandas.DataFrame
     """
-    print('Retrieving stock data from FinancialModelingPrep...')
+    logger.info('Retrieving stock data from FinancialModelingPrep...')
 
-    response = urlopen("https://financialmodelingprep.com/api/v3/stock/list?apikey=" + api_key)
-    data = response.read().decode("utf-8")
-    data_json = json.loads(data)
-    flattened_data = pd.json_normalize(data_json)
+    data_json = api_client.fetch_json([('stock/list', None, None)], api_key, cache=cache)[0]
+    flattened_data = ingest.build_frame([data_json], 'stock/list')
 
-    print('Found stock data on ' + str(flattened_data.symbol.nunique()) + ' companies! \n')
+    logger.info('Found stock data on %s companies! \n', unique_symbols(flattened_data))
 
     return flattened_data
 
 
+@instrument()
 def select_stock_exchanges(df):
     """
     Subset DataFrame to companies listed on major stock exchanges.
@@ -32,19 +37,20 @@ def select_stock_exchanges(df):
     :return: Subset of the DataFrame provided
     :rtype: pandas.DataFrame
     """
-    print('Searching for stocks listed on major stock exchanges among ' + str(df.symbol.nunique()) +
-          ' companies...')
+    logger.info('Searching for stocks listed on major stock exchanges among %s companies...',
+                unique_symbols(df))
 
     major_stock_exchanges = ['Nasdaq Global Select', 'NasdaqGS', 'Nasdaq',
                              'New York Stock Exchange', 'NYSE', 'NYSE American']
 
     df = df[df['exchange'].isin(major_stock_exchanges)]
 
-    print('Found ' + str(df.symbol.nunique()) + ' companies listed on major stock exchanges! \n')
+    logger.info('Found %s companies listed on major stock exchanges! \n', unique_symbols(df))
 
     return df
 
 
+@instrument()
 def select_minimum_price(df, min_price=5.00):
     """
     Subset DataFrame to companies with a stock price greater than or equal to the minimum provided.
@@ -54,42 +60,48 @@ def select_minimum_price(df, min_price=5.00):
     :return: Subset of the DataFrame provided
     :rtype: pandas.DataFrame
     """
-    print('Searching for stocks with a price greater than or equal to $' + str(int(min_price)) +
-          ' among ' + str(df.symbol.nunique()) + ' companies')
+    logger.info('Searching for stocks with a price greater than or equal to $%s among %s '
+                'companies', int(min_price), unique_symbols(df))
 
     df = df[df['price'] >= min_price]
 
-    print('Found ' + str(df.symbol.nunique()) + ' companies that meet your price requirement! \n')
+    logger.info('Found %s companies that meet your price requirement! \n', unique_symbols(df))
 
     return df
 
 
-def create_company_profile(df, dir_path, api_key):
+@instrument()
+def create_company_profile(df, dir_path, api_key, max_workers=api_client.MAX_WORKERS,
+                           requests_per_minute=api_client.REQUESTS_PER_MINUTE, cache=None,
+                           file_format='csv'):
     """
     Map stock tickers to company information needed for screening stocks (industry, sector, etc.).
 
     :param df: DataFrame containing stock tickers (symbol) for N companies
-    :param dir_path: Specifies name of directory that csv files should be written to
+    :param dir_path: Specifies name of directory that data files should be written to
     :param api_key: FinancialModelingPrep API key
+    :param max_workers: Maximum number of API requests in flight at any time
+    :param requests_per_minute: Maximum number of API requests issued per minute
+    :param cache: Optional ResponseCache that API responses should be served from / stored in
+    :param file_format: Storage format of the profile file - 'csv', 'parquet' or 'feather'
     :return: New DataFrame that maps the symbol column to additional company information
     :rtype: pandas.DataFrame
     """
 
-    print('Searching for profile data on ' + str(df.symbol.nunique()) + ' companies...')
+    logger.info('Searching for profile data on %s companies...', unique_symbols(df))
 
-    profile_data = pd.DataFrame()
+    tickers = list(df['symbol'])
+    unique_tickers = list(dict.fromkeys(tickers))
 
-    for ticker in df['symbol']:
-        response = urlopen("https://financialmodelingprep.com/api/v3/company/profile/" + ticker
-                           + "?apikey=" + api_key)
+    api_requests = [('company/profile', ticker, None) for ticker in unique_tickers]
+    responses = api_client.fetch_json(api_requests, api_key, max_workers, requests_per_minute,
+                                      cache)
+    responses = dict(zip(unique_tickers, responses))
 
-        data = response.read().decode("utf-8")
-        data_json = json.loads(data)
-        flattened_data = pd.json_normalize(data_json)
-        profile_data = pd.concat([profile_data, flattened_data], ignore_index=True)
+    profile_data = ingest.build_frame((responses[ticker] for ticker in tickers), 'company/profile')
 
-    profile_data.to_csv(dir_path + 'company-profiles.csv', index=False, header=True)
+    storage.write_data(profile_data, dir_path + 'company-profiles', file_format)
 
-    print('Found ' + str(profile_data.symbol.nunique()) + ' company profiles! \n')
+    logger.info('Found %s company profiles! \n', unique_symbols(profile_data))
 
     return profile_data
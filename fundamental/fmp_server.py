@@ -0,0 +1,271 @@
+"""
+Local stand-in for the FinancialModelingPrep API, serving synthetic data so the fetch path can be
+load-tested offline. Latency, rate limiting (429) responses and malformed report dates can be
+injected to observe how the client behaves.
+
+Usage: python -m fundamental.fmp_server [--tickers 1000] [--port 8000] [--latency 0.05]
+       [--requests-per-minute 300] [--malformed-dates 0.01]
+
+Then point the client at it: FMP_BASE_URL=http://127.0.0.1:8000/api/v3/
+"""
+from fundamental import api_client
+from fundamental import synthetic_data
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import argparse
+import json
+import random
+import threading
+import time
+import numpy as np
+
+API_ROOT = '/api/v3/'
+
+STATEMENT_ENDPOINTS = ['income-statement', 'balance-sheet-statement', 'cash-flow-statement',
+                       'ratios', 'key-metrics', 'financial-growth', 'enterprise-values']
+
+# Date corruptions seen in FMP responses, clean_financial_data drops every one of them
+MALFORMED_DATES = ['', None, '2019-9-30', '12/31/2019', '2019']
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, without TCP_NODELAY every kept-alive response
+    # would wait on the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        status, body, headers = self.server.stand_in.respond(self.path)
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        return None
+
+
+class FMPServer:
+    """
+    Serve '/stock/list', '/company/profile/{ticker}' and the statement, ratio, key metric,
+    financial growth and enterprise value endpoints from synthetic_data, in the response
+    formats of the FinancialModelingPrep v3 API.
+
+    :param n_tickers: Number of synthetic stock tickers
+    :param n_periods: Number of annual reports per ticker (quarterly requests get 4x as many)
+    :param report_year: Year of most recent financial report
+    :param seed: Seed for reproducible data
+    :param host: Interface to listen on
+    :param port: Port to listen on, 0 picks a free port
+    :param latency: Seconds added to every response
+    :param jitter: Maximum random seconds added on top of the latency
+    :param requests_per_minute: Respond 429 with a Retry-After header to requests beyond this
+           rate, None disables rate limiting
+    :param malformed_date_rate: Fraction of statement records served with a corrupted date
+    :param api_key: If provided, requests with another key get FMP's invalid key error message
+    """
+
+    def __init__(self, n_tickers=1000, n_periods=11, report_year=2019, seed=0, host='127.0.0.1',
+                 port=0, latency=0.0, jitter=0.0, requests_per_minute=None,
+                 malformed_date_rate=0.0, api_key=None):
+        self.n_tickers = n_tickers
+        self.n_periods = n_periods
+        self.report_year = report_year
+        self.seed = seed
+        self.latency = latency
+        self.jitter = jitter
+        self.malformed_date_rate = malformed_date_rate
+        self.api_key = api_key
+
+        self.bucket = None
+        if requests_per_minute is not None:
+            self.bucket = api_client.TokenBucket(requests_per_minute)
+
+        self.data = {}
+        self.bodies = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.rate_limited = 0
+
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.stand_in = self
+        self.thread = None
+
+    @property
+    def base_url(self):
+        """
+        API root to pass to the client as base_url or FMP_BASE_URL.
+        """
+        host, port = self.httpd.server_address[:2]
+        return 'http://' + host + ':' + str(port) + API_ROOT
+
+    def _endpoint_data(self, period):
+        # Synthetic data and per-ticker row ranges, generated on the first request for a period
+        with self.lock:
+            if period not in self.data:
+                n_periods = self.n_periods * (4 if period == 'quarter' else 1)
+                endpoint_data = synthetic_data.generate_endpoint_data(
+                    self.n_tickers, n_periods, self.report_year, period, self.seed)
+
+                # Rows are ordered by ticker, then oldest to newest period
+                tickers = endpoint_data['stock/list']['symbol'].tolist()
+                self.data[period] = (endpoint_data, {ticker: i for i, ticker in enumerate(tickers)},
+                                     n_periods)
+
+            return self.data[period]
+
+    def _records(self, df):
+        records = df.astype(object).where(df.notna(), None).to_dict('records')
+
+        if self.malformed_date_rate and 'date' in df:
+            rng = random.Random()
+            for record in records:
+                if rng.random() < self.malformed_date_rate:
+                    record['date'] = rng.choice(MALFORMED_DATES)
+
+        return records
+
+    def _body(self, endpoint, ticker, period):
+        key = (endpoint, ticker, period)
+
+        # Bodies are cached, except when dates are corrupted at random on every request
+        if key in self.bodies:
+            return self.bodies[key]
+
+        endpoint_data, rows, n_periods = self._endpoint_data(period)
+
+        if endpoint == 'stock/list':
+            payload = self._records(endpoint_data[endpoint])
+
+        elif ticker not in rows:
+            payload = {} if endpoint == 'company/profile' else []
+
+        elif endpoint == 'company/profile':
+            record = self._records(endpoint_data[endpoint].iloc[rows[ticker]:rows[ticker] + 1])[0]
+            payload = {'symbol': record.pop('symbol'),
+                       'profile': {x.split('.', 1)[1]: value for x, value in record.items()}}
+
+        else:
+            start = rows[ticker] * n_periods
+            # FMP lists the most recent report first
+            payload = self._records(endpoint_data[endpoint].iloc[start:start + n_periods])[::-1]
+
+        body = json.dumps(payload).encode('utf-8')
+
+        if not self.malformed_date_rate:
+            self.bodies[key] = body
+
+        return body
+
+    def respond(self, path):
+        """
+        Build the response to a GET request.
+
+        :param path: Request path and query string
+        :return: Tuple of status code, body and extra headers
+        :rtype: tuple
+        """
+        with self.lock:
+            self.requests += 1
+
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+
+        if self.bucket is not None and not self.bucket.try_acquire():
+            with self.lock:
+                self.rate_limited += 1
+            body = json.dumps({'Error Message': 'Limit Reach . Please upgrade your plan or '
+                                                'visit our documentation for more details'})
+            retry_after = max(1, int(np.ceil(1 / self.bucket.rate)))
+            return 429, body.encode('utf-8'), {'Retry-After': str(retry_after)}
+
+        parts = urlsplit(path)
+        query = parse_qs(parts.query)
+
+        if self.api_key is not None and query.get('apikey', [None])[0] != self.api_key:
+            body = json.dumps({'Error Message': 'Invalid API KEY. Please retry or visit our '
+                                                'documentation to create one FREE '
+                                                'https://financialmodelingprep.com/developer/docs'})
+            return 200, body.encode('utf-8'), {}
+
+        if not parts.path.startswith(API_ROOT):
+            return 404, b'{}', {}
+
+        route = parts.path[len(API_ROOT):].strip('/')
+        period = query.get('period', ['annual'])[0]
+
+        if route == 'stock/list':
+            return 200, self._body(route, None, 'annual'), {}
+
+        endpoint, _, ticker = route.rpartition('/')
+
+        if endpoint == 'company/profile':
+            return 200, self._body(endpoint, ticker, 'annual'), {}
+
+        if endpoint in STATEMENT_ENDPOINTS:
+            return 200, self._body(endpoint, ticker, 'quarter' if period == 'quarter'
+                                   else 'annual'), {}
+
+        return 404, b'{}', {}
+
+    def start(self):
+        """
+        Serve requests from a background thread.
+
+        :return: The running server
+        :rtype: FMPServer
+        """
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+        return self
+
+    def stop(self):
+        """
+        Stop serving requests and close the listening socket.
+
+        :return: None
+        """
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+        return None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Local FinancialModelingPrep stand-in server')
+    parser.add_argument('--tickers', type=int, default=1000)
+    parser.add_argument('--periods', type=int, default=11)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--requests-per-minute', type=int, default=None)
+    parser.add_argument('--malformed-dates', type=float, default=0.0)
+    parser.add_argument('--api-key', default=None)
+    options = parser.parse_args()
+
+    server = FMPServer(options.tickers, options.periods, host=options.host, port=options.port,
+                       latency=options.latency, jitter=options.jitter,
+                       requests_per_minute=options.requests_per_minute,
+                       malformed_date_rate=options.malformed_dates, api_key=options.api_key)
+
+    print('Serving ' + str(options.tickers) + ' synthetic companies at ' + server.base_url)
+
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,251 @@
+import json
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Fields returned by each FinancialModelingPrep endpoint, nested fields use '.' separators
+ENDPOINT_FIELDS = {'stock/list': ['symbol', 'name', 'price', 'exchange'],
+                   'company/profile': ['symbol', 'profile.price', 'profile.beta', 'profile.volAvg',
+                                       'profile.mktCap', 'profile.lastDiv', 'profile.range',
+                                       'profile.changes', 'profile.changesPercentage',
+                                       'profile.companyName', 'profile.exchange',
+                                       'profile.exchangeShortName', 'profile.industry',
+                                       'profile.website', 'profile.description', 'profile.ceo',
+                                       'profile.sector', 'profile.image'],
+                   'income-statement': ['date', 'symbol', 'fillingDate', 'acceptedDate', 'period',
+                                        'revenue', 'costOfRevenue', 'grossProfit',
+                                        'grossProfitRatio', 'researchAndDevelopmentExpenses',
+                                        'generalAndAdministrativeExpenses',
+                                        'sellingAndMarketingExpenses', 'otherExpenses',
+                                        'operatingExpenses', 'costAndExpenses', 'interestExpense',
+                                        'depreciationAndAmortization', 'ebitda', 'ebitdaratio',
+                                        'operatingIncome', 'operatingIncomeRatio',
+                                        'totalOtherIncomeExpensesNet', 'incomeBeforeTax',
+                                        'incomeBeforeTaxRatio', 'incomeTaxExpense', 'netIncome',
+                                        'netIncomeRatio', 'eps', 'epsdiluted',
+                                        'weightedAverageShsOut', 'weightedAverageShsOutDil',
+                                        'link', 'finalLink'],
+                   'balance-sheet-statement': ['date', 'symbol', 'fillingDate', 'acceptedDate',
+                                               'period', 'cashAndCashEquivalents',
+                                               'shortTermInvestments',
+                                               'cashAndShortTermInvestments', 'netReceivables',
+                                               'inventory', 'otherCurrentAssets',
+                                               'totalCurrentAssets', 'propertyPlantEquipmentNet',
+                                               'goodwill', 'intangibleAssets',
+                                               'goodwillAndIntangibleAssets',
+                                               'longTermInvestments', 'taxAssets',
+                                               'otherNonCurrentAssets', 'totalNonCurrentAssets',
+                                               'otherAssets', 'totalAssets', 'accountPayables',
+                                               'shortTermDebt', 'taxPayables', 'deferredRevenue',
+                                               'otherCurrentLiabilities',
+                                               'totalCurrentLiabilities', 'longTermDebt',
+                                               'deferredRevenueNonCurrent',
+                                               'deferredTaxLiabilitiesNonCurrent',
+                                               'otherNonCurrentLiabilities',
+                                               'totalNonCurrentLiabilities', 'otherLiabilities',
+                                               'totalLiabilities', 'commonStock',
+                                               'retainedEarnings',
+                                               'accumulatedOtherComprehensiveIncomeLoss',
+                                               'othertotalStockholdersEquity',
+                                               'totalStockholdersEquity',
+                                               'totalLiabilitiesAndStockholdersEquity',
+                                               'totalInvestments', 'totalDebt', 'netDebt', 'link',
+                                               'finalLink'],
+                   'cash-flow-statement': ['date', 'symbol', 'fillingDate', 'acceptedDate',
+                                           'period', 'netIncome', 'depreciationAndAmortization',
+                                           'deferredIncomeTax', 'stockBasedCompensation',
+                                           'changeInWorkingCapital', 'accountsReceivables',
+                                           'accountsPayables', 'otherWorkingCapital',
+                                           'otherNonCashItems',
+                                           'netCashProvidedByOperatingActivities',
+                                           'investmentsInPropertyPlantAndEquipment',
+                                           'acquisitionsNet', 'purchasesOfInvestments',
+                                           'salesMaturitiesOfInvestments',
+                                           'otherInvestingActivites',
+                                           'netCashUsedForInvestingActivites', 'debtRepayment',
+                                           'commonStockIssued', 'commonStockRepurchased',
+                                           'dividendsPaid', 'otherFinancingActivites',
+                                           'netCashUsedProvidedByFinancingActivities',
+                                           'effectOfForexChangesOnCash', 'netChangeInCash',
+                                           'cashAtEndOfPeriod', 'cashAtBeginningOfPeriod',
+                                           'operatingCashFlow', 'capitalExpenditure',
+                                           'freeCashFlow', 'link', 'finalLink'],
+                   'ratios': ['symbol', 'date', 'currentRatio', 'quickRatio', 'cashRatio',
+                              'daysOfSalesOutstanding', 'daysOfInventoryOutstanding',
+                              'operatingCycle', 'daysOfPayablesOutstanding', 'cashConversionCycle',
+                              'grossProfitMargin', 'operatingProfitMargin', 'pretaxProfitMargin',
+                              'netProfitMargin', 'effectiveTaxRate', 'returnOnAssets',
+                              'returnOnEquity', 'returnOnCapitalEmployed', 'netIncomePerEBT',
+                              'ebtPerEbit', 'ebitPerRevenue', 'debtRatio', 'debtEquityRatio',
+                              'longTermDebtToCapitalization', 'totalDebtToCapitalization',
+                              'interestCoverage', 'cashFlowToDebtRatio', 'companyEquityMultiplier',
+                              'receivablesTurnover', 'payablesTurnover', 'inventoryTurnover',
+                              'fixedAssetTurnover', 'assetTurnover', 'operatingCashFlowPerShare',
+                              'freeCashFlowPerShare', 'cashPerShare', 'payoutRatio',
+                              'operatingCashFlowSalesRatio', 'freeCashFlowOperatingCashFlowRatio',
+                              'cashFlowCoverageRatios', 'shortTermCoverageRatios',
+                              'capitalExpenditureCoverageRatio',
+                              'dividendPaidAndCapexCoverageRatio', 'dividendPayoutRatio',
+                              'priceBookValueRatio', 'priceToBookRatio', 'priceToSalesRatio',
+                              'priceEarningsRatio', 'priceToFreeCashFlowsRatio',
+                              'priceToOperatingCashFlowsRatio', 'priceCashFlowRatio',
+                              'priceEarningsToGrowthRatio', 'priceSalesRatio', 'dividendYield',
+                              'enterpriseValueMultiple', 'priceFairValue'],
+                   'key-metrics': ['symbol', 'date', 'revenuePerShare', 'netIncomePerShare',
+                                   'operatingCashFlowPerShare', 'freeCashFlowPerShare',
+                                   'cashPerShare', 'bookValuePerShare',
+                                   'tangibleBookValuePerShare', 'shareholdersEquityPerShare',
+                                   'interestDebtPerShare', 'marketCap', 'enterpriseValue',
+                                   'peRatio', 'priceToSalesRatio', 'pocfratio', 'pfcfRatio',
+                                   'pbRatio', 'ptbRatio', 'evToSales', 'enterpriseValueOverEBITDA',
+                                   'evToOperatingCashFlow', 'evToFreeCashFlow', 'earningsYield',
+                                   'freeCashFlowYield', 'debtToEquity', 'debtToAssets',
+                                   'netDebtToEBITDA', 'currentRatio', 'interestCoverage',
+                                   'incomeQuality', 'dividendYield', 'payoutRatio',
+                                   'salesGeneralAndAdministrativeToRevenue',
+                                   'researchAndDdevelopementToRevenue', 'intangiblesToTotalAssets',
+                                   'capexToOperatingCashFlow', 'capexToRevenue',
+                                   'capexToDepreciation', 'stockBasedCompensationToRevenue',
+                                   'grahamNumber', 'roic', 'returnOnTangibleAssets',
+                                   'grahamNetNet', 'workingCapital', 'tangibleAssetValue',
+                                   'netCurrentAssetValue', 'investedCapital', 'averageReceivables',
+                                   'averagePayables', 'averageInventory', 'daysSalesOutstanding',
+                                   'daysPayablesOutstanding', 'daysOfInventoryOnHand',
+                                   'receivablesTurnover', 'payablesTurnover', 'inventoryTurnover',
+                                   'roe', 'capexPerShare'],
+                   'enterprise-values': ['symbol', 'date', 'stockPrice', 'numberOfShares',
+                                         'marketCapitalization', 'minusCashAndCashEquivalents',
+                                         'addTotalDebt', 'enterpriseValue'],
+                   'financial-growth': ['symbol', 'date', 'revenueGrowth', 'grossProfitGrowth',
+                                        'ebitgrowth', 'operatingIncomeGrowth', 'netIncomeGrowth',
+                                        'epsgrowth', 'epsdilutedGrowth',
+                                        'weightedAverageSharesGrowth',
+                                        'weightedAverageSharesDilutedGrowth',
+                                        'dividendsperShareGrowth', 'operatingCashFlowGrowth',
+                                        'freeCashFlowGrowth', 'tenYRevenueGrowthPerShare',
+                                        'fiveYRevenueGrowthPerShare',
+                                        'threeYRevenueGrowthPerShare',
+                                        'tenYOperatingCFGrowthPerShare',
+                                        'fiveYOperatingCFGrowthPerShare',
+                                        'threeYOperatingCFGrowthPerShare',
+                                        'tenYNetIncomeGrowthPerShare',
+                                        'fiveYNetIncomeGrowthPerShare',
+                                        'threeYNetIncomeGrowthPerShare',
+                                        'tenYShareholdersEquityGrowthPerShare',
+                                        'fiveYShareholdersEquityGrowthPerShare',
+                                        'threeYShareholdersEquityGrowthPerShare',
+                                        'tenYDividendperShareGrowthPerShare',
+                                        'fiveYDividendperShareGrowthPerShare',
+                                        'threeYDividendperShareGrowthPerShare',
+                                        'receivablesGrowth', 'inventoryGrowth', 'assetGrowth',
+                                        'bookValueperShareGrowth', 'debtGrowth', 'rdexpenseGrowth',
+                                        'sgaexpensesGrowth']}
+
+
+def loads(data):
+    """
+    Decode a JSON response, using orjson when it is installed.
+
+    :param data: Raw response body
+    :return: Decoded JSON
+    :rtype: list or dict
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+
+    return json.loads(data.decode('utf-8') if isinstance(data, bytes) else data)
+
+
+def flatten_record(record, prefix=''):
+    """
+    Flatten nested dictionaries into a single level, joining keys with '.' the same way
+    pandas.json_normalize does. Ex: {'profile': {'sector': x}} -> {'profile.sector': x}
+
+    :param record: Dictionary decoded from an API response
+    :param prefix: Key prefix applied to every field
+    :return: Flat dictionary
+    :rtype: dict
+    """
+    flat = {}
+
+    for key, value in record.items():
+        if isinstance(value, dict):
+            flat.update(flatten_record(value, prefix + key + '.'))
+        else:
+            flat[prefix + key] = value
+
+    return flat
+
+
+class FrameBuilder:
+    """
+    Collect API records into per-column buffers and build one DataFrame at the end, so building
+    a frame from N responses costs one pass over the records instead of N concatenations.
+
+    :param fields: Expected fields, in column order. Fields not listed are still kept, appended
+           in the order they are first seen, and expected fields never seen are left out
+    """
+
+    def __init__(self, fields=()):
+        self.columns = {field: [] for field in fields}
+        self.seen = set()
+        self.rows = 0
+
+    def add(self, data):
+        """
+        Append every record in a decoded API response.
+
+        :param data: Decoded JSON response, a list of records or a single record
+        :return: None
+        """
+        records = data if isinstance(data, list) else [data]
+
+        for record in records:
+
+            # Empty records carry no data, nested records need flattening first
+            if not record:
+                continue
+            if any(isinstance(value, dict) for value in record.values()):
+                record = flatten_record(record)
+
+            for field in [x for x in record if x not in self.columns]:
+                self.columns[field] = [None] * self.rows
+
+            self.seen.update(record.keys())
+
+            for field, values in self.columns.items():
+                values.append(record.get(field))
+
+            self.rows += 1
+
+        return None
+
+    def to_frame(self):
+        """
+        Build the DataFrame from the collected records.
+
+        :return: DataFrame with one row per record
+        :rtype: pandas.DataFrame
+        """
+        return pd.DataFrame({field: values for field, values in self.columns.items()
+                             if field in self.seen})
+
+
+def build_frame(responses, endpoint=None):
+    """
+    Build one DataFrame from many decoded API responses.
+
+    :param responses: Iterable of decoded JSON responses
+    :param endpoint: API endpoint the responses came from, used to look up expected fields
+    :return: DataFrame with one row per record
+    :rtype: pandas.DataFrame
+    """
+    builder = FrameBuilder(ENDPOINT_FIELDS.get(endpoint, ()))
+
+    for data in responses:
+        builder.add(data)
+
+    return builder.to_frame()
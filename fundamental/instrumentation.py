@@ -0,0 +1,315 @@
+import atexit
+import collections
+import cProfile
+import functools
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+logger = logging.getLogger('fundamental')
+trace_logger = logging.getLogger('fundamental.trace')
+
+# 0 silences progress messages (batch runs), 1 shows them, 2 adds one JSON record per stage
+VERBOSITY_LEVELS = {0: logging.WARNING, 1: logging.INFO, 2: logging.DEBUG}
+
+COUNTERS = ['http_requests', 'http_bytes', 'http_retries', 'cache_hits', 'cache_misses']
+
+# Most recent stage records kept, long-running processes (ex: the service) record stages forever
+TRACE_LIMIT = 10000
+
+
+class _StdoutHandler(logging.StreamHandler):
+    """
+    Write messages to whatever sys.stdout currently is, the same place print() writes to.
+    """
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+_handler = _StdoutHandler()
+_handler.setFormatter(logging.Formatter('%(message)s'))
+
+
+def set_verbosity(verbosity=None):
+    """
+    Choose which progress messages are written to stdout. Scripts call this, applications that
+    import the package keep their own logging configuration.
+
+    :param verbosity: 0 for warnings only, 1 for progress messages, 2 to add per-stage trace
+           records. Defaults to the FUNDAMENTAL_VERBOSITY environment variable, or 1
+    :return: None
+    """
+    if verbosity is None:
+        verbosity = os.environ.get('FUNDAMENTAL_VERBOSITY', 1)
+
+    logger.setLevel(VERBOSITY_LEVELS[max(0, min(2, int(verbosity)))])
+
+    if _handler not in logger.handlers:
+        logger.addHandler(_handler)
+        logger.propagate = False
+
+    return None
+
+
+class unique_symbols:
+    """
+    Number of unique stock tickers in a DataFrame, only counted if a log message including it is
+    actually written. Ex: logger.info('Found %s companies', unique_symbols(df))
+    """
+
+    def __init__(self, df):
+        self.df = df
+
+    def __str__(self):
+        return str(self.df['symbol'].nunique())
+
+
+_counters = dict.fromkeys(COUNTERS, 0)
+_counter_lock = threading.Lock()
+
+
+def count(name, value=1, stages=None):
+    """
+    Add to a process-wide counter and to the stages running on this thread, ex:
+    count('http_bytes', len(body)).
+
+    :param name: Counter name, one of COUNTERS
+    :param value: Amount to add
+    :param stages: Stages to add to instead of this thread's, for work a stage hands to worker
+           threads (see active_stages)
+    :return: None
+    """
+    with _counter_lock:
+        _counters[name] += value
+        for stage in active_stages() if stages is None else stages:
+            stage.counts[name] += value
+
+    return None
+
+
+def counters():
+    """
+    Snapshot of every process-wide counter.
+
+    :return: Dictionary mapping counter names to values
+    :rtype: dict
+    """
+    with _counter_lock:
+        return dict(_counters)
+
+
+def _peak_rss():
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+_trace = collections.deque(maxlen=TRACE_LIMIT)
+_finished = itertools.count(1)
+_local = threading.local()
+_profile = {'directory': os.environ.get('FUNDAMENTAL_PROFILE_DIR'), 'stages': None}
+
+
+def active_stages():
+    """
+    Stages running on this thread, outermost first.
+
+    :return: Tuple of Stages
+    :rtype: tuple
+    """
+    return tuple(_local.__dict__.get('stack', ()))
+
+
+def set_profile_dir(directory, stages=None):
+    """
+    Profile stages with cProfile and write one .prof file per stage run to a directory, for
+    inspection with pstats or snakeviz. Profiling adds overhead, so leave it off in batch runs.
+
+    :param directory: Directory that profiles should be written to, None disables profiling
+    :param stages: Optional list of stage names to profile, defaults to outermost stages only
+    :return: None
+    """
+    _profile['directory'] = directory
+    _profile['stages'] = set(stages) if stages is not None else None
+
+    return None
+
+
+class Stage:
+    """
+    Measure one run of a pipeline stage: wall time, CPU time, growth of the process's peak RSS,
+    rows in and out, and the HTTP requests, bytes, retries and cache hits it made. Stages can be
+    nested, and each finished stage is appended to the trace, which keeps the last TRACE_LIMIT.
+
+    :param name: Stage name, ex: 'main.screen_stocks'
+    :param rows_in: Number of rows the stage was given, if applicable
+    """
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.profiler = None
+        # Counted per stage, stages running at the same time on other threads don't mix
+        self.counts = dict.fromkeys(COUNTERS, 0)
+
+    def __enter__(self):
+        stack = _local.__dict__.setdefault('stack', [])
+        self.parent = stack[-1].name if stack else None
+
+        profiled = _profile['directory'] is not None and not any(x.profiler for x in stack) \
+            and (self.name in _profile['stages'] if _profile['stages'] is not None
+                 else not stack)
+
+        stack.append(self)
+
+        self.peak_rss = _peak_rss()
+        self.started = time.time()
+        self.cpu = time.process_time()
+        self.wall = time.perf_counter()
+
+        if profiled:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.profiler is not None:
+            self.profiler.disable()
+
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        peak_rss = _peak_rss()
+
+        _local.stack.pop()
+
+        record = {'stage': self.name,
+                  'parent': self.parent,
+                  'started': round(self.started, 3),
+                  'wall_seconds': round(wall, 6),
+                  'cpu_seconds': round(cpu, 6),
+                  'peak_rss_delta_mb': None if peak_rss is None
+                  else round((peak_rss - self.peak_rss) / 1e6, 3),
+                  'rows_in': self.rows_in,
+                  'rows_out': self.rows_out,
+                  'failed': exc_type is not None}
+
+        with _counter_lock:
+            record.update(self.counts)
+
+        lookups = record['cache_hits'] + record['cache_misses']
+        record['cache_hit_rate'] = round(record['cache_hits'] / lookups, 4) if lookups else None
+
+        _trace.append(record)
+        trace_logger.debug('%s', json.dumps(record))
+        number = next(_finished)
+
+        if self.profiler is not None:
+            os.makedirs(_profile['directory'], exist_ok=True)
+            self.profiler.dump_stats(os.path.join(_profile['directory'], self.name + '-'
+                                                  + str(number) + '.prof'))
+
+        return False
+
+
+def _rows(value):
+    if isinstance(value, (pd.DataFrame, pd.Series, list, dict)):
+        return len(value)
+
+    if isinstance(value, tuple):
+        for item in value:
+            if isinstance(item, (pd.DataFrame, pd.Series)):
+                return len(item)
+
+    return None
+
+
+def instrument(name=None):
+    """
+    Decorate a function so every call is measured as a Stage. Rows in are taken from the first
+    DataFrame argument and rows out from the return value.
+
+    :param name: Stage name, defaults to '<module>.<function>'
+    :return: Decorator
+    """
+
+    def decorate(func):
+        # Functions of a module run as a script (python -m fundamental.main) keep its name
+        module = func.__module__ if func.__module__ != '__main__' \
+            else os.path.splitext(os.path.basename(sys.modules['__main__'].__file__))[0]
+        stage_name = name or module.rsplit('.', 1)[-1] + '.' + func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            rows_in = next((len(x) for x in list(args) + list(kwargs.values())
+                            if isinstance(x, pd.DataFrame)), None)
+
+            with Stage(stage_name, rows_in) as stage:
+                result = func(*args, **kwargs)
+                stage.rows_out = _rows(result)
+
+            return result
+
+        return wrapper
+
+    return decorate
+
+
+def trace():
+    """
+    The last TRACE_LIMIT stages recorded, in the order they finished.
+
+    :return: List of stage records
+    :rtype: List
+    """
+    return list(_trace)
+
+
+def reset_trace():
+    """
+    Forget every recorded stage.
+
+    :return: None
+    """
+    _trace.clear()
+
+    return None
+
+
+def write_trace(path):
+    """
+    Write the recorded stages and the process-wide counters to a JSON file.
+
+    :param path: Destination file path
+    :return: Path of the file written
+    :rtype: str
+    """
+    with open(path, 'w') as file:
+        json.dump({'stages': trace(), 'counters': counters()}, file, indent=2)
+
+    return path
+
+
+# Scheduled runs can collect a trace without code changes: FUNDAMENTAL_TRACE=trace.json
+if os.environ.get('FUNDAMENTAL_TRACE'):
+    atexit.register(write_trace, os.environ['FUNDAMENTAL_TRACE'])
@@ -1,24 +1,40 @@
-from fundamental import config
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from fundamental import api_client
 from fundamental import company_profiles as profiles
 from fundamental import company_financials as financials
 from fundamental import company_fundamentals as fundamentals
-
+from fundamental import partitions
+from fundamental import pipeline
+from fundamental import storage
+from fundamental import valuation_scenarios as scenarios
+from fundamental.instrumentation import instrument, set_verbosity
+from fundamental.response_cache import ResponseCache
+
+import logging
+import multiprocessing
 import pandas as pd
+import os
+
+# Named explicitly, run as a script (python -m fundamental.main) __name__ is '__main__'
+logger = logging.getLogger('fundamental.main')
 
 
-def prepare_company_profiles(price_filter, dir_path, api_key):
+@instrument()
+def prepare_company_profiles(price_filter, dir_path, api_key, cache=None, file_format='csv'):
     """
     Build company profiles for stock tickers that meet price and exchange requirements.
     Reference: https://financialmodelingprep.com/developer/docs/#Company-Profile
 
     :param price_filter: The minimum stock price a user is willing to consider
-    :param dir_path: Specifies name of directory that csv files should be written to
+    :param dir_path: Specifies name of directory that data files should be written to
     :param api_key: FinancialModelingPrep API key
+    :param cache: Optional ResponseCache that API responses should be served from / stored in
+    :param file_format: Storage format of the profile file - 'csv', 'parquet' or 'feather'
     :return: None
     """
 
     # Retrieve all available stock tickers from the FMP API
-    data = profiles.get_company_data(api_key)
+    data = profiles.get_company_data(api_key, cache)
     # Drop rows with 1 or more null values (cols: "symbol", "name", "price", "exchange")
     data.dropna(axis=0, how='any', inplace=True)
     # Only retain stocks listed on major exchanges
@@ -26,80 +42,373 @@ def prepare_company_profiles(price_filter, dir_path, api_key):
     # Only retain stocks with a price greater than or equal to the provided price filter
     data = profiles.select_minimum_price(data, price_filter)
     # Retrieve company profile data for remaining stock tickers
-    profiles.create_company_profile(data, dir_path, api_key)
+    profiles.create_company_profile(data, dir_path, api_key, cache=cache, file_format=file_format)
 
     return None
 
 
+@instrument()
 def get_company_financials(file_path, request_list, review_period, report_year, eval_period,
-                           dir_path, api_key):
+                           dir_path, api_key, cache=None, incremental=False, file_format='csv',
+                           sectors=None, industries=None, shard_by='sector', n_shards=8,
+                           max_processes=None,
+                           requests_per_minute=api_client.REQUESTS_PER_MINUTE, base_url=None):
     """
     Retrieve, clean, subset, and store company financial data in the specified directory.
+    Companies are split into shards by sector or ticker hash, and each shard is retrieved,
+    cleaned and subset in its own process before the shards are merged into one data file per
+    request. A shard that fails is reported and skipped, the others are still stored.
 
     :param file_path: File path to company profile data generated by the function above
     :param request_list: List of financial data to request from the FMP API
     :param review_period: Frequency of financial statements - 'annual' or 'quarter'
     :param report_year: Year of most recent financial report desired
     :param eval_period: Number of years prior to most recent report to be analyzed (max = 10)
-    :param dir_path: Directory path where csv files should be stored
+    :param dir_path: Directory path where data files should be stored
     :param api_key: FinancialModelingPrep API key
-    :return: None
+    :param cache: Optional ResponseCache that API responses should be served from / stored in
+    :param incremental: If True, only retrieve companies that are missing from, or missing years
+           in, previously stored data files and merge them into the stored data
+    :param file_format: Storage format of the data files - 'csv', 'parquet' or 'feather'
+    :param sectors: Optional list of sectors to retain, defaults to every sector
+    :param industries: Optional list of industries to retain, defaults to every industry
+    :param shard_by: 'sector' for one shard per sector, 'ticker' for n_shards shards keyed by a
+           hash of the stock ticker, or None to retrieve every company in this process
+    :param n_shards: Number of shards when sharding by ticker
+    :param max_processes: Number of shards processed at once, defaults to the CPU count
+    :param requests_per_minute: Maximum number of API requests issued per minute, split evenly
+           between the processes shards are retrieved in when there's more than one
+    :param base_url: Optional API root overriding api_client.BASE_URL, defaults to its value in
+           this process, which spawned shard processes wouldn't otherwise see
+    :return: Names of the shards that failed, their companies keep any previously stored data.
+             Raises RuntimeError if every shard failed
+    :rtype: List
     """
 
     # Read in company profile data generated by the function above
-    company_profiles = pd.read_csv(file_path)
-    # Subset DataFrame to companies in the provided sectors (*args)
-    sector_companies = financials.select_sector(company_profiles, 'Consumer Cyclical')
+    company_profiles = storage.read_data(file_path)
+    # Subset DataFrame to companies in the provided sectors and industries
+    if sectors is not None:
+        company_profiles = financials.select_sector(company_profiles, *sectors)
+    if industries is not None:
+        company_profiles = financials.select_industries(company_profiles, *industries)
+
+    extension = storage.FILE_FORMATS[file_format]
+    request_companies = {}
+    stored_data = {}
 
     for request in request_list:
-        # Retrieve financial data described in the list above on an annual or quarterly basis
-        raw_data = financials.get_financial_data(sector_companies, request, review_period, api_key)
-        # Remove rows with corrupted date values, create new year column
-        clean_data = financials.clean_financial_data(raw_data)
-        # Subset financial data to the date range provided
-        subset_data = financials.select_analysis_years(clean_data, report_year, eval_period)
+        filename = dir_path + request + '-' + str(eval_period) + 'Y' + extension
+        request_companies[request] = company_profiles
+
+        if incremental and os.path.exists(filename):
+            # Only request companies whose stored data doesn't cover the evaluation period
+            stored_data[request] = storage.read_data(filename)
+            request_companies[request] = financials.select_refresh_tickers(
+                stored_data[request], company_profiles, report_year, eval_period)
+
+    request_companies = {x: df for x, df in request_companies.items() if not df.empty}
+
+    # Each shard holds, per request, the companies to retrieve and their stored rows
+    shards = {}
+    for request, companies in request_companies.items():
+        if shard_by == 'sector':
+            keys = companies['profile.sector'].fillna('Unknown').astype(str)
+        elif shard_by == 'ticker':
+            keys = pd.Series(partitions.partition_of(companies['symbol'], n_shards),
+                             index=companies.index).map('shard-{}'.format)
+        else:
+            keys = pd.Series('all', index=companies.index)
+
+        for key, shard_companies in companies.groupby(keys, sort=True):
+            stored = stored_data.get(request)
+            if stored is not None:
+                stored = stored[stored['symbol'].isin(shard_companies['symbol'])]
+            shards.setdefault(key, ({}, {}))
+            shards[key][0][request] = shard_companies
+            shards[key][1][request] = stored
+
+    shard_data = {}
+    failed_shards = []
+    last_error = None
+
+    if shards:
+        n_processes = min(len(shards), max_processes or os.cpu_count() or 1)
+        # Shards fetch at the same time, together they stay within the plan's rate limit
+        shard_rate = requests_per_minute / n_processes
+        shard_args = (review_period, report_year, eval_period, api_key, shard_rate, cache,
+                      base_url or api_client.BASE_URL)
+
+        if n_processes == 1:
+            for key, (companies, stored) in shards.items():
+                try:
+                    shard_data[key] = financials.get_shard_data(companies, stored, *shard_args)
+                except Exception as error:
+                    logger.warning('Failed to retrieve the %s shard', key, exc_info=True)
+                    failed_shards.append(key)
+                    last_error = error
+
+        else:
+            # Spawned rather than forked, this may run in a thread next to other pipeline steps
+            with ProcessPoolExecutor(max_workers=n_processes,
+                                     mp_context=multiprocessing.get_context('spawn')) as executor:
+                futures = {executor.submit(financials.get_shard_data, companies, stored,
+                                           *shard_args): key
+                           for key, (companies, stored) in shards.items()}
+
+                for future in as_completed(futures):
+                    try:
+                        shard_data[futures[future]] = future.result()
+                    except Exception as error:
+                        logger.warning('Failed to retrieve the %s shard', futures[future],
+                                       exc_info=True)
+                        failed_shards.append(futures[future])
+                        last_error = error
+
+        # Nothing was retrieved, there's no partial result worth writing or reporting
+        if not shard_data:
+            raise RuntimeError('Failed to retrieve all ' + str(len(shards)) + ' shards of '
+                               + ', '.join(request_companies)) from last_error
+
+    for request in request_companies:
+        frames = [shard_data[key][request] for key in sorted(shard_data)
+                  if request in shard_data[key]]
+        retrieved = set()
+        for key in shard_data:
+            if request in shard_data[key]:
+                retrieved.update(shards[key][0][request]['symbol'])
+
+        # Stored companies that weren't retrieved again, or whose shard failed, are kept as is
+        filename = dir_path + request + '-' + str(eval_period) + 'Y' + extension
+        failed_companies = [shards[key][0][request]['symbol'] for key in failed_shards
+                            if request in shards[key][0]]
+        if request not in stored_data and failed_companies and os.path.exists(filename):
+            # A full refresh only keeps the stored rows of the failed shards' companies
+            stored = storage.read_data(filename)
+            stored_data[request] = stored[stored['symbol'].isin(pd.concat(failed_companies))]
+
+        if request in stored_data:
+            kept_data = stored_data[request][~stored_data[request]['symbol'].isin(retrieved)]
+            if review_period == 'quarter':
+                frames.insert(0, financials.select_analysis_quarters(kept_data, report_year,
+                                                                     eval_period))
+            else:
+                frames.insert(0, financials.select_analysis_years(kept_data, report_year,
+                                                                  eval_period))
+
+        if not frames:
+            continue
+
+        subset_data = pd.concat(frames, ignore_index=True)
+        if subset_data.empty:
+            continue
+
         # Save financial data to data directory for further analysis
         evaluation_period = subset_data.year.max() - subset_data.year.min()
-        filename = dir_path + request + '-' + str(evaluation_period) + 'Y' + '.csv'
-        subset_data.to_csv(filename, index=False, header=True)
+        filename = dir_path + request + '-' + str(evaluation_period) + 'Y'
+        storage.write_data(subset_data, filename, file_format)
 
-    return None
+    return sorted(failed_shards)
 
 
-def screen_stocks(dir_path, year_pattern, report_year, eval_period, criteria, stat, *args):
+@instrument()
+def load_screening_data(dir_path, year_pattern, report_year, eval_period, stat, *args,
+                        file_format='csv', columns=None, compact=False, peer_columns=None):
     """
-    Read financial data, calculate performance stats, and screen stocks accordingly.
+    Read financial data once and calculate the performance stats that screens are applied to.
 
     :param dir_path: Path to directory that contains csv files to be read in
     :param year_pattern: File name pattern indicating how many years of historical data the csv
            file should include
     :param report_year: Year of most recent financial report desired
     :param eval_period: Number of years prior to most recent report to be analyzed (max = 10)
-    :param criteria: Dictionary containing the column name and quantitative range desired for
-           that column
-    :param stat: Statistic to calculate on col in col_list ('mean', 'median', or 'percent change')
-    :param args: List of columns that statistical calculation should apply to
-    :return: Subset of financial_data, containing only qualified stocks
-    :rtype: pandas.DataFrame
+    :param stat: Statistic to calculate on col in col_list ('mean', 'median', or 'percent change'),
+           or a dictionary mapping columns to lists of statistics, ex: {'roe': ['mean', 'median']}
+    :param args: List of columns that statistical calculation should apply to (ignored when stat
+           is a dictionary)
+    :param file_format: Storage format of the data files - 'csv', 'parquet' or 'feather'
+    :param columns: Optional list of columns to load, defaults to every available column
+    :param compact: If True, store text as categoricals and downcast numeric columns where lossless
+    :param peer_columns: Optional list of columns to compare with sector and industry peers, see
+           company_fundamentals.calculate_peer_stats
+    :return: Historical financial data, and report year data joined with the performance stats
+    :rtype: Tuple
     """
 
-    # Read and join all csv files in the provided directory that match a specific pattern, ex: '10Y'
-    financial_data = fundamentals.combine_data(dir_path, year_pattern)
+    # Read and join all data files in the provided directory that match a specific pattern,
+    # ex: '10Y'
+    financial_data = fundamentals.combine_data(dir_path, year_pattern, file_format, columns)
+    # Shrink the combined dataset's memory footprint if requested
+    if compact:
+        financial_data = fundamentals.compact_data(financial_data)
     # Subset DataFrame to the trailing twelve months of data for screening purposes
     ttm_data = financial_data[financial_data.year == report_year]
 
     # Calculate the N-YEAR mean, median, or percent change of a given set of columns
-    performance_stats = fundamentals.calculate_stats(financial_data, stat, report_year,
-                                                     eval_period, *args)
+    if isinstance(stat, dict):
+        performance_stats = fundamentals.calculate_multiple_stats(financial_data, report_year,
+                                                                  eval_period, stat)
+    else:
+        performance_stats = fundamentals.calculate_stats(financial_data, stat, report_year,
+                                                         eval_period, *args)
     ttm_data = ttm_data.merge(performance_stats, on=['symbol', 'year'], how='inner')
 
+    # Add sector and industry percentile, z-score and median columns, ex: 'roe sector pct'
+    if peer_columns:
+        ttm_data = fundamentals.calculate_peer_stats(ttm_data, peer_columns)
+
+    return financial_data, ttm_data
+
+
+@instrument()
+def screen_stocks(dir_path, year_pattern, report_year, eval_period, criteria, stat, *args,
+                  file_format='csv', columns=None, peer_columns=None):
+    """
+    Read financial data, calculate performance stats, and screen stocks accordingly.
+
+    :param dir_path: Path to directory that contains csv files to be read in
+    :param year_pattern: File name pattern indicating how many years of historical data the csv
+           file should include
+    :param report_year: Year of most recent financial report desired
+    :param eval_period: Number of years prior to most recent report to be analyzed (max = 10)
+    :param criteria: Dictionary containing the column name and quantitative range desired for
+           that column
+    :param stat: Statistic to calculate on col in col_list ('mean', 'median', or 'percent change'),
+           or a dictionary mapping columns to lists of statistics, ex: {'roe': ['mean', 'median']}
+    :param args: List of columns that statistical calculation should apply to (ignored when stat
+           is a dictionary)
+    :param file_format: Storage format of the data files - 'csv', 'parquet' or 'feather'
+    :param columns: Optional list of columns to load, defaults to every available column
+    :param peer_columns: Optional list of columns to compare with sector and industry peers, so
+           criteria can use columns such as 'roe sector pct'
+    :return: Subset of financial_data, containing only qualified stocks
+    :rtype: pandas.DataFrame
+    """
+
+    financial_data, ttm_data = load_screening_data(dir_path, year_pattern, report_year,
+                                                   eval_period, stat, *args,
+                                                   file_format=file_format, columns=columns,
+                                                   peer_columns=peer_columns)
+
     # Subset DataFrame to stocks that meet the specified criteria
     qualified_companies = fundamentals.screen_stocks(ttm_data, **criteria)
-    qualified_company_financials = financial_data[financial_data['symbol'].isin(qualified_companies)]
+    qualified_company_financials = financial_data[
+        financial_data['symbol'].isin(qualified_companies)]
+
+    return qualified_company_financials
+
+
+@instrument()
+def backtest_screen(dir_path, year_pattern, start_year, end_year, eval_period, criteria, stat,
+                    *args, file_format='csv', columns=None, peer_columns=None):
+    """
+    Screen stocks as of every report year from start_year to end_year, using only the data that
+    was available in each year. Data is read once, and the trailing stats of every year are
+    calculated and screened together, so a 20 year backtest costs about as much as one screen.
+
+    :param dir_path: Path to directory that contains data files to be read in
+    :param year_pattern: File name pattern indicating how many years of historical data the
+           file should include, must cover start_year - eval_period through end_year
+    :param start_year: First report year to screen
+    :param end_year: Last report year to screen
+    :param eval_period: Number of years prior to each report year to be analyzed
+    :param criteria: Dictionary containing the column name and quantitative range desired for
+           that column
+    :param stat: Statistic to calculate on col in col_list ('mean', 'median', or 'percent change'),
+           or a dictionary mapping columns to lists of statistics, ex: {'roe': ['mean', 'median']}
+    :param args: List of columns that statistical calculation should apply to (ignored when stat
+           is a dictionary)
+    :param file_format: Storage format of the data files - 'csv', 'parquet' or 'feather'
+    :param columns: Optional list of columns to load, defaults to every available column
+    :param peer_columns: Optional list of columns to compare with sector and industry peers of
+           the same year, see company_fundamentals.calculate_peer_stats
+    :return: Dictionary mapping each report year to the list of qualified stock tickers
+    :rtype: dict
+    """
+
+    # Read and join all data files in the provided directory that match a specific pattern
+    financial_data = fundamentals.combine_data(dir_path, year_pattern, file_format, columns)
+
+    # Calculate the trailing N-YEAR stats of every company as of every report year
+    stat_map = stat if isinstance(stat, dict) else {arg: stat for arg in args}
+    performance_stats = fundamentals.calculate_rolling_stats(financial_data, start_year, end_year,
+                                                             eval_period, stat_map)
+
+    # One row per company and report year, joined with the stats known in that year
+    report_data = financial_data[financial_data['year'].between(start_year, end_year)]
+    report_data = report_data.merge(performance_stats, on=['symbol', 'year'], how='inner')
+    if peer_columns:
+        report_data = fundamentals.calculate_peer_stats(report_data, peer_columns)
+
+    # Screen every company year at once
+    membership = fundamentals.screen_universe(report_data, {'screen': criteria})
+    qualified = report_data.loc[membership['screen'].to_numpy(), ['symbol', 'year']]
+
+    qualified_companies = {year: [] for year in range(start_year, end_year + 1)}
+    for year, symbols in qualified.groupby('year')['symbol']:
+        qualified_companies[int(year)] = list(symbols)
+
+    return qualified_companies
+
+
+@instrument()
+def run_screens(ttm_data, screens):
+    """
+    Apply a batch of named screens to preloaded screening data in one pass.
+
+    :param ttm_data: Report year data joined with performance stats, see load_screening_data
+    :param screens: Dictionary containing screen names as keys and screening criteria
+           dictionaries as values, ex: {'quality': {'roe': [0.10, 0.50]}}
+    :return: Boolean ticker x screen membership DataFrame
+    :rtype: pandas.DataFrame
+    """
+
+    # Every distinct condition is evaluated once, no matter how many screens use it
+    screen_membership = fundamentals.screen_universe(ttm_data, screens)
+
+    return screen_membership
+
+
+@instrument()
+def screen_stocks_out_of_core(dir_path, partition_dir, year_pattern, report_year, eval_period,
+                              criteria, stat, *args, n_partitions=16, review_period='annual',
+                              file_format='csv'):
+    """
+    Partition financial data by stock ticker on disk, then screen stocks one partition at a time
+    so peak memory depends on partition size rather than universe size.
+
+    :param dir_path: Path to directory that contains data files to be read in
+    :param partition_dir: Directory that partitioned data should be written to
+    :param year_pattern: File name pattern indicating how many years of historical data the
+           file should include
+    :param report_year: Year of most recent financial report desired
+    :param eval_period: Number of years prior to most recent report to be analyzed
+    :param criteria: Dictionary containing the column name and quantitative range desired for
+           that column
+    :param stat: Statistic to calculate on col in col_list ('mean', 'median', or 'percent change'),
+           or a dictionary mapping columns to lists of statistics
+    :param args: List of columns that statistical calculation should apply to
+    :param n_partitions: Number of partitions to split the data into
+    :param review_period: Frequency of financial statements - 'annual' or 'quarter'
+    :param file_format: Storage format of the data files - 'csv', 'parquet' or 'feather'
+    :return: Historical financial data of every qualified company
+    :rtype: pandas.DataFrame
+    """
+
+    # Stream every file into per-ticker-hash partitions
+    partitions.partition_data(dir_path, year_pattern, partition_dir, n_partitions, file_format)
+
+    # Combine, subset, calculate stats, and screen each partition, keep qualified companies only
+    qualified_company_financials = partitions.screen_partitions(partition_dir, year_pattern,
+                                                                report_year, eval_period,
+                                                                criteria, stat, *args,
+                                                                review_period=review_period,
+                                                                file_format=file_format)
 
     return qualified_company_financials
 
 
+@instrument()
 def plot_stock_performance(df, report_year, eval_period):
     """
     Plot the historical performance of selected stock tickers.
@@ -116,6 +425,32 @@ def plot_stock_performance(df, report_year, eval_period):
     return historical_performance_plots
 
 
+@instrument()
+def render_stock_performance(df, report_year, eval_period, output_dir, by_ticker=False):
+    """
+    Render the historical performance charts of selected stock tickers to PNG files in parallel.
+    Charts whose data has not changed since a previous run are reused from the output directory.
+
+    :param df: DataFrame containing stock tickers to include in line graphs
+    :param report_year: Year of most recent financial report desired
+    :param eval_period: Number of years prior to most recent report to be analyzed (max = 10)
+    :param output_dir: Directory that PNG files should be written to
+    :param by_ticker: If True, render one chart set per stock ticker
+    :return: Dictionary mapping (ticker or None, metric) to the PNG file path
+    :rtype: dict
+    """
+
+    logger.info('Rendering performance charts to %s...', output_dir)
+
+    chart_paths = fundamentals.render_performance_plots(df, report_year, eval_period, output_dir,
+                                                        by_ticker=by_ticker)
+
+    logger.info('Rendered %s charts! \n', len(chart_paths))
+
+    return chart_paths
+
+
+@instrument()
 def calculate_intrinsic_value(df, report_year, eval_period, projection_window,
                               long_term_growth_estimates, *args):
     """
@@ -125,14 +460,28 @@ def calculate_intrinsic_value(df, report_year, eval_period, projection_window,
     :param report_year: Year of most recent financial report desired
     :param eval_period: Number of years prior to most recent report to be analyzed (max = 10)
     :param projection_window: Number of years into the future we should generate projections for
-    :param long_term_growth_estimates: Estimated growth over N-year period
-    :param args: Stock tickers to generate intrinsic value estimates for
+    :param long_term_growth_estimates: Estimated growth over N-year period per stock ticker,
+           tickers without an estimate get one derived from their history (see
+           company_fundamentals.estimate_growth_rates)
+    :param args: Stock tickers to generate intrinsic value estimates for, defaults to every stock
+           ticker in the DataFrame
     :return: DataFrame containing DCF model inputs, intrinsic value outputs, and a buy/no buy column
     :rtype: pandas.DataFrame
     """
 
-    # Prepare data for DCF model calculations
-    valuation_data = fundamentals.prepare_valuation_inputs(df, report_year, eval_period, *args)
+    tickers = list(args) if args else list(df['symbol'].unique())
+
+    # Manual estimates override the ones derived from each company's history
+    growth_estimates = dict(long_term_growth_estimates or {})
+    missing_tickers = [x for x in tickers if x not in growth_estimates]
+    if missing_tickers:
+        history = df[df['symbol'].isin(missing_tickers)]
+        growth_estimates = dict(fundamentals.estimate_growth_rates(history, report_year,
+                                                                   eval_period),
+                                **growth_estimates)
+
+    # Prepare data for DCF model calculations, every ticker is valued in one batched pass
+    valuation_data = fundamentals.prepare_valuation_inputs(df, report_year, eval_period, *tickers)
 
     # See company_fundamentals.py to understand calculations, calculation order
     dcf_model_steps = [fundamentals.calculate_discount_rate,
@@ -143,38 +492,186 @@ def calculate_intrinsic_value(df, report_year, eval_period, projection_window,
 
     for step in dcf_model_steps:
         if step == fundamentals.calculate_discounted_free_cash_flow:
-            valuation_data = step(valuation_data, projection_window, **long_term_growth_estimates)
+            valuation_data = step(valuation_data, projection_window, **growth_estimates)
         else:
             valuation_data = step(valuation_data)
 
     return valuation_data
 
 
+@instrument()
+def calculate_implied_growth(df, report_year, eval_period, projection_window, *args):
+    """
+    Calculate the long term growth rate the market is pricing in: the growth rate at which each
+    stock ticker's intrinsic value equals its stock price.
+
+    :param df: DataFrame containing N-years of historical company data
+    :param report_year: Year of most recent financial report desired
+    :param eval_period: Number of years prior to most recent report to be analyzed (max = 10)
+    :param projection_window: Number of years into the future we should generate projections for
+    :param args: Stock tickers to solve for, defaults to every stock ticker in the DataFrame
+    :return: DataFrame containing DCF model inputs, the discount rate and the implied growth rate
+    :rtype: pandas.DataFrame
+    """
+
+    tickers = list(args) if args else list(df['symbol'].unique())
+
+    # Prepare data for DCF model calculations
+    valuation_data = fundamentals.prepare_valuation_inputs(df, report_year, eval_period, *tickers)
+    valuation_data = fundamentals.calculate_discount_rate(valuation_data)
+
+    # Every ticker is solved at once
+    valuation_data = fundamentals.calculate_implied_growth_rate(valuation_data, projection_window)
+
+    return valuation_data
+
+
+@instrument()
+def simulate_intrinsic_value(df, report_year, eval_period, projection_window, distributions,
+                             n_scenarios, long_term_growth_estimates, *args):
+    """
+    Estimate the distribution of intrinsic value for the provided stock tickers across Monte
+    Carlo scenarios of the DCF model inputs.
+
+    :param df: DataFrame containing N-years of historical company data
+    :param report_year: Year of most recent financial report desired
+    :param eval_period: Number of years prior to most recent report to be analyzed (max = 10)
+    :param projection_window: Number of years into the future we should generate projections for
+    :param distributions: Dictionary of scenario parameter distributions, ex:
+           {'long_term_growth_rate': ('uniform', 0.02, 0.06), 'risk_free_rate': 0.0069}
+    :param n_scenarios: Number of scenarios to draw
+    :param long_term_growth_estimates: Estimated growth over N-year period per ticker, scenarios
+           vary the 'growth_rate_shift' applied to each estimate. Pass None to draw a common
+           'long_term_growth_rate' from the distributions instead
+    :param args: Stock tickers to generate intrinsic value estimates for
+    :return: DataFrame containing intrinsic value percentiles and buy probability per ticker
+    :rtype: pandas.DataFrame
+    """
+
+    # Prepare data for DCF model calculations
+    valuation_data = fundamentals.prepare_valuation_inputs(df, report_year, eval_period, *args)
+
+    # Evaluate every ticker x scenario combination in one batched calculation
+    simulated_values = scenarios.simulate_intrinsic_value(valuation_data, projection_window,
+                                                          distributions, n_scenarios,
+                                                          long_term_growth_estimates)
+
+    return simulated_values
+
+
+def build_pipeline(state_dir, dir_path, api_key, cache, price_filter, financial_requests,
+                   review_period, report_year, eval_period, criteria, stat, stat_columns,
+                   projection_window, long_term_growth_estimates, chart_dir=None,
+                   file_format='csv', sectors=None, industries=None,
+                   requests_per_minute=api_client.REQUESTS_PER_MINUTE):
+    """
+    Describe the full analysis as a DAG of steps: company profiles, one step per financial
+    request (run in parallel), screening, optional chart rendering and intrinsic value. Running
+    it again only repeats the steps whose parameters or upstream data changed, ex: editing the
+    screening criteria re-screens and re-values without retrieving any data.
+
+    :param state_dir: Directory that step fingerprints and results should be written to
+    :param dir_path: Directory path where data files should be stored
+    :param api_key: FinancialModelingPrep API key
+    :param cache: Optional ResponseCache that API responses should be served from / stored in
+    :param price_filter: The minimum stock price a user is willing to consider
+    :param financial_requests: List of financial data to request from the FMP API
+    :param review_period: Frequency of financial statements - 'annual' or 'quarter'
+    :param report_year: Year of most recent financial report desired
+    :param eval_period: Number of years prior to most recent report to be analyzed (max = 10)
+    :param criteria: Dictionary containing the column name and quantitative range desired for
+           that column
+    :param stat: Statistic to calculate on the stat columns, see screen_stocks
+    :param stat_columns: List of columns that statistical calculation should apply to
+    :param projection_window: Number of years into the future we should generate projections for
+    :param long_term_growth_estimates: Growth estimates overriding the ones derived from history,
+           every screened stock ticker is valued
+    :param chart_dir: Optional directory that performance charts should be rendered to
+    :param file_format: Storage format of the data files - 'csv', 'parquet' or 'feather'
+    :param sectors: Optional list of sectors to retain, defaults to every sector
+    :param industries: Optional list of industries to retain, defaults to every industry
+    :param requests_per_minute: Maximum number of API requests issued per minute, shared by the
+           financial requests retrieved in parallel
+    :return: Pipeline whose leaf steps are 'intrinsic-value' and, if requested, 'charts'
+    :rtype: pipeline.Pipeline
+    """
+
+    dag = pipeline.Pipeline(state_dir)
+    extension = storage.FILE_FORMATS[file_format]
+    year_pattern = str(eval_period) + 'Y'
+    profile_path = dir_path + 'company-profiles' + extension
+    resources = {'api_key': api_key, 'cache': cache}
+
+    dag.add(pipeline.Step('company-profiles', prepare_company_profiles,
+                          args=(price_filter, dir_path), kwargs={'file_format': file_format},
+                          outputs=[profile_path], resources=resources))
+
+    # Each request is its own step, so they are retrieved in parallel and refreshed separately.
+    # Parallel steps share the CPUs used for sharded retrieval. Steps fetching in this process
+    # already share one token bucket (see api_client.shared_bucket), the rate limit is only split
+    # between steps when each spawns its own processes, whose buckets can't be shared
+    financial_paths = []
+    max_processes = max(1, (os.cpu_count() or 1) // len(financial_requests))
+    request_resources = dict(resources, max_processes=max_processes,
+                             requests_per_minute=requests_per_minute / len(financial_requests)
+                             if max_processes > 1 else requests_per_minute)
+
+    for request in financial_requests:
+        financial_paths.append(dir_path + request + '-' + year_pattern + extension)
+        dag.add(pipeline.Step(request, get_company_financials,
+                              args=(profile_path, [request], review_period, report_year,
+                                    eval_period, dir_path),
+                              kwargs={'file_format': file_format, 'sectors': sectors,
+                                      'industries': industries},
+                              inputs=[profile_path], outputs=[financial_paths[-1]],
+                              resources=request_resources))
+
+    # combine_data joins the profiles too, their sector and beta feed the screen and valuation
+    dag.add(pipeline.Step('screen', screen_stocks,
+                          args=(dir_path, year_pattern, report_year, eval_period, criteria, stat,
+                                *stat_columns),
+                          kwargs={'file_format': file_format},
+                          inputs=[profile_path] + financial_paths))
+
+    if chart_dir is not None:
+        dag.add(pipeline.Step('charts', render_stock_performance, requires=['screen'],
+                              args=(report_year, eval_period, chart_dir)))
+
+    dag.add(pipeline.Step('intrinsic-value', calculate_intrinsic_value, requires=['screen'],
+                          args=(report_year, eval_period, projection_window,
+                                long_term_growth_estimates)))
+
+    return dag
+
+
 if __name__ == '__main__':
 
-    prepare_company_profiles(10.00, 'data/', config.api_key)
+    from fundamental import config
+
+    set_verbosity()
+
+    # Raw API responses are cached on disk, re-runs only download data that has expired
+    response_cache = ResponseCache('cache/')
 
     financial_requests = ['financials', 'financial-ratios', 'financial-statement-growth',
                           'company-key-metrics', 'enterprise-value']
 
-    get_company_financials('data/company-profiles.csv', financial_requests, 'annual', 2019, 10,
-                           'data/', config.api_key)
-
     screening_criteria = {'debtToEquity': [0, 0.5],
                           'currentRatio': [1.5, 10.0],
                           'roe': [0.10, 0.50],
                           '10Y roe median': [0.08, 0.25],
                           'interestCoverage': [15, 5000]}
 
-    screened_stocks = screen_stocks('data/', '10Y', 2019, 10, screening_criteria, 'median',
-                                    'roe', 'currentRatio')
-
-    # Returns list of ggplot objects, add optional for loop to inspect graphs
-    stability_graphs = plot_stock_performance(screened_stocks, 2019, 10)
-
+    # Every screened stock is valued, these estimates replace the ones derived from history
     stock_growth_estimates = {'DLB': 0.06, 'UNF': 0.05}
 
-    intrinsic_value_estimates = calculate_intrinsic_value(screened_stocks, 2019, 10, 10,
-                                                          stock_growth_estimates, 'DLB', 'UNF')
+    # Steps whose parameters and upstream data are unchanged since the last run are skipped,
+    # pass force=['financials', ...] to run() to refresh data regardless
+    analysis = build_pipeline('pipeline/', 'data/', config.api_key, response_cache, 10.00,
+                              financial_requests, 'annual', 2019, 10, screening_criteria,
+                              'median', ['roe', 'currentRatio'], 10, stock_growth_estimates,
+                              chart_dir='charts/')
+
+    intrinsic_value_estimates = analysis.run()['intrinsic-value']
 
     print(intrinsic_value_estimates)
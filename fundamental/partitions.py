@@ -0,0 +1,214 @@
+from fundamental import company_financials as financials
+from fundamental import company_fundamentals as fundamentals
+from fundamental import storage
+from fundamental.instrumentation import instrument
+
+import logging
+import os
+import shutil
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100000
+
+
+def partition_of(symbols, n_partitions):
+    """
+    Assign each stock ticker to a partition with a stable hash, so a ticker's rows from every
+    file land in the same partition on every run.
+
+    :param symbols: Series of stock tickers
+    :param n_partitions: Number of partitions
+    :return: Partition number of each ticker
+    :rtype: numpy.ndarray
+    """
+    hashes = pd.util.hash_array(symbols.astype(str).to_numpy(dtype=object))
+
+    return (hashes % n_partitions).astype(int)
+
+
+def _read_batches(path, batch_size):
+    file_format = storage.file_format_of(path)
+
+    if file_format == 'csv':
+        yield from pd.read_csv(path, chunksize=batch_size)
+        return
+
+    if file_format == 'parquet':
+        from pyarrow import parquet
+        for batch in parquet.ParquetFile(path, memory_map=True).iter_batches(batch_size):
+            yield batch.to_pandas()
+        return
+
+    from pyarrow import ipc
+    with ipc.open_file(path) as reader:
+        for i in range(reader.num_record_batches):
+            yield reader.get_batch(i).to_pandas()
+
+
+class _PartitionWriter:
+    """
+    Append batches of rows to one file per partition, in the source file's format.
+    """
+
+    def __init__(self, partition_dir, file, n_partitions):
+        self.paths = [os.path.join(partition_dir, 'part-' + str(i).zfill(4), file)
+                      for i in range(n_partitions)]
+        self.file_format = storage.file_format_of(file)
+        self.writers = {}
+        self.schema = None
+
+        # Partitions that receive no rows on this run must not keep a previous run's file
+        for path in self.paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def write(self, partition, df):
+        path = self.paths[partition]
+
+        if self.file_format == 'csv':
+            new_file = partition not in self.writers
+            self.writers[partition] = path
+            df.to_csv(path, mode='w' if new_file else 'a', index=False, header=new_file)
+            return
+
+        import pyarrow
+        table = pyarrow.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+        self.schema = table.schema
+
+        if partition not in self.writers:
+            if self.file_format == 'parquet':
+                from pyarrow import parquet
+                self.writers[partition] = parquet.ParquetWriter(path, table.schema,
+                                                                compression=storage.COMPRESSION)
+            else:
+                from pyarrow import ipc
+                options = ipc.IpcWriteOptions(compression=storage.COMPRESSION)
+                self.writers[partition] = ipc.new_file(path, table.schema, options=options)
+
+        self.writers[partition].write_table(table)
+
+    def close(self):
+        if self.file_format != 'csv':
+            for writer in self.writers.values():
+                writer.close()
+
+
+@instrument()
+def partition_data(directory, year_pattern, partition_dir, n_partitions=16, file_format='csv',
+                   batch_size=BATCH_SIZE):
+    """
+    Split every data file in a directory into partitions by stock ticker hash, streaming each
+    file in batches so the full dataset is never held in memory.
+
+    :param directory: Local directory where financial data resides
+    :param year_pattern: String indicating which files to pull. Example: '10Y', '5Y', '3Y', etc.
+    :param partition_dir: Directory that partition sub-directories should be written to
+    :param n_partitions: Number of partitions to create
+    :param file_format: Storage format of the files - 'csv', 'parquet' or 'feather'
+    :param batch_size: Number of rows read from a file at once
+    :return: List of partition directories
+    :rtype: List
+    """
+    logger.info('Partitioning %s data in %s into %s partitions...', year_pattern, directory,
+                n_partitions)
+
+    partition_paths = [os.path.join(partition_dir, 'part-' + str(i).zfill(4)) + os.sep
+                       for i in range(n_partitions)]
+
+    for path in partition_paths:
+        os.makedirs(path, exist_ok=True)
+
+    # A previous run with more partitions hashed tickers differently, screen_partitions would
+    # read its leftover partitions and return those tickers twice
+    for entry in os.scandir(partition_dir):
+        if entry.is_dir() and entry.name.startswith('part-') \
+                and os.path.join(entry.path, '') not in partition_paths:
+            shutil.rmtree(entry.path)
+
+    extension = storage.FILE_FORMATS[file_format]
+
+    for file in sorted(os.listdir(directory)):
+
+        name, file_extension = os.path.splitext(file)
+
+        if file_extension != extension or not (name.endswith('-' + year_pattern)
+                                               or name == 'company-profiles'):
+            continue
+
+        writer = _PartitionWriter(partition_dir, file, n_partitions)
+
+        try:
+            for batch in _read_batches(os.path.join(directory, file), batch_size):
+                partitions = partition_of(batch['symbol'], n_partitions)
+                for partition, rows in batch.groupby(partitions):
+                    writer.write(partition, rows)
+        finally:
+            writer.close()
+
+    logger.info('Partitioned data into %s! \n', partition_dir)
+
+    return partition_paths
+
+
+@instrument()
+def screen_partitions(partition_dir, year_pattern, report_year, eval_period, criteria, stat,
+                      *args, review_period='annual', file_format='csv'):
+    """
+    Screen stocks one partition at a time: combine -> select years -> stats -> screen. Only the
+    qualified companies' data is kept from each partition, so peak memory is bounded by the
+    size of one partition rather than the whole universe.
+
+    :param partition_dir: Directory containing partitions written by partition_data
+    :param year_pattern: File name pattern indicating how many years of historical data the
+           files include
+    :param report_year: Year of most recent financial report desired
+    :param eval_period: Number of years prior to most recent report to be analyzed
+    :param criteria: Dictionary containing the column name and quantitative range desired for
+           that column
+    :param stat: Statistic to calculate ('mean', 'median', or 'percent change'), or a dictionary
+           mapping columns to lists of statistics
+    :param args: Columns that statistical calculation should apply to (ignored when stat is a
+           dictionary)
+    :param review_period: Frequency of financial statements - 'annual' or 'quarter'
+    :param file_format: Storage format of the partition files - 'csv', 'parquet' or 'feather'
+    :return: Historical financial data of every qualified company
+    :rtype: pandas.DataFrame
+    """
+    if isinstance(stat, dict):
+        stat_map = stat
+    else:
+        stat_map = {arg: stat for arg in args}
+
+    qualified_financials = []
+
+    for partition in sorted(os.listdir(partition_dir)):
+
+        financial_data = fundamentals.combine_data(os.path.join(partition_dir, partition) + os.sep,
+                                                   year_pattern, file_format)
+        if financial_data.empty:
+            continue
+
+        if review_period == 'quarter':
+            financial_data = financials.select_analysis_quarters(financial_data, report_year,
+                                                                 eval_period)
+        else:
+            financial_data = financials.select_analysis_years(financial_data, report_year,
+                                                              eval_period)
+
+        ttm_data = financial_data[financial_data['year'] == report_year]
+        ttm_data = ttm_data.drop_duplicates('symbol', keep='last')
+
+        performance_stats = fundamentals.calculate_multiple_stats(financial_data, report_year,
+                                                                  eval_period, stat_map)
+        ttm_data = ttm_data.merge(performance_stats, on=['symbol', 'year'], how='inner')
+
+        qualified_companies = fundamentals.screen_stocks(ttm_data, **criteria)
+        qualified_financials.append(
+            financial_data[financial_data['symbol'].isin(qualified_companies)])
+
+    if not qualified_financials:
+        return pd.DataFrame()
+
+    return pd.concat(qualified_financials, ignore_index=True)
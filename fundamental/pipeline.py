@@ -0,0 +1,356 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from fundamental.instrumentation import instrument
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+
+
+def file_digest(path):
+    """
+    SHA-256 of a file's contents.
+
+    :param path: File path
+    :return: Hex digest
+    :rtype: str
+    """
+    digest = hashlib.sha256()
+
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 ** 2), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class Step:
+    """
+    One stage of a pipeline: a function, the parameters it is called with, the files it reads
+    and writes, and the steps whose results it is passed.
+
+    :param name: Unique step name, ex: 'company-profiles'
+    :param func: Function that runs the step
+    :param args: Positional arguments, part of the step's fingerprint
+    :param kwargs: Keyword arguments, part of the step's fingerprint
+    :param requires: Names of steps whose results are passed to func ahead of args, in order
+    :param inputs: Files the step reads, their contents are part of the step's fingerprint
+    :param outputs: Files the step writes. Steps without outputs have their return value stored
+           instead, so it can be passed to later steps without running the step again. Steps with
+           outputs report parts they failed to produce by returning a non-empty value, ex: the
+           failed shards get_company_financials returns, and fail so they run again next time
+    :param resources: Keyword arguments that don't affect the step's outputs and are left out of
+           its fingerprint, ex: {'api_key': api_key, 'cache': response_cache}
+    """
+
+    def __init__(self, name, func, args=(), kwargs=None, requires=(), inputs=(), outputs=(),
+                 resources=None):
+        self.name = name
+        self.func = func
+        self.args = tuple(args)
+        self.kwargs = kwargs or {}
+        self.requires = list(requires)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.resources = resources or {}
+
+    def parameters(self):
+        """
+        Serialize the function and the arguments that determine the step's outputs.
+
+        :return: JSON string
+        :rtype: str
+        """
+        return json.dumps({'func': self.func.__module__ + '.' + self.func.__qualname__,
+                           'args': self.args,
+                           'kwargs': self.kwargs}, sort_keys=True, default=repr)
+
+
+class Pipeline:
+    """
+    DAG of pipeline steps. Every step is fingerprinted from its parameters, the contents of its
+    input files and the results of the steps it requires, and only runs when its fingerprint
+    changed since the last run or its outputs are missing or were modified. Steps that don't
+    depend on each other run in parallel.
+
+    :param state_dir: Directory that fingerprints and stored step results should be written to
+    :param max_workers: Maximum number of steps running at once
+    """
+
+    def __init__(self, state_dir, max_workers=None):
+        self.state_dir = state_dir
+        self.max_workers = max_workers
+        self.steps = {}
+        self.producers = {}
+        self.lock = threading.Lock()
+        self.status = {}
+
+        os.makedirs(os.path.join(state_dir, 'results'), exist_ok=True)
+
+        self.manifest = {'steps': {}, 'files': {}}
+        if os.path.exists(os.path.join(state_dir, MANIFEST)):
+            with open(os.path.join(state_dir, MANIFEST)) as file:
+                self.manifest = json.load(file)
+
+    def add(self, step):
+        """
+        Add a step to the pipeline.
+
+        :param step: Step
+        :return: The step added
+        :rtype: Step
+        """
+        if step.name in self.steps:
+            raise ValueError('A step named ' + step.name + ' already exists')
+
+        for path in step.outputs:
+            if path in self.producers:
+                raise ValueError(path + ' is written by both ' + self.producers[path] + ' and '
+                                 + step.name)
+            self.producers[path] = step.name
+
+        self.steps[step.name] = step
+
+        return step
+
+    def dependencies(self, name):
+        """
+        Steps that must finish before the provided step can run.
+
+        :param name: Step name
+        :return: Names of required steps and of the steps writing the step's input files
+        :rtype: List
+        """
+        step = self.steps[name]
+        upstream = list(step.requires) + [self.producers[x] for x in step.inputs
+                                          if x in self.producers]
+
+        for x in upstream:
+            if x not in self.steps:
+                raise KeyError(name + ' requires unknown step ' + x)
+
+        return list(dict.fromkeys(upstream))
+
+    def _order(self, targets):
+        # Targets and everything upstream of them, each step after its dependencies
+        order = []
+        visiting = set()
+
+        def visit(name):
+            if name in order:
+                return
+            if name in visiting:
+                raise ValueError('Pipeline steps form a cycle through ' + name)
+            visiting.add(name)
+            for x in self.dependencies(name):
+                visit(x)
+            visiting.discard(name)
+            order.append(name)
+
+        for name in targets:
+            visit(name)
+
+        return order
+
+    def _digest(self, path):
+        # File digests are reused while a file's size and modification time are unchanged
+        stat = os.stat(path)
+        key = [stat.st_size, stat.st_mtime_ns]
+
+        with self.lock:
+            known = self.manifest['files'].get(path)
+        if known is not None and known[:2] == key:
+            return known[2]
+
+        digest = file_digest(path)
+        with self.lock:
+            self.manifest['files'][path] = key + [digest]
+
+        return digest
+
+    def _result_path(self, name, fingerprint):
+        return os.path.join(self.state_dir, 'results', name + '-' + fingerprint[:16] + '.pkl')
+
+    def fingerprint(self, name):
+        """
+        Hash of everything that determines a step's outputs. Required steps must have run.
+
+        :param name: Step name
+        :return: Hex digest
+        :rtype: str
+        """
+        step = self.steps[name]
+        fingerprint = hashlib.sha256(step.parameters().encode('utf-8'))
+
+        for x in step.requires:
+            fingerprint.update(self.manifest['steps'][x]['digest'].encode('utf-8'))
+
+        for path in step.inputs:
+            fingerprint.update(path.encode('utf-8'))
+            fingerprint.update(self._digest(path).encode('utf-8') if os.path.exists(path)
+                               else b'missing')
+
+        return fingerprint.hexdigest()
+
+    def _outputs_digest(self, name, fingerprint):
+        # Outputs' contents, passed on to the fingerprints of the steps that require this one
+        step = self.steps[name]
+        paths = step.outputs or [self._result_path(name, fingerprint)]
+
+        if not all(os.path.exists(x) for x in paths):
+            return None
+
+        digest = hashlib.sha256()
+        for path in paths:
+            digest.update(self._digest(path).encode('utf-8'))
+
+        return digest.hexdigest()
+
+    def up_to_date(self, name):
+        """
+        Check if a step's outputs were produced from its current parameters and inputs.
+
+        :param name: Step name
+        :return: True if the step doesn't need to run
+        :rtype: bool
+        """
+        record = self.manifest['steps'].get(name)
+        required = self.steps[name].requires
+
+        if record is None or any(x not in self.manifest['steps'] for x in required):
+            return False
+
+        fingerprint = self.fingerprint(name)
+
+        return record['fingerprint'] == fingerprint \
+            and self._outputs_digest(name, fingerprint) == record['digest']
+
+    def result(self, name):
+        """
+        Load the stored return value of a step without outputs.
+
+        :param name: Step name
+        :return: Return value of the step's last run, None for steps that write files
+        """
+        if self.steps[name].outputs:
+            return None
+
+        return pd.read_pickle(self._result_path(name, self.manifest['steps'][name]['fingerprint']))
+
+    def _save_manifest(self):
+        path = os.path.join(self.state_dir, MANIFEST)
+
+        with self.lock:
+            with open(path + '.tmp', 'w') as file:
+                json.dump(self.manifest, file, indent=2)
+            os.replace(path + '.tmp', path)
+
+    def _run_step(self, name, force, results):
+        step = self.steps[name]
+
+        if name not in force and self.up_to_date(name):
+            logger.info('Skipping %s, its outputs are up to date! \n', name)
+            self.status[name] = 'skipped'
+            return None
+
+        required = [results[x] if x in results else self.result(x) for x in step.requires]
+
+        logger.info('Running %s...', name)
+        value = step.func(*required, *step.args, **step.kwargs, **step.resources)
+
+        if step.outputs and value:
+            # Partial outputs must not be recorded as up to date, or they'd never be retried
+            with self.lock:
+                self.manifest['steps'].pop(name, None)
+            self._save_manifest()
+            raise RuntimeError(name + ' only partly succeeded, failed: '
+                               + ', '.join(map(str, value)))
+
+        fingerprint = self.fingerprint(name)
+        previous = self.manifest['steps'].get(name)
+
+        if not step.outputs:
+            pd.to_pickle(value, self._result_path(name, fingerprint))
+            results[name] = value
+            if previous is not None and previous['fingerprint'] != fingerprint:
+                stale = self._result_path(name, previous['fingerprint'])
+                with self.lock:
+                    self.manifest['files'].pop(stale, None)
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
+
+        digest = self._outputs_digest(name, fingerprint)
+        if digest is None:
+            raise FileNotFoundError(name + ' did not write all of its outputs: '
+                                    + ', '.join(x for x in step.outputs if not os.path.exists(x)))
+
+        with self.lock:
+            self.manifest['steps'][name] = {'fingerprint': fingerprint, 'digest': digest}
+        self._save_manifest()
+
+        self.status[name] = 'ran'
+
+        return None
+
+    @instrument()
+    def run(self, targets=None, force=()):
+        """
+        Run the steps needed to bring the targets up to date, skipping every step whose
+        fingerprint and outputs are unchanged.
+
+        :param targets: Names of the steps wanted, defaults to every step no other step depends on
+        :param force: Names of steps that should run even if they are up to date
+        :return: Dictionary mapping each target to its return value (None for steps that write
+                 files)
+        :rtype: dict
+        """
+        if targets is None:
+            upstream = {x for name in self.steps for x in self.dependencies(name)}
+            targets = [x for x in self.steps if x not in upstream]
+
+        order = self._order(targets)
+        force = set(force)
+        results = {}
+        self.status = {}
+
+        pending = {name: set(self.dependencies(name)) for name in order}
+        running = {}
+        failure = None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers or len(order) or 1) as executor:
+            while pending or running:
+                # Submit every step whose dependencies have finished, unless a step failed
+                if failure is None:
+                    for name in [x for x, deps in pending.items() if not deps]:
+                        del pending[name]
+                        running[executor.submit(self._run_step, name, force, results)] = name
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    name = running.pop(future)
+                    if future.exception() is not None:
+                        failure = failure or future.exception()
+                        continue
+                    for deps in pending.values():
+                        deps.discard(name)
+
+        if failure is not None:
+            raise failure
+
+        logger.info('Ran %s of %s pipeline steps! \n',
+                    sum(x == 'ran' for x in self.status.values()), len(order))
+
+        return {name: results[name] if name in results else self.result(name)
+                for name in targets}
@@ -0,0 +1,174 @@
+from fundamental import instrumentation
+from urllib.parse import quote
+
+import os
+import threading
+import time
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+# Time to live (seconds) for each endpoint type, annual filings rarely change once published
+ENDPOINT_TTL = {'stock/list': 6 * HOUR,
+                'company/profile': DAY,
+                'annual': 30 * DAY,
+                'quarter': 7 * DAY}
+
+MAX_CACHE_BYTES = 2 * 1024 ** 3
+
+
+class ResponseCache:
+    """
+    On-disk cache of raw FinancialModelingPrep JSON responses, keyed by endpoint, ticker and
+    period. Entries expire according to their endpoint's time to live, and the least recently
+    used entries are evicted once the cache grows beyond its size limit.
+
+    :param cache_dir: Directory that cached responses should be written to
+    :param ttl: Dictionary overriding entries in ENDPOINT_TTL
+    :param max_bytes: Maximum size of the cache on disk
+    """
+
+    def __init__(self, cache_dir, ttl=None, max_bytes=MAX_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.ttl = dict(ENDPOINT_TTL, **(ttl or {}))
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self.entries = {}
+        for root, _, files in os.walk(cache_dir):
+            for file in files:
+                path = os.path.join(root, file)
+                self.entries[path] = os.path.getsize(path)
+
+        self.size = sum(self.entries.values())
+
+    def __getstate__(self):
+        # Shared with worker processes (ex: sharded retrieval in main.get_company_financials)
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def _path(self, endpoint, ticker, period):
+        filename = quote(ticker or '_', safe='') + '-' + (period or '_') + '.json'
+        return os.path.join(self.cache_dir, endpoint.replace('/', '_'), filename)
+
+    def time_to_live(self, endpoint, period):
+        """
+        Look up how long a response from the provided endpoint remains valid.
+
+        :param endpoint: API endpoint, ex: 'income-statement', 'company/profile', 'stock/list'
+        :param period: String 'annual' or 'quarter', if applicable
+        :return: Time to live in seconds
+        :rtype: int
+        """
+        if endpoint in self.ttl:
+            return self.ttl[endpoint]
+
+        return self.ttl.get(period, self.ttl['annual'])
+
+    def get(self, endpoint, ticker, period):
+        """
+        Return the cached response for a request, if one exists and has not expired.
+
+        :param endpoint: API endpoint
+        :param ticker: Stock ticker the request applies to, if any
+        :param period: String 'annual' or 'quarter', if applicable
+        :return: Raw response body, or None on a cache miss
+        :rtype: bytes
+        """
+        path = self._path(endpoint, ticker, period)
+
+        try:
+            now = time.time()
+            written = os.path.getmtime(path)
+            if now - written > self.time_to_live(endpoint, period):
+                raise FileNotFoundError(path)
+
+            with open(path, 'rb') as file:
+                data = file.read()
+
+            # Modification time records the download, access time drives eviction order
+            os.utime(path, (now, written))
+
+        except FileNotFoundError:
+            with self.lock:
+                self.misses += 1
+            instrumentation.count('cache_misses')
+            return None
+
+        with self.lock:
+            self.hits += 1
+        instrumentation.count('cache_hits')
+
+        return data
+
+    def put(self, endpoint, ticker, period, data):
+        """
+        Store a raw response body and evict old entries if the cache exceeds its size limit.
+
+        :param endpoint: API endpoint
+        :param ticker: Stock ticker the request applies to, if any
+        :param period: String 'annual' or 'quarter', if applicable
+        :param data: Raw response body
+        :return: None
+        """
+        path = self._path(endpoint, ticker, period)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file first so concurrent readers never see a partial response
+        temp_path = path + '.' + str(os.getpid()) + '-' + str(threading.get_ident()) + '.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, path)
+
+        with self.lock:
+            self.size += len(data) - self.entries.get(path, 0)
+            self.entries[path] = len(data)
+
+            if self.size > self.max_bytes:
+                self._evict()
+
+        return None
+
+    def _evict(self):
+        last_used = {}
+        for path in self.entries:
+            try:
+                last_used[path] = os.path.getatime(path)
+            except FileNotFoundError:
+                last_used[path] = 0
+
+        # Trim to 90% of the limit so a full cache doesn't evict on every write
+        for path in sorted(last_used, key=last_used.get):
+            if self.size <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= self.entries.pop(path)
+
+    def clear(self):
+        """
+        Remove every cached response.
+
+        :return: None
+        """
+        with self.lock:
+            for path in self.entries:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self.entries = {}
+            self.size = 0
+
+        return None
@@ -0,0 +1,400 @@
+"""
+Long-running screening and valuation service. The combined dataset is loaded once and kept in
+memory together with its performance stats, so screens and valuations are answered in
+milliseconds instead of re-reading every data file. The data directory is watched and reloaded
+when its files change.
+
+Usage: python -m fundamental.service data/ [--year-pattern 10Y] [--report-year 2019]
+       [--eval-period 10] [--stats '{"roe": "median", "currentRatio": "median"}']
+       [--peer-columns roe,debtToEquity] [--port 8001]
+
+Endpoints (JSON in, JSON out):
+    GET  /status     Dataset size and load time
+    POST /screen     {"criteria": {"roe": [0.1, 0.5]}, "stats": {"roe": ["median"]}}
+    POST /stats      {"stats": {"roe": ["mean", "median"]}, "report_year": 2019, "eval_period": 10}
+    POST /valuation  {"growth_estimates": {"DLB": 0.06}, "projection_window": 10,
+                      "risk_free_rate": 0.0069, "market_risk_premium": 0.06,
+                      "gdp_growth_rate": 0.029, "margin_of_safety": 0.25}
+"""
+from fundamental import company_fundamentals as fundamentals
+from fundamental import storage
+from fundamental.instrumentation import instrument, set_verbosity
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+
+# Named explicitly, run as a script (python -m fundamental.service) __name__ is '__main__'
+logger = logging.getLogger('fundamental.service')
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._send(*self.server.service.respond('GET', urlsplit(self.path).path, None))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self._send(*self.server.service.respond('POST', urlsplit(self.path).path,
+                                                self.rfile.read(length)))
+
+    def log_message(self, format, *args):
+        return None
+
+
+def _records(df):
+    return b'{"records": ' + df.to_json(orient='records').encode('utf-8') + b'}'
+
+
+class ScreeningService:
+    """
+    Serve screen_stocks, calculate_multiple_stats and the DCF chain over a dataset held in
+    memory. Stats requested once are kept until the data is reloaded.
+
+    :param dir_path: Directory that contains the data files, see combine_data
+    :param year_pattern: File name pattern indicating how many years of historical data the
+           files include, ex: '10Y'
+    :param report_year: Year of most recent financial report, screens apply to this year
+    :param eval_period: Number of years prior to most recent report to be analyzed
+    :param stat_map: Dictionary of stats to calculate when the data is loaded, ex:
+           {'roe': ['mean', 'median']}, screens can use their 'NY column stat' columns
+    :param file_format: Storage format of the data files - 'csv', 'parquet' or 'feather'
+    :param columns: Optional list of columns to load, defaults to every available column
+    :param peer_columns: Optional list of columns to compare with sector and industry peers when
+           the data is loaded, screens can use their 'column sector pct' style columns
+    :param host: Interface to listen on
+    :param port: Port to listen on, 0 picks a free port
+    :param poll_interval: Seconds between checks of the data directory for changed files
+    """
+
+    def __init__(self, dir_path, year_pattern, report_year, eval_period, stat_map=None,
+                 file_format='csv', columns=None, peer_columns=None, host='127.0.0.1', port=0,
+                 poll_interval=2.0):
+        self.dir_path = dir_path
+        self.year_pattern = year_pattern
+        self.report_year = report_year
+        self.eval_period = eval_period
+        self.stat_map = stat_map or {}
+        self.file_format = file_format
+        self.columns = columns
+        self.peer_columns = peer_columns
+        self.poll_interval = poll_interval
+
+        self.snapshot = None
+        self.reload()
+
+        self.stopped = threading.Event()
+        self.watcher = None
+
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.service = self
+        self.thread = None
+
+    @property
+    def url(self):
+        """
+        Root URL of the service.
+        """
+        host, port = self.httpd.server_address[:2]
+        return 'http://' + host + ':' + str(port) + '/'
+
+    def _signature(self):
+        # Name, size and modification time of every file combine_data would read
+        extension = storage.FILE_FORMATS[self.file_format]
+        signature = []
+
+        for entry in os.scandir(self.dir_path):
+            name, file_extension = os.path.splitext(entry.name)
+            if file_extension == extension and (name.endswith('-' + self.year_pattern)
+                                                or name == 'company-profiles'):
+                stat = entry.stat()
+                signature.append((entry.name, stat.st_size, stat.st_mtime_ns))
+
+        return sorted(signature)
+
+    @instrument()
+    def reload(self):
+        """
+        Load the data files and calculate the stats screens use. Requests are answered from the
+        previous data until loading finishes.
+
+        :return: None
+        """
+        signature = self._signature()
+
+        financial_data = fundamentals.combine_data(self.dir_path, self.year_pattern,
+                                                   self.file_format, self.columns)
+        ttm_data = financial_data[financial_data['year'] == self.report_year]
+
+        snapshot = {'signature': signature,
+                    'loaded': time.time(),
+                    'financial_data': financial_data,
+                    # Sorted by ticker, so valuations look companies up without a full scan
+                    'by_symbol': financial_data.set_index('symbol', drop=False).sort_index(),
+                    'ttm_data': ttm_data,
+                    'stats': {},
+                    'screening_data': {},
+                    # Guards the memos above, requests are answered on many threads at once
+                    'lock': threading.Lock()}
+
+        if self.stat_map:
+            snapshot['ttm_data'] = self._screening_data(snapshot, self.stat_map)
+
+        # Peer-relative columns are calculated once per load, screens using them cost nothing more
+        if self.peer_columns:
+            snapshot['ttm_data'] = fundamentals.calculate_peer_stats(snapshot['ttm_data'],
+                                                                     self.peer_columns)
+            snapshot['screening_data'] = {}
+
+        # Swapped in whole, requests in flight keep using the snapshot they started with
+        self.snapshot = snapshot
+
+        logger.info('Loaded financial data for %s companies from %s! \n',
+                    financial_data['symbol'].nunique(), self.dir_path)
+
+        return None
+
+    @staticmethod
+    def _memo(snapshot, memo, key, calculate):
+        # Calculated outside the lock so one slow request doesn't hold up the others, the first
+        # result stored is the one every request gets
+        with snapshot['lock']:
+            if key in snapshot[memo]:
+                return snapshot[memo][key]
+
+        value = calculate()
+
+        with snapshot['lock']:
+            return snapshot[memo].setdefault(key, value)
+
+    def _stats(self, snapshot, stat_map, report_year, eval_period):
+        key = (json.dumps(stat_map, sort_keys=True), report_year, eval_period)
+
+        return self._memo(snapshot, 'stats', key, lambda: fundamentals.calculate_multiple_stats(
+            snapshot['financial_data'], report_year, eval_period, stat_map))
+
+    def _screening_data(self, snapshot, stat_map):
+        def calculate():
+            ttm_data = snapshot['ttm_data']
+            performance_stats = self._stats(snapshot, stat_map, self.report_year,
+                                            self.eval_period)
+            new_cols = [x for x in performance_stats if x not in ttm_data]
+            return ttm_data.merge(performance_stats[new_cols + ['year']], on=['symbol', 'year'],
+                                  how='inner')
+
+        return self._memo(snapshot, 'screening_data', json.dumps(stat_map, sort_keys=True),
+                          calculate)
+
+    @instrument()
+    def screen(self, criteria, stat_map=None):
+        """
+        Screen the report year's data, see company_fundamentals.screen_stocks.
+
+        :param criteria: Dictionary containing the column name and quantitative range desired
+               for that column
+        :param stat_map: Optional dictionary of extra stats the criteria use, ex:
+               {'roe': ['median']} for '10Y roe median'
+        :return: List of qualified stock tickers
+        :rtype: List
+        """
+        snapshot = self.snapshot
+        ttm_data = self._screening_data(snapshot, stat_map) if stat_map else snapshot['ttm_data']
+
+        return fundamentals.screen_stocks(ttm_data, **criteria)
+
+    @instrument()
+    def calculate_stats(self, stat_map, report_year=None, eval_period=None):
+        """
+        Calculate N year stats, see company_fundamentals.calculate_multiple_stats.
+
+        :param stat_map: Dictionary containing column names as keys and a statistic, or a list
+               of statistics, as values
+        :param report_year: Ending year of calculation, defaults to the service's report year
+        :param eval_period: Number of years to include, defaults to the service's evaluation period
+        :return: DataFrame containing 'symbol', 'NY column stat' and 'year' columns
+        :rtype: pandas.DataFrame
+        """
+        return self._stats(self.snapshot, stat_map, report_year or self.report_year,
+                           eval_period or self.eval_period).reset_index()
+
+    @instrument()
+    def value(self, growth_estimates, projection_window=10, risk_free_rate=0.0069,
+              market_risk_premium=0.06, gdp_growth_rate=0.029, margin_of_safety=0.25):
+        """
+        Run the DCF chain (prepare_valuation_inputs through calculate_margin_of_safety).
+
+        :param growth_estimates: Dictionary containing stock tickers as keys and long term growth
+               rate estimates as values
+        :param projection_window: Number of years into the future we should generate projections for
+        :param risk_free_rate: See calculate_discount_rate
+        :param market_risk_premium: See calculate_discount_rate
+        :param gdp_growth_rate: See calculate_terminal_value
+        :param margin_of_safety: See calculate_margin_of_safety
+        :return: DataFrame containing DCF model inputs, intrinsic value outputs, and a buy/no buy
+                 column
+        :rtype: pandas.DataFrame
+        """
+        by_symbol = self.snapshot['by_symbol']
+        tickers = [x for x in growth_estimates if x in by_symbol.index]
+
+        df = by_symbol.loc[tickers].reset_index(drop=True)
+
+        valuation_data = fundamentals.prepare_valuation_inputs(df, self.report_year,
+                                                               self.eval_period, *tickers)
+        valuation_data = fundamentals.calculate_discount_rate(valuation_data, risk_free_rate,
+                                                              market_risk_premium)
+        valuation_data = fundamentals.calculate_discounted_free_cash_flow(
+            valuation_data, projection_window, **{x: growth_estimates[x] for x in tickers})
+        valuation_data = fundamentals.calculate_terminal_value(valuation_data, gdp_growth_rate)
+        valuation_data = fundamentals.calculate_intrinsic_value(valuation_data)
+
+        return fundamentals.calculate_margin_of_safety(valuation_data, margin_of_safety)
+
+    def respond(self, method, path, body):
+        """
+        Answer a request to one of the service's endpoints.
+
+        :param method: 'GET' or 'POST'
+        :param path: Request path, ex: '/screen'
+        :param body: Raw JSON request body of POST requests
+        :return: Tuple of status code and JSON response body
+        :rtype: tuple
+        """
+        route = path.strip('/')
+
+        try:
+            if method == 'GET' and route == 'status':
+                snapshot = self.snapshot
+                status = {'loaded': snapshot['loaded'],
+                          'companies': int(snapshot['financial_data']['symbol'].nunique()),
+                          'rows': len(snapshot['financial_data']),
+                          'report_year': self.report_year,
+                          'eval_period': self.eval_period,
+                          'files': [x[0] for x in snapshot['signature']]}
+                return 200, json.dumps(status).encode('utf-8')
+
+            if method != 'POST' or route not in ('screen', 'stats', 'valuation'):
+                return 404, b'{"error": "Unknown endpoint"}'
+
+            request = json.loads(body or b'{}')
+
+            if route == 'screen':
+                symbols = self.screen(request['criteria'], request.get('stats'))
+                return 200, json.dumps({'symbols': [str(x) for x in symbols]}).encode('utf-8')
+
+            if route == 'stats':
+                return 200, _records(self.calculate_stats(request['stats'],
+                                                          request.get('report_year'),
+                                                          request.get('eval_period')))
+
+            parameters = {x: request[x] for x in ['projection_window', 'risk_free_rate',
+                                                  'market_risk_premium', 'gdp_growth_rate',
+                                                  'margin_of_safety'] if x in request}
+            return 200, _records(self.value(request['growth_estimates'], **parameters))
+
+        except (KeyError, ValueError, TypeError) as error:
+            return 400, json.dumps({'error': type(error).__name__ + ': ' + str(error)}) \
+                .encode('utf-8')
+
+        # Anything else is a bug, the client still gets an answer instead of a dropped connection
+        except Exception as error:
+            logger.warning('Failed to answer %s %s', method, path, exc_info=True)
+            return 500, json.dumps({'error': type(error).__name__ + ': ' + str(error)}) \
+                .encode('utf-8')
+
+    def _watch(self):
+        # Reload once the directory has changed and then stayed unchanged for one interval, so
+        # files that are still being written are not read
+        pending = None
+
+        while not self.stopped.wait(self.poll_interval):
+            try:
+                signature = self._signature()
+                if signature == self.snapshot['signature']:
+                    pending = None
+                elif signature == pending:
+                    self.reload()
+                    pending = None
+                else:
+                    pending = signature
+            except Exception:
+                logger.warning('Failed to reload %s', self.dir_path, exc_info=True)
+
+    def start(self):
+        """
+        Serve requests and watch the data directory from background threads.
+
+        :return: The running service
+        :rtype: ScreeningService
+        """
+        self.stopped.clear()
+        self.watcher = threading.Thread(target=self._watch, daemon=True)
+        self.watcher.start()
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+        return self
+
+    def stop(self):
+        """
+        Stop serving requests and watching the data directory.
+
+        :return: None
+        """
+        self.stopped.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+        return None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='In-memory screening and valuation service')
+    parser.add_argument('dir_path')
+    parser.add_argument('--year-pattern', default='10Y')
+    parser.add_argument('--report-year', type=int, default=2019)
+    parser.add_argument('--eval-period', type=int, default=10)
+    parser.add_argument('--stats', type=json.loads, default=None)
+    parser.add_argument('--peer-columns', type=lambda x: x.split(','), default=None)
+    parser.add_argument('--file-format', default='csv', choices=['csv', 'parquet', 'feather'])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--poll-interval', type=float, default=2.0)
+    options = parser.parse_args()
+
+    set_verbosity()
+
+    service = ScreeningService(options.dir_path, options.year_pattern, options.report_year,
+                               options.eval_period, options.stats, options.file_format,
+                               peer_columns=options.peer_columns, host=options.host,
+                               port=options.port, poll_interval=options.poll_interval)
+    service.start()
+
+    print('Serving ' + options.dir_path + ' at ' + service.url)
+
+    try:
+        service.thread.join()
+    except KeyboardInterrupt:
+        service.stop()
@@ -0,0 +1,148 @@
+from fundamental.instrumentation import instrument
+
+import csv
+import os
+import pandas as pd
+
+FILE_FORMATS = {'csv': '.csv', 'parquet': '.parquet', 'feather': '.feather'}
+
+COMPRESSION = 'zstd'
+
+
+def _require_pyarrow(file_format):
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError('pyarrow is required to store data as ' + file_format
+                          + ', install it with: pip install pyarrow')
+
+    return pyarrow
+
+
+def file_format_of(path):
+    """
+    Determine the storage format of a file from its extension.
+
+    :param path: Path to a data file
+    :return: String 'csv', 'parquet' or 'feather'
+    :rtype: str
+    """
+    extension = os.path.splitext(path)[1]
+
+    for file_format, format_extension in FILE_FORMATS.items():
+        if extension == format_extension:
+            return file_format
+
+    raise ValueError('Unsupported file extension: ' + path)
+
+
+@instrument()
+def write_data(df, path, file_format='csv'):
+    """
+    Write a DataFrame to disk in the requested format. Columnar formats keep column types and
+    are compressed.
+
+    :param df: DataFrame to store
+    :param path: Destination path without a file extension, ex: 'data/financials-10Y'
+    :param file_format: String 'csv', 'parquet' or 'feather'
+    :return: Path of the file written
+    :rtype: str
+    """
+    path = path + FILE_FORMATS[file_format]
+
+    if file_format == 'csv':
+        df.to_csv(path, index=False, header=True)
+
+    else:
+        pyarrow = _require_pyarrow(file_format)
+        table = pyarrow.Table.from_pandas(df, preserve_index=False)
+
+        if file_format == 'parquet':
+            from pyarrow import parquet
+            parquet.write_table(table, path, compression=COMPRESSION)
+        else:
+            from pyarrow import feather
+            feather.write_feather(table, path, compression=COMPRESSION)
+
+    return path
+
+
+def read_column_names(path):
+    """
+    Read the column names of a data file without loading its data.
+
+    :param path: Path to a csv, parquet or feather file
+    :return: List of column names
+    :rtype: List
+    """
+    file_format = file_format_of(path)
+
+    if file_format == 'csv':
+        with open(path, newline='') as file:
+            return next(csv.reader(file), [])
+
+    _require_pyarrow(file_format)
+
+    if file_format == 'parquet':
+        from pyarrow import parquet
+        return parquet.read_schema(path, memory_map=True).names
+
+    from pyarrow import ipc
+    with ipc.open_file(path) as reader:
+        return reader.schema.names
+
+
+@instrument()
+def read_data(path, columns=None):
+    """
+    Read a data file written by write_data. Columnar formats are memory-mapped and only the
+    requested columns are read from disk.
+
+    :param path: Path to a csv, parquet or feather file
+    :param columns: Optional list of columns to read, columns missing from the file are ignored
+    :return: DataFrame containing the requested columns
+    :rtype: pandas.DataFrame
+    """
+    file_format = file_format_of(path)
+
+    if file_format == 'csv':
+        if columns is None:
+            return pd.read_csv(path)
+
+        columns = set(columns)
+        return pd.read_csv(path, usecols=[x for x in read_column_names(path) if x in columns])
+
+    _require_pyarrow(file_format)
+
+    if columns is not None:
+        columns = set(columns)
+        columns = [x for x in read_column_names(path) if x in columns]
+
+    if file_format == 'parquet':
+        from pyarrow import parquet
+        table = parquet.read_table(path, columns=columns, memory_map=True)
+
+    else:
+        from pyarrow import feather
+        table = feather.read_table(path, columns=columns, memory_map=True)
+
+    return table.to_pandas()
+
+
+def export_csv(directory, file_format):
+    """
+    Write a csv copy of every file of the provided format in a directory.
+
+    :param directory: Local directory where data files reside
+    :param file_format: String 'parquet' or 'feather'
+    :return: List of csv files written
+    :rtype: List
+    """
+    exported = []
+
+    for file in sorted(os.listdir(directory)):
+        if file.endswith(FILE_FORMATS[file_format]):
+            path = os.path.join(directory, os.path.splitext(file)[0])
+            exported.append(write_data(read_data(path + FILE_FORMATS[file_format]), path))
+
+    return exported
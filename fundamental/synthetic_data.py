@@ -0,0 +1,435 @@
+from fundamental import company_financials as financials
+from fundamental import ingest
+from fundamental import storage
+
+import logging
+import os
+import string
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+SECTOR_INDUSTRIES = {'Consumer Cyclical': ['Apparel Retail', 'Auto Parts', 'Restaurants',
+                                           'Specialty Retail', 'Home Improvement Retail'],
+                     'Industrials': ['Specialty Industrial Machinery', 'Aerospace & Defense',
+                                     'Building Products & Equipment', 'Trucking'],
+                     'Financial Services': ['Banks—Regional', 'Asset Management',
+                                            'Insurance—Property & Casualty'],
+                     'Technology': ['Software—Application', 'Semiconductors',
+                                    'Communication Equipment'],
+                     'Healthcare': ['Medical Devices', 'Biotechnology', 'Drug Manufacturers'],
+                     'Real Estate': ['REIT—Residential', 'REIT—Office'],
+                     'Basic Materials': ['Specialty Chemicals', 'Steel'],
+                     'Consumer Defensive': ['Packaged Foods', 'Household & Personal Products'],
+                     'Energy': ['Oil & Gas E&P', 'Oil & Gas Midstream'],
+                     'Utilities': ['Utilities—Regulated Electric'],
+                     'Communication Services': ['Entertainment', 'Telecom Services']}
+
+# Exchange names as returned by the API and the short names reported alongside them
+EXCHANGES = {'New York Stock Exchange': 'NYSE', 'Nasdaq Global Select': 'NASDAQ',
+             'Nasdaq': 'NASDAQ', 'NasdaqGS': 'NASDAQ', 'NYSE': 'NYSE',
+             'NYSE American': 'AMEX'}
+
+# Endpoints queried for each financial data request, as in company_financials.get_financial_data
+REQUEST_ENDPOINTS = {'financials': ['income-statement', 'balance-sheet-statement',
+                                    'cash-flow-statement'],
+                     'financial-ratios': ['ratios'],
+                     'enterprise-value': ['enterprise-values'],
+                     'company-key-metrics': ['key-metrics'],
+                     'financial-statement-growth': ['financial-growth']}
+
+QUARTER_MONTHS = {'Q1': 3, 'Q2': 6, 'Q3': 9, 'Q4': 12}
+
+MISSING_VALUE_TICKERS = {'NA', 'NAN', 'NULL', 'NONE'}
+
+
+def synthetic_tickers(n_tickers):
+    """
+    Build N unique stock tickers of 2 to 4 capital letters, ex: 'AB', ..., 'ZZZZ'. Tickers that
+    pandas reads back as missing values ('NA', 'NAN', 'NULL', 'NONE') are skipped.
+
+    :param n_tickers: Number of tickers, at most 475,224
+    :return: List of stock tickers
+    :rtype: List
+    """
+    tickers = []
+    letters = string.ascii_uppercase
+
+    for length in range(2, 5):
+        for i in range(26 ** length):
+            if len(tickers) == n_tickers:
+                break
+            ticker = ''
+            for _ in range(length):
+                i, remainder = divmod(i, 26)
+                ticker = letters[remainder] + ticker
+            if ticker not in MISSING_VALUE_TICKERS:
+                tickers.append(ticker)
+
+    if len(tickers) < n_tickers:
+        raise ValueError('Cannot build more than ' + str(len(tickers)) + ' unique tickers')
+
+    return tickers
+
+
+def _company_model(n_tickers, n_periods, period, rng):
+    """
+    Simulate the handful of drivers each company's statements are derived from: revenue on a
+    per-company growth path, margins, balance sheet structure and valuation multiples. Arrays
+    are shaped (tickers, periods) so every statement line is consistent with the others.
+    """
+    shape = (n_tickers, n_periods)
+    scale = 0.25 if period == 'quarter' else 1.0
+
+    def per_company(values):
+        return np.asarray(values)[:, None]
+
+    growth = per_company(rng.normal(0.05, 0.08, n_tickers)) * scale
+    revenue = per_company(rng.lognormal(20.5, 1.5, n_tickers)) * scale \
+        * np.cumprod(1 + growth + rng.normal(0, 0.06 * np.sqrt(scale), shape), axis=1)
+
+    m = {'revenue': revenue, 'scale': scale}
+    m['grossProfitRatio'] = np.clip(per_company(rng.uniform(0.2, 0.6, n_tickers))
+                                    + rng.normal(0, 0.02, shape), 0.05, 0.95)
+    m['operatingIncomeRatio'] = m['grossProfitRatio'] \
+        - per_company(rng.uniform(0.15, 0.45, n_tickers)) + rng.normal(0, 0.02, shape)
+    m['effectiveTaxRate'] = np.clip(rng.normal(0.23, 0.05, shape), 0.0, 0.45)
+
+    m['totalAssets'] = revenue / scale * per_company(rng.uniform(0.6, 1.6, n_tickers))
+    m['totalDebt'] = m['totalAssets'] * per_company(rng.uniform(0.05, 0.5, n_tickers))
+    m['interestRate'] = per_company(rng.uniform(0.02, 0.08, n_tickers))
+    m['totalStockholdersEquity'] = m['totalAssets'] \
+        * np.clip(per_company(rng.uniform(0.2, 0.6, n_tickers)) + rng.normal(0, 0.03, shape),
+                  0.05, 0.95)
+    m['totalLiabilities'] = m['totalAssets'] - m['totalStockholdersEquity']
+    m['totalCurrentAssets'] = m['totalAssets'] * per_company(rng.uniform(0.25, 0.6, n_tickers))
+    m['currentRatio'] = per_company(rng.lognormal(0.5, 0.4, n_tickers)) \
+        * np.exp(rng.normal(0, 0.08, shape))
+    m['cashAndCashEquivalents'] = m['totalCurrentAssets'] * rng.uniform(0.1, 0.4, shape)
+
+    m['shares'] = revenue[:, :1] / scale / per_company(rng.lognormal(3.0, 0.8, n_tickers)) \
+        * np.cumprod(1 + rng.normal(0, 0.01, shape), axis=1)
+    m['peRatio'] = per_company(rng.lognormal(2.9, 0.4, n_tickers)) \
+        * np.exp(rng.normal(0, 0.15, shape))
+    m['payoutRatio'] = per_company(rng.choice([0.0, 0.2, 0.4], n_tickers)) \
+        * rng.uniform(0.8, 1.2, shape)
+    m['beta'] = rng.lognormal(0.0, 0.35, n_tickers)
+
+    return m
+
+
+def _statement_fields(m, rng):
+    """
+    Derive every statement, ratio, key metric, enterprise value and growth field from the
+    company model. Fields not derived here are filled by _fill_fields.
+    """
+    revenue = m['revenue']
+    shape = revenue.shape
+    f = {'revenue': revenue}
+
+    f['grossProfit'] = revenue * m['grossProfitRatio']
+    f['costOfRevenue'] = revenue - f['grossProfit']
+    f['operatingIncome'] = revenue * m['operatingIncomeRatio']
+    f['operatingExpenses'] = f['grossProfit'] - f['operatingIncome']
+    f['researchAndDevelopmentExpenses'] = f['operatingExpenses'] * rng.uniform(0, 0.3, shape)
+    f['generalAndAdministrativeExpenses'] = f['operatingExpenses'] \
+        - f['researchAndDevelopmentExpenses']
+    f['costAndExpenses'] = f['costOfRevenue'] + f['operatingExpenses']
+    f['depreciationAndAmortization'] = revenue * rng.uniform(0.02, 0.06, shape)
+    f['ebitda'] = f['operatingIncome'] + f['depreciationAndAmortization']
+    f['interestExpense'] = m['totalDebt'] * m['interestRate'] * m['scale']
+    f['incomeBeforeTax'] = f['operatingIncome'] - f['interestExpense']
+    f['incomeTaxExpense'] = np.maximum(f['incomeBeforeTax'], 0) * m['effectiveTaxRate']
+    f['netIncome'] = f['incomeBeforeTax'] - f['incomeTaxExpense']
+    f['weightedAverageShsOut'] = m['shares']
+    f['weightedAverageShsOutDil'] = m['shares'] * 1.01
+    f['eps'] = f['netIncome'] / m['shares']
+    f['epsdiluted'] = f['netIncome'] / f['weightedAverageShsOutDil']
+
+    for name, value in [('grossProfitRatio', 'grossProfit'), ('ebitdaratio', 'ebitda'),
+                        ('operatingIncomeRatio', 'operatingIncome'),
+                        ('incomeBeforeTaxRatio', 'incomeBeforeTax'),
+                        ('netIncomeRatio', 'netIncome')]:
+        f[name] = f[value] / revenue
+
+    f['totalAssets'] = m['totalAssets']
+    f['totalCurrentAssets'] = m['totalCurrentAssets']
+    f['totalNonCurrentAssets'] = f['totalAssets'] - f['totalCurrentAssets']
+    f['cashAndCashEquivalents'] = m['cashAndCashEquivalents']
+    f['shortTermInvestments'] = f['cashAndCashEquivalents'] * rng.uniform(0, 0.5, shape)
+    f['cashAndShortTermInvestments'] = f['cashAndCashEquivalents'] + f['shortTermInvestments']
+    f['netReceivables'] = f['totalCurrentAssets'] * rng.uniform(0.15, 0.35, shape)
+    f['inventory'] = f['totalCurrentAssets'] * rng.uniform(0.1, 0.4, shape)
+    f['otherCurrentAssets'] = f['totalCurrentAssets'] - f['cashAndShortTermInvestments'] \
+        - f['netReceivables'] - f['inventory']
+    f['propertyPlantEquipmentNet'] = f['totalNonCurrentAssets'] * rng.uniform(0.3, 0.6, shape)
+    f['goodwillAndIntangibleAssets'] = f['totalNonCurrentAssets'] * rng.uniform(0.1, 0.4, shape)
+    f['goodwill'] = f['goodwillAndIntangibleAssets'] * 0.6
+    f['intangibleAssets'] = f['goodwillAndIntangibleAssets'] * 0.4
+    f['totalDebt'] = m['totalDebt']
+    f['shortTermDebt'] = f['totalDebt'] * rng.uniform(0.05, 0.3, shape)
+    f['longTermDebt'] = f['totalDebt'] - f['shortTermDebt']
+    f['netDebt'] = f['totalDebt'] - f['cashAndCashEquivalents']
+    f['totalCurrentLiabilities'] = f['totalCurrentAssets'] / m['currentRatio']
+    f['totalLiabilities'] = np.maximum(m['totalLiabilities'],
+                                       f['totalCurrentLiabilities'] + f['longTermDebt'])
+    f['totalNonCurrentLiabilities'] = f['totalLiabilities'] - f['totalCurrentLiabilities']
+    f['accountPayables'] = f['totalCurrentLiabilities'] * rng.uniform(0.2, 0.5, shape)
+    f['totalStockholdersEquity'] = f['totalAssets'] - f['totalLiabilities']
+    f['retainedEarnings'] = f['totalStockholdersEquity'] * rng.uniform(0.3, 1.0, shape)
+    f['commonStock'] = f['totalStockholdersEquity'] - f['retainedEarnings']
+    f['totalLiabilitiesAndStockholdersEquity'] = f['totalAssets']
+    f['totalInvestments'] = f['shortTermInvestments']
+
+    f['operatingCashFlow'] = f['netIncome'] + f['depreciationAndAmortization'] \
+        + revenue * rng.normal(0, 0.02, shape)
+    f['netCashProvidedByOperatingActivities'] = f['operatingCashFlow']
+    f['capitalExpenditure'] = -revenue * rng.uniform(0.02, 0.08, shape)
+    f['investmentsInPropertyPlantAndEquipment'] = f['capitalExpenditure']
+    f['freeCashFlow'] = f['operatingCashFlow'] + f['capitalExpenditure']
+    f['dividendsPaid'] = -np.maximum(f['netIncome'], 0) * m['payoutRatio']
+    f['netChangeInCash'] = np.diff(f['cashAndCashEquivalents'], axis=1, prepend=np.nan)
+    f['cashAtEndOfPeriod'] = f['cashAndCashEquivalents']
+    f['cashAtBeginningOfPeriod'] = f['cashAndCashEquivalents'] - f['netChangeInCash']
+
+    shares = m['shares']
+    f['stockPrice'] = np.maximum(f['eps'], f['revenue'] / shares * 0.02) * m['peRatio']
+    f['numberOfShares'] = shares
+    f['marketCap'] = f['marketCapitalization'] = f['stockPrice'] * shares
+    f['minusCashAndCashEquivalents'] = f['cashAndCashEquivalents']
+    f['addTotalDebt'] = f['totalDebt']
+    f['enterpriseValue'] = f['marketCap'] + f['totalDebt'] - f['cashAndCashEquivalents']
+
+    equity = f['totalStockholdersEquity']
+    f['currentRatio'] = f['totalCurrentAssets'] / f['totalCurrentLiabilities']
+    f['quickRatio'] = (f['totalCurrentAssets'] - f['inventory']) / f['totalCurrentLiabilities']
+    f['cashRatio'] = f['cashAndCashEquivalents'] / f['totalCurrentLiabilities']
+    f['roe'] = f['returnOnEquity'] = f['netIncome'] / equity
+    f['returnOnAssets'] = f['netIncome'] / f['totalAssets']
+    f['debtToEquity'] = f['debtEquityRatio'] = f['totalDebt'] / equity
+    f['debtToAssets'] = f['debtRatio'] = f['totalDebt'] / f['totalAssets']
+    f['interestCoverage'] = f['operatingIncome'] / f['interestExpense']
+    f['effectiveTaxRate'] = m['effectiveTaxRate']
+    f['grossProfitMargin'] = f['grossProfitRatio']
+    f['operatingProfitMargin'] = f['ebitPerRevenue'] = f['operatingIncomeRatio']
+    f['pretaxProfitMargin'] = f['incomeBeforeTaxRatio']
+    f['netProfitMargin'] = f['netIncomeRatio']
+    f['payoutRatio'] = f['dividendPayoutRatio'] = m['payoutRatio']
+    f['assetTurnover'] = revenue / f['totalAssets']
+
+    f['revenuePerShare'] = revenue / shares
+    f['netIncomePerShare'] = f['eps']
+    f['operatingCashFlowPerShare'] = f['operatingCashFlow'] / shares
+    f['freeCashFlowPerShare'] = f['freeCashFlow'] / shares
+    f['cashPerShare'] = f['cashAndCashEquivalents'] / shares
+    f['bookValuePerShare'] = f['shareholdersEquityPerShare'] = equity / shares
+    f['tangibleBookValuePerShare'] = (equity - f['goodwillAndIntangibleAssets']) / shares
+    f['peRatio'] = f['priceEarningsRatio'] = f['stockPrice'] / f['eps']
+    f['priceToSalesRatio'] = f['priceSalesRatio'] = f['marketCap'] / revenue
+    f['pbRatio'] = f['priceToBookRatio'] = f['priceBookValueRatio'] = f['marketCap'] / equity
+    f['pfcfRatio'] = f['priceToFreeCashFlowsRatio'] = f['marketCap'] / f['freeCashFlow']
+    f['pocfratio'] = f['priceToOperatingCashFlowsRatio'] = f['marketCap'] / f['operatingCashFlow']
+    f['earningsYield'] = f['eps'] / f['stockPrice']
+    f['freeCashFlowYield'] = f['freeCashFlow'] / f['marketCap']
+    f['dividendYield'] = -f['dividendsPaid'] / f['marketCap']
+    f['evToSales'] = f['enterpriseValue'] / revenue
+    f['enterpriseValueOverEBITDA'] = f['enterpriseValueMultiple'] = f['enterpriseValue'] \
+        / f['ebitda']
+    f['netDebtToEBITDA'] = f['netDebt'] / f['ebitda']
+    f['workingCapital'] = f['totalCurrentAssets'] - f['totalCurrentLiabilities']
+    f['investedCapital'] = equity + f['totalDebt']
+    f['roic'] = f['operatingIncome'] * (1 - m['effectiveTaxRate']) / f['investedCapital']
+
+    for growth, value in [('revenueGrowth', 'revenue'), ('grossProfitGrowth', 'grossProfit'),
+                          ('ebitgrowth', 'operatingIncome'),
+                          ('operatingIncomeGrowth', 'operatingIncome'),
+                          ('netIncomeGrowth', 'netIncome'), ('epsgrowth', 'eps'),
+                          ('epsdilutedGrowth', 'epsdiluted'),
+                          ('weightedAverageSharesGrowth', 'weightedAverageShsOut'),
+                          ('weightedAverageSharesDilutedGrowth', 'weightedAverageShsOutDil'),
+                          ('operatingCashFlowGrowth', 'operatingCashFlow'),
+                          ('freeCashFlowGrowth', 'freeCashFlow'),
+                          ('receivablesGrowth', 'netReceivables'),
+                          ('inventoryGrowth', 'inventory'), ('assetGrowth', 'totalAssets'),
+                          ('bookValueperShareGrowth', 'bookValuePerShare'),
+                          ('debtGrowth', 'totalDebt')]:
+        previous = np.concatenate([np.full((shape[0], 1), np.nan), f[value][:, :-1]], axis=1)
+        f[growth] = (f[value] - previous) / np.abs(previous)
+
+    return f
+
+
+def _fill_fields(fields, derived, shape, rng):
+    """
+    Fill fields not derived from the company model with small ratio-like values, so every
+    column the API returns is present and numeric. Values are rounded to 4 decimals like the
+    API's own figures.
+    """
+    filled = {}
+
+    for field in fields:
+        if field in derived:
+            value = derived[field]
+            filled[field] = np.round(value, 4) if value.dtype.kind == 'f' else value
+        else:
+            filled[field] = np.round(rng.normal(0.0, 0.1, shape), 4)
+
+    return filled
+
+
+def _period_labels(n_periods, report_year, period, fiscal_month):
+    """
+    Build report dates (tickers, periods) and period labels, oldest first.
+    """
+    if period == 'quarter':
+        quarters = np.arange(n_periods)[::-1]
+        years = report_year - quarters // 4
+        labels = np.array(['Q4', 'Q3', 'Q2', 'Q1'])[quarters % 4]
+        months = np.vectorize(QUARTER_MONTHS.get)(labels)
+        dates = np.char.add(np.char.add(years.astype(str), '-'),
+                            np.char.add(np.char.zfill(months.astype(str), 2), '-28'))
+        return np.broadcast_to(dates, (len(fiscal_month), n_periods)), labels
+
+    years = report_year - np.arange(n_periods)[::-1]
+    months = np.char.zfill(fiscal_month.astype(str), 2)
+    dates = np.char.add(np.char.add(np.char.add(years.astype(str)[None, :], '-'),
+                                    months[:, None]), '-28')
+
+    return dates, np.full(n_periods, 'FY')
+
+
+def generate_endpoint_data(n_tickers, n_periods=11, report_year=2019, period='annual', seed=0):
+    """
+    Generate synthetic FinancialModelingPrep data for N stock tickers x M reporting periods. Every
+    endpoint's frame has the columns listed in ingest.ENDPOINT_FIELDS, nested fields flattened
+    with '.' separators as returned by ingest.build_frame. Statement lines, ratios, key metrics,
+    enterprise values and growth rates are derived from one simulated model per company, so they
+    are consistent with each other.
+
+    :param n_tickers: Number of stock tickers
+    :param n_periods: Number of reporting periods per ticker, ending with the report year
+    :param report_year: Year of most recent financial report
+    :param period: String 'annual' or 'quarter'
+    :param seed: Seed for reproducible data
+    :return: Dictionary mapping each endpoint to a DataFrame
+    :rtype: dict
+    """
+    rng = np.random.default_rng(seed)
+    tickers = np.array(synthetic_tickers(n_tickers), dtype=object)
+
+    model = _company_model(n_tickers, n_periods, period, rng)
+    derived = _statement_fields(model, rng)
+    shape = model['revenue'].shape
+
+    fiscal_month = rng.choice([3, 6, 9, 12], n_tickers, p=[0.1, 0.15, 0.1, 0.65])
+    dates, labels = _period_labels(n_periods, report_year, period, fiscal_month)
+
+    derived['symbol'] = np.repeat(tickers[:, None], n_periods, axis=1)
+    derived['date'] = dates
+    derived['period'] = np.broadcast_to(labels, shape)
+    derived['fillingDate'] = derived['acceptedDate'] = dates
+    derived['link'] = derived['finalLink'] = np.full(shape, None, dtype=object)
+
+    endpoint_data = {}
+
+    for endpoint in ['income-statement', 'balance-sheet-statement', 'cash-flow-statement',
+                     'ratios', 'key-metrics', 'enterprise-values', 'financial-growth']:
+        fields = ingest.ENDPOINT_FIELDS[endpoint]
+        filled = _fill_fields(fields, derived, shape, rng)
+        endpoint_data[endpoint] = pd.DataFrame({field: np.asarray(filled[field]).ravel()
+                                                for field in fields})
+
+    sectors = list(SECTOR_INDUSTRIES)
+    sector = rng.choice(sectors, n_tickers, p=[0.3] + [0.07] * (len(sectors) - 1))
+    industry = [SECTOR_INDUSTRIES[x][rng.integers(len(SECTOR_INDUSTRIES[x]))] for x in sector]
+    exchange = rng.choice(list(EXCHANGES), n_tickers)
+    price = np.round(np.abs(derived['stockPrice'][:, -1]), 2)
+    changes = np.round(price * rng.normal(0, 0.02, n_tickers), 2)
+    names = np.char.add(tickers.astype(str), ' Holdings Inc.')
+
+    endpoint_data['stock/list'] = pd.DataFrame({'symbol': tickers, 'name': names,
+                                                'price': price, 'exchange': exchange})
+
+    endpoint_data['company/profile'] = pd.DataFrame({
+        'symbol': tickers,
+        'profile.price': price,
+        'profile.beta': np.round(model['beta'], 6),
+        'profile.volAvg': np.round(rng.lognormal(13, 1.5, n_tickers)),
+        'profile.mktCap': np.round(price * derived['numberOfShares'][:, -1]),
+        'profile.lastDiv': np.round(-derived['dividendsPaid'][:, -1]
+                                    / derived['numberOfShares'][:, -1], 2),
+        'profile.range': [str(np.round(x * 0.8, 2)) + '-' + str(np.round(x * 1.2, 2))
+                          for x in price],
+        'profile.changes': changes,
+        'profile.changesPercentage': ['(' + format(x, '+.2f') + '%)'
+                                      for x in changes / np.maximum(price, 0.01) * 100],
+        'profile.companyName': names,
+        'profile.exchange': exchange,
+        'profile.exchangeShortName': [EXCHANGES[x] for x in exchange],
+        'profile.industry': industry,
+        'profile.website': ['https://www.' + x.lower() + '.example.com' for x in tickers],
+        'profile.description': [x + ' is a synthetic company generated for testing.'
+                                for x in names],
+        'profile.ceo': 'Jane Doe',
+        'profile.sector': sector,
+        'profile.image': ['https://financialmodelingprep.com/images-New-jpg/' + x + '.jpg'
+                          for x in tickers]})
+
+    return endpoint_data
+
+
+def request_data(endpoint_data, request):
+    """
+    Join the endpoint frames behind one financial data request the way get_financial_data
+    does, ex: the three financial statements for 'financials'.
+
+    :param endpoint_data: Dictionary returned by generate_endpoint_data
+    :param request: Financial data request, one of the keys of REQUEST_ENDPOINTS
+    :return: DataFrame of raw (not yet cleaned) financial data
+    :rtype: pandas.DataFrame
+    """
+    endpoints = REQUEST_ENDPOINTS[request]
+    data = endpoint_data[endpoints[0]]
+
+    for endpoint in endpoints[1:]:
+        data = data.merge(endpoint_data[endpoint], on=['symbol', 'date'], how='outer',
+                          suffixes=('', '_x'))
+        data = data.drop([x for x in data if x.endswith('_x')], axis=1)
+
+    return data
+
+
+def write_dataset(directory, n_tickers, eval_period=10, report_year=2019, file_format='csv',
+                  seed=0):
+    """
+    Write a synthetic dataset laid out like the files main.get_company_financials stores: one
+    'company-profiles' file and one '<request>-<eval_period>Y' file per financial data request,
+    cleaned with a 'year' column.
+
+    :param directory: Directory that data files should be written to
+    :param n_tickers: Number of stock tickers
+    :param eval_period: Number of years prior to most recent report included in the data
+    :param report_year: Year of most recent financial report
+    :param file_format: Storage format of the files - 'csv', 'parquet' or 'feather'
+    :param seed: Seed for reproducible data
+    :return: List of files written
+    :rtype: List
+    """
+    logger.info('Generating %sY synthetic data for %s companies...', eval_period, n_tickers)
+
+    os.makedirs(directory, exist_ok=True)
+
+    endpoint_data = generate_endpoint_data(n_tickers, eval_period + 1, report_year, seed=seed)
+    written = [storage.write_data(endpoint_data['company/profile'],
+                                  os.path.join(directory, 'company-profiles'), file_format)]
+
+    for request in REQUEST_ENDPOINTS:
+        data = financials.clean_financial_data(request_data(endpoint_data, request))
+        written.append(storage.write_data(data, os.path.join(directory, request + '-'
+                                                             + str(eval_period) + 'Y'),
+                                          file_format))
+
+    logger.info('Wrote synthetic data to %s! \n', directory)
+
+    return written
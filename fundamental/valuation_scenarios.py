@@ -0,0 +1,249 @@
+from fundamental import company_fundamentals as fundamentals
+from fundamental.instrumentation import instrument
+
+import numpy as np
+import pandas as pd
+
+# Scenario parameters and the defaults used by the single-scenario DCF chain
+DEFAULT_PARAMETERS = {'long_term_growth_rate': 0.0,
+                      'growth_rate_shift': 0.0,
+                      'risk_free_rate': 0.0069,
+                      'market_risk_premium': 0.06,
+                      'gdp_growth_rate': 0.029,
+                      'margin_of_safety': 0.25}
+
+# Upper bound on ticker x scenario cells evaluated at once, keeps memory use around 100 MB
+MAX_CELLS = 2 * 10 ** 6
+
+
+def scenario_grid(**kwargs):
+    """
+    Build every combination of the provided parameter values.
+
+    :param kwargs: Scenario parameter names (see DEFAULT_PARAMETERS) as keys and lists of values
+    :return: Dictionary mapping each parameter to an array with one value per scenario
+    :rtype: dict
+    """
+    names = list(kwargs)
+    mesh = np.meshgrid(*[np.asarray(kwargs[x], dtype=float) for x in names], indexing='ij')
+
+    return {name: values.ravel() for name, values in zip(names, mesh)}
+
+
+def sample_scenarios(n_scenarios, distributions, seed=None):
+    """
+    Draw Monte Carlo scenarios from the provided parameter distributions.
+
+    :param n_scenarios: Number of scenarios to draw
+    :param distributions: Dictionary mapping scenario parameters to distributions, ex:
+           {'risk_free_rate': ('normal', 0.0069, 0.002), 'gdp_growth_rate': ('uniform', 0.02,
+           0.03), 'margin_of_safety': ('triangular', 0.2, 0.25, 0.35)}. Constants are accepted
+    :param seed: Optional seed for reproducible draws
+    :return: Dictionary mapping each parameter to an array with one value per scenario
+    :rtype: dict
+    """
+    rng = np.random.default_rng(seed)
+    scenarios = {}
+
+    for name, spec in distributions.items():
+
+        if np.isscalar(spec):
+            scenarios[name] = np.full(n_scenarios, float(spec))
+            continue
+
+        kind, *params = spec
+
+        if kind == 'normal':
+            scenarios[name] = rng.normal(params[0], params[1], n_scenarios)
+        elif kind == 'uniform':
+            scenarios[name] = rng.uniform(params[0], params[1], n_scenarios)
+        elif kind == 'triangular':
+            scenarios[name] = rng.triangular(params[0], params[1], params[2], n_scenarios)
+        elif kind == 'choice':
+            scenarios[name] = rng.choice(np.asarray(params[0], dtype=float), n_scenarios)
+        else:
+            raise ValueError('Unsupported distribution for ' + name + ': ' + str(kind))
+
+    return scenarios
+
+
+def _valuation_arrays(df, long_term_growth_estimates):
+    if long_term_growth_estimates is not None:
+        estimated_growth = pd.DataFrame(long_term_growth_estimates.items(),
+                                        columns=['symbol', 'Long Term Growth Rate'])
+        df = df.merge(estimated_growth, on='symbol')
+
+    df = df.reset_index(drop=True)
+
+    inputs = {x: df[x].to_numpy(dtype=float)[:, None] for x in
+              ['marketCap', 'shortTermDebt', 'longTermDebt', 'Max Interest Rate', 'Max Tax Rate',
+               'profile.beta', 'freeCashFlow', 'cashAndCashEquivalents', 'totalLiabilities',
+               'numberOfShares', 'stockPrice']}
+
+    if long_term_growth_estimates is not None:
+        inputs['Long Term Growth Rate'] = df['Long Term Growth Rate'].to_numpy(dtype=float)[:, None]
+
+    return df, inputs
+
+
+def _evaluate(inputs, rows, scenarios, projection_window):
+    """
+    Run the DCF chain for a block of tickers (rows) against every scenario, the same
+    calculations as calculate_discount_rate -> calculate_margin_of_safety on 2-D arrays.
+    """
+    params = {x: np.asarray(scenarios.get(x, DEFAULT_PARAMETERS[x]), dtype=float)
+              for x in DEFAULT_PARAMETERS}
+    values = {x: inputs[x][rows] for x in inputs}
+
+    market_value_equity = values['marketCap']
+    market_value_debt = (values['shortTermDebt'] + values['longTermDebt']) * 1.20
+    total_market_value_debt_equity = market_value_equity + market_value_debt
+
+    cost_of_debt = values['Max Interest Rate'] * (1 - values['Max Tax Rate'])
+    cost_of_equity = params['risk_free_rate'] + values['profile.beta'] \
+        * params['market_risk_premium']
+
+    discount_rate = np.round((market_value_equity / total_market_value_debt_equity)
+                             * cost_of_equity + (market_value_debt / total_market_value_debt_equity)
+                             * cost_of_debt, 2)
+
+    if 'Long Term Growth Rate' in values:
+        growth_rate = values['Long Term Growth Rate'] + params['growth_rate_shift']
+    else:
+        growth_rate = params['long_term_growth_rate'] + params['growth_rate_shift']
+
+    pv_dfcf, last_fcf, _ = fundamentals.project_free_cash_flow(values['freeCashFlow'], growth_rate,
+                                                               discount_rate, projection_window)
+
+    gdp_growth_rate = params['gdp_growth_rate']
+    terminal_value = (np.round(last_fcf, 2) * (1 + gdp_growth_rate)) / discount_rate \
+        - gdp_growth_rate
+
+    intrinsic_value = (np.round(pv_dfcf, 2) + terminal_value + values['cashAndCashEquivalents']
+                       - values['totalLiabilities']) / values['numberOfShares']
+
+    margin_of_safety_value = intrinsic_value * (1 - params['margin_of_safety'])
+
+    return intrinsic_value, margin_of_safety_value
+
+
+def _row_blocks(n_rows, n_scenarios):
+    block_size = max(1, MAX_CELLS // max(1, n_scenarios))
+
+    for start in range(0, n_rows, block_size):
+        yield slice(start, min(start + block_size, n_rows))
+
+
+def _scenario_count(scenarios):
+    lengths = {np.size(x) for x in scenarios.values()}
+
+    if len(lengths) > 1:
+        raise ValueError('All scenario parameters must have the same number of values')
+
+    return lengths.pop() if lengths else 1
+
+
+@instrument()
+def evaluate_scenarios(df, scenarios, projection_window, long_term_growth_estimates=None):
+    """
+    Calculate the intrinsic value of every stock ticker under every scenario provided.
+
+    :param df: DataFrame containing a single row of valuation inputs for each stock ticker, as
+           returned by prepare_valuation_inputs
+    :param scenarios: Dictionary mapping scenario parameters to equal-length arrays, as returned
+           by scenario_grid or sample_scenarios. Omitted parameters use DEFAULT_PARAMETERS
+    :param projection_window: Number of years into the future we should generate projections for
+    :param long_term_growth_estimates: Optional dictionary containing stock tickers as keys and
+           long term growth rate estimates as values. When provided, tickers without an estimate
+           are dropped and the 'growth_rate_shift' scenario parameter is added to each estimate,
+           otherwise every ticker uses the 'long_term_growth_rate' scenario parameter
+    :return: DataFrame of intrinsic values, one row per stock ticker and one column per scenario
+    :rtype: pandas.DataFrame
+    """
+    df, inputs = _valuation_arrays(df, long_term_growth_estimates)
+    n_scenarios = _scenario_count(scenarios)
+
+    intrinsic_value = np.empty((len(df), n_scenarios))
+
+    for rows in _row_blocks(len(df), n_scenarios):
+        intrinsic_value[rows] = _evaluate(inputs, rows, scenarios, projection_window)[0]
+
+    return pd.DataFrame(intrinsic_value, index=pd.Index(df['symbol'], name='symbol'))
+
+
+@instrument()
+def sensitivity_table(df, projection_window, row_parameter, row_values, column_parameter,
+                      column_values, long_term_growth_estimates=None, **kwargs):
+    """
+    Tabulate each stock ticker's intrinsic value across two scenario parameters.
+
+    :param df: DataFrame containing a single row of valuation inputs for each stock ticker
+    :param projection_window: Number of years into the future we should generate projections for
+    :param row_parameter: Scenario parameter varied across table rows, ex: 'risk_free_rate'
+    :param row_values: Values of the row parameter
+    :param column_parameter: Scenario parameter varied across table columns
+    :param column_values: Values of the column parameter
+    :param long_term_growth_estimates: Optional dictionary of per-ticker growth estimates
+    :param kwargs: Fixed values for any other scenario parameter
+    :return: DataFrame indexed by (symbol, row value) with one column per column value
+    :rtype: pandas.DataFrame
+    """
+    scenarios = scenario_grid(**{row_parameter: row_values, column_parameter: column_values})
+
+    for name, value in kwargs.items():
+        scenarios[name] = np.full(_scenario_count(scenarios), float(value))
+
+    intrinsic_value = evaluate_scenarios(df, scenarios, projection_window,
+                                         long_term_growth_estimates)
+
+    table = intrinsic_value.to_numpy().reshape(len(intrinsic_value), len(row_values),
+                                               len(column_values))
+
+    index = pd.MultiIndex.from_product([intrinsic_value.index, row_values],
+                                       names=['symbol', row_parameter])
+
+    return pd.DataFrame(table.reshape(-1, len(column_values)), index=index,
+                        columns=pd.Index(column_values, name=column_parameter))
+
+
+@instrument()
+def simulate_intrinsic_value(df, projection_window, distributions, n_scenarios=100000,
+                             long_term_growth_estimates=None,
+                             percentiles=(5, 25, 50, 75, 95), seed=None):
+    """
+    Estimate the distribution of each stock ticker's intrinsic value with Monte Carlo scenarios.
+
+    :param df: DataFrame containing a single row of valuation inputs for each stock ticker
+    :param projection_window: Number of years into the future we should generate projections for
+    :param distributions: Dictionary of scenario parameter distributions, see sample_scenarios
+    :param n_scenarios: Number of scenarios to draw
+    :param long_term_growth_estimates: Optional dictionary of per-ticker growth estimates
+    :param percentiles: Percentiles of intrinsic value to report
+    :param seed: Optional seed for reproducible draws
+    :return: DataFrame containing 'symbol', 'stockPrice', one 'Intrinsic Value PX' column per
+             percentile and 'Buy Probability', the share of scenarios where the margin of safety
+             value exceeds the stock price
+    :rtype: pandas.DataFrame
+    """
+    scenarios = sample_scenarios(n_scenarios, distributions, seed)
+
+    df, inputs = _valuation_arrays(df, long_term_growth_estimates)
+
+    value_percentiles = np.empty((len(df), len(percentiles)))
+    buy_probability = np.empty(len(df))
+
+    for rows in _row_blocks(len(df), n_scenarios):
+        intrinsic_value, margin_of_safety_value = _evaluate(inputs, rows, scenarios,
+                                                            projection_window)
+
+        value_percentiles[rows] = np.nanpercentile(intrinsic_value, percentiles, axis=1).T
+        buy_probability[rows] = (margin_of_safety_value > inputs['stockPrice'][rows]).mean(axis=1)
+
+    results = df[['symbol', 'stockPrice']].copy()
+
+    for i, percentile in enumerate(percentiles):
+        results['Intrinsic Value P' + str(percentile)] = value_percentiles[:, i]
+
+    results['Buy Probability'] = buy_probability
+
+    return results